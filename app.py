@@ -1,40 +1,331 @@
+import hashlib
+import json
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
 import streamlit as st
-import sys
-import io
 import pandas as pd
-import altair as alt
-from main import get_ortools_code, extract_code, get_ortools_code_strict, summarize_result, get_ortools_code_stream
-
-def sanitize_code(code: str) -> str:
-    if ('from ortools.sat.python import cp_model' in code) or ('cp_model.' in code):
-        import re as _re
-        m = _re.search(r"([A-Za-z_][A-Za-z0-9_]*)\s*=\s*cp_model\.CpModel\(\)", code)
-        model_var = m.group(1) if m else 'model'
-        if 'CpSolver' not in code:
-            if m:
-                insert_pos = m.end()
-                code = code[:insert_pos] + "\nsolver = cp_model.CpSolver()" + code[insert_pos:]
-            else:
-                m2 = _re.search(r"from ortools\.sat\.python import cp_model", code)
-                insert_pos = m2.end() if m2 else 0
-                code = code[:insert_pos] + "\nsolver = cp_model.CpSolver()" + code[insert_pos:]
-        code = _re.sub(rf"\b{model_var}\.Solve\(\s*\)", f"solver.Solve({model_var})", code)
-        code = _re.sub(r"\bsolver\.Solve\(\s*\)", f"solver.Solve({model_var})", code)
-        code = code.replace('solver.Objective().Value()', 'solver.ObjectiveValue()')
-        code = code.replace('solver.Objective().value()', 'solver.ObjectiveValue()')
-        code = _re.sub(r"([A-Za-z_][A-Za-z0-9_]*)\.solution_value\(\)", r"solver.Value(\1)", code)
-    return code
-
-def parse_exec_output(text: str):
-    import re
-    obj = None
-    m = re.search(r"Objective\s*value\s*[:=]\s*([-+]?\d*\.?\d+(?:[eE][-+]?\d+)?)", text, re.IGNORECASE)
-    if m:
-        obj = m.group(1)
-    vars = []
-    for name, val in re.findall(r"([A-Za-z_][A-Za-z0-9_]*)\s*=\s*([-+]?\d*\.?\d+(?:[eE][-+]?\d+)?)", text):
-        vars.append({"变量": name, "值": float(val)})
-    return {"objective": obj, "variables": vars}
+from main import get_ortools_code, extract_code, get_ortools_code_strict, get_ortools_code_stream, code_cache, parse_exec_output, run_async, asummarize_result, get_ortools_code_hedged, DEFAULT_HEDGE_DELAY, get_model_ir, validate_ir, get_ortools_code_routed, preflight_code, repair_failed_run, is_repairable, MAX_REPAIR_ATTEMPTS, get_ortools_code_candidates, prepare_candidates, objective_from_output, DEFAULT_CANDIDATES, history, cache_outcome, ir_json
+from consensus import run_candidates
+from result_summary import local_summary
+from executor import get_pool
+from result_view import fragment, render_variables
+from stream_view import StreamRenderer
+from problem_data import DATA_CACHE_DIR, load_dataset, with_datasets
+from solver_config import SolverConfig
+from warm_start import WarmStart, prepare_resolve
+from examples import EXAMPLE_PROBLEMS
+from metrics import Trace, configure as configure_metrics
+
+# Exports (JSON trace log, metrics file / port) come from the ORTOOLS_* environment. Spawned execution
+# workers import this script again as __mp_main__ and must not bind the metrics port a second time.
+if __name__ != "__mp_main__":
+    configure_metrics()
+
+IR_PREVIEW_CHARS = 20000
+# Seconds between redraws of the live convergence chart
+PROGRESS_POLL = 0.2
+# Finished runs kept per session for the history drawer
+HISTORY_LIMIT = 20
+# Stored runs offered by the history store browser
+STORED_HISTORY_LIMIT = 50
+STAGE_LABELS = {"generate": "LLM 生成", "generate_retry": "重试生成", "extract": "代码提取", "preflight": "预检清洗",
+                "execute": "执行", "repair": "定点修复", "parse": "结果解析", "summarize": "结论摘要", "total": "总计"}
+UPLOAD_DIR = os.path.join(DATA_CACHE_DIR, "uploads")
+
+
+def register_uploads(files):
+    """
+    Saves uploaded data files and returns their DatasetRefs. Each file is
+    stored once under the hash of its content (UPLOAD_DIR/<hash>/<name>), so
+    sessions uploading different files of the same name never overwrite a
+    file a running job has mapped. Refs are kept per upload in session state,
+    so reruns neither rewrite nor rehash the files.
+    """
+    known = st.session_state.get("uploads", {})
+    refs = {}
+    for f in files:
+        ref = known.get(f.file_id)
+        if ref is None:
+            data = f.getbuffer()
+            directory = os.path.join(UPLOAD_DIR, hashlib.sha256(data).hexdigest()[:20])
+            path = os.path.join(directory, os.path.basename(f.name))
+            if not os.path.exists(path):
+                os.makedirs(directory, exist_ok=True)
+                tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+                with open(tmp_path, "wb") as out:
+                    out.write(data)
+                os.replace(tmp_path, path)
+            ref = load_dataset(path)
+        refs[f.file_id] = ref
+    st.session_state["uploads"] = refs
+    return list(refs.values())
+
+
+@st.cache_resource(show_spinner=False)
+def execution_pool():
+    """
+    The warmed OR-Tools worker pool, created on the first page load and shared
+    by every session and rerun (the LLM clients are module-level in main).
+    """
+    return get_pool()
+
+
+def render_progress(points, status_slot, chart_slot):
+    """Latest objective / bound / gap of a running solve and their convergence over time."""
+    latest = points[-1]
+    fmt = lambda v: "—" if v is None else f"{v:g}"
+    with status_slot.container():
+        m1, m2, m3, m4 = st.columns(4)
+        m1.metric("当前最优目标值", fmt(latest["objective"]))
+        m2.metric("最优界", fmt(latest["bound"]))
+        m3.metric("相对间隙", "—" if latest["gap"] is None else f"{latest['gap']:.2%}")
+        m4.metric("已找到解", f"{latest['solutions']} 个 · {latest['elapsed']:.1f} s")
+    df = pd.DataFrame([{"时间 (s)": p["elapsed"], "目标值": p["objective"], "最优界": p["bound"]} for p in points])
+    chart_slot.line_chart(df.set_index("时间 (s)").astype(float))
+
+
+def wait_with_progress(job):
+    """
+    Waits for the job's future while drawing the intermediate solutions and
+    bounds the worker streams back. The stop button interrupts the solver,
+    which then returns its best solution so far.
+    """
+    future = job["future"]
+    stop_slot = st.empty()
+    if not future.done():
+        stop_slot.button("⏹️ 停止并保留当前最优解", key="stop_solve", on_click=execution_pool().stop, args=(future,))
+    status_slot, chart_slot = st.empty(), st.empty()
+    drawn = 0
+    while True:
+        done = future.done()
+        while True:
+            try:
+                job["points"].append(job["progress"].get_nowait())
+            except queue.Empty:
+                break
+        if len(job["points"]) > drawn:
+            drawn = len(job["points"])
+            render_progress(job["points"], status_slot, chart_slot)
+        if done:
+            break
+        time.sleep(PROGRESS_POLL)
+    stop_slot.empty()
+    return future.result()
+
+
+def render_model(run):
+    if run["ir_text"] is not None:
+        st.subheader("💻 数学模型 (JSON 模型描述)")
+        st.code(run["ir_text"], language="json")
+    else:
+        st.subheader("💻 数学模型 (Python代码)")
+        st.code(run["code"], language="python")
+    st.subheader("📊 计算结果分析")
+
+
+@fragment
+def render_result_panels(run):
+    """Solver metrics, variables and the raw log of a finished run; widgets here rerun only this fragment."""
+    if run["metrics"]:
+        for column, (label, value) in zip(st.columns(len(run["metrics"])), run["metrics"]):
+            column.metric(label, value)
+    # Display Variables Table & Chart (aggregated automatically for large models)
+    if run["variables"] is not None and len(run["variables"]):
+        render_variables(run["variables"], key=f"vars_{run['id']}")
+        st.download_button("⬇️ 下载变量结果 (CSV)", run["variables"].to_csv(index=False).encode("utf-8-sig"),
+                           file_name=f"run_{run['id']}_variables.csv", mime="text/csv",
+                           key=f"download_{run['id']}", on_click="ignore")
+    with st.expander("查看原始输出日志"):
+        st.text(run["stdout"])
+
+
+@fragment
+def llm_summary_panel(run):
+    """The LLM reading of a result, requested on demand; clicking reruns only this panel."""
+    if run["llm_summary"] is not None:
+        st.markdown(run["llm_summary"])
+        return
+    if not st.button("🧠 生成 LLM 解读", key=f"llm_summary_{run['id']}"):
+        return
+    placeholder = st.empty()
+    placeholder.info("正在生成 LLM 解读...")
+    chunks = queue.Queue()
+    future = run_async(asummarize_result(run["problem"], run["stdout"], run["model_id"], on_content=chunks.put))
+    text = ""
+    while not (future.done() and chunks.empty()):
+        try:
+            text += chunks.get(timeout=0.1)
+        except queue.Empty:
+            continue
+        placeholder.markdown(text)
+    try:
+        run["llm_summary"] = future.result()
+    except Exception as e:
+        placeholder.warning(f"LLM 解读生成失败：{e}")
+        return
+    placeholder.markdown(run["llm_summary"])
+    if run.get("store_id"):
+        history.update(run["store_id"], llm_summary=run["llm_summary"])
+
+
+def render_outcome(run):
+    """Everything below the model of a finished run."""
+    report = run["consensus"]
+    if report is not None:
+        (st.success if report["unanimous"] else st.warning)(f"🗳️ 多候选共识：{report['summary']}")
+        with st.expander("候选程序对比"):
+            st.dataframe(pd.DataFrame(report["rows"]), hide_index=True, use_container_width=True)
+    if run["status"] != "ok":
+        st.error(f"❌ 运行时错误：{run['error']}")
+        st.text(run["stdout"])
+        return
+    if run["stopped"]:
+        st.info("⏹️ 已提前停止求解：以下为停止时找到的最优解，尚未证明最优。")
+    if run["warm"]:
+        st.caption(f"⚡ 增量求解：复用上次的模型代码并热启动，执行耗时 {run['elapsed'] * 1000:.0f} ms")
+    st.markdown("##### 🧠 结论摘要")
+    st.info(run["summary"])
+    llm_summary_panel(run)
+    render_result_panels(run)
+
+
+def render_run(run):
+    """Re-renders a stored run from session state; nothing is recomputed."""
+    render_model(run)
+    if run["points"]:
+        render_progress(run["points"], st.empty(), st.empty())
+    render_outcome(run)
+
+
+def save_run(run):
+    history = st.session_state.setdefault("runs", [])
+    history.append(run)
+    del history[:-HISTORY_LIMIT]
+    st.session_state["view_run"] = run["id"]
+
+
+def ir_preview(ir):
+    if ir is None:
+        return None
+    ir_text = json.dumps(ir, ensure_ascii=False, indent=1)
+    return ir_text[:IR_PREVIEW_CHARS] + ("\n..." if len(ir_text) > IR_PREVIEW_CHARS else "")
+
+
+def describe_result(exec_result):
+    """
+    (metrics, variables, parsed) of a successful run: read from the solver
+    objects when the executor could, otherwise scraped from stdout (parsed).
+    """
+    solve = exec_result.solve
+    if solve is not None:
+        metrics = [
+            ("求解状态", solve.status),
+            ("最优目标值 (Objective Value)", "—" if solve.objective is None else f"{solve.objective:g}"),
+            ("最优界 (Best Bound)", "—" if solve.best_bound is None else f"{solve.best_bound:g}"),
+            ("求解耗时", "—" if solve.wall_time is None else f"{solve.wall_time:.3f} s"),
+        ]
+        return metrics, solve.to_frame() if solve.has_solution else None, None
+    parsed = parse_exec_output(exec_result.stdout)
+    metrics = [("最优目标值 (Objective Value)", parsed["objective"])] if parsed["objective"] else []
+    return metrics, pd.DataFrame(parsed["variables"]) if parsed["variables"] else None, parsed
+
+
+def load_stored_run(store_id):
+    """A run of the history store (any session, the CLI or batch) as a run dict; nothing is re-executed."""
+    record = history.get(store_id)
+    result = history.load_result(store_id)
+    metrics, variables, parsed = describe_result(result) if result.ok else ([], None, None)
+    summary = record.summary
+    if summary is None and result.ok:
+        summary = local_summary(result.solve, parsed, result.stopped)
+    extra = record.extra
+    run_id = st.session_state["run_seq"] = st.session_state.get("run_seq", 0) + 1
+    return {"id": run_id, "store_id": store_id, "time": record.created,
+            "problem": record.problem, "model_id": record.model_id, "reasoning": extra.get("reasoning", ""),
+            "code": record.code, "ir_text": ir_preview(record.ir), "warm": extra.get("warm", False),
+            "consensus": extra.get("consensus"), "status": record.status, "error": record.error,
+            "stdout": result.stdout, "stopped": result.stopped, "elapsed": result.elapsed,
+            "points": extra.get("points", []), "metrics": metrics, "variables": variables,
+            "summary": summary,
+            "llm_summary": extra.get("llm_summary"), "trace": record.trace or {"stages": {}}}
+
+
+def record_run(run, job):
+    """Writes a finished run to the history store; the session keeps its id for later updates."""
+    try:
+        run["store_id"] = history.record(
+            run["problem"], run["model_id"], run["status"], job.get("result"), source='app', code=run["code"],
+            ir=job["ir"], summary=run["summary"], trace=run["trace"], reasoning=run["reasoning"],
+            consensus=run["consensus"], points=run["points"], warm=run["warm"])
+    except Exception as e:
+        st.toast(f"运行记录保存失败：{e}")
+
+
+def show_job(job):
+    """
+    Renders a submitted solve: the model, live progress while it runs, targeted
+    repairs of failed runs, then the result and the summary. Returns the run's
+    artefacts, which are kept in session state and re-rendered on later reruns.
+    """
+    trace = job["trace"]
+    ir = job["ir"]
+    run = {"id": job["id"], "time": time.time(), "problem": job["problem"], "model_id": job["model_id"],
+           "reasoning": job["reasoning"], "code": job["code"], "ir_text": ir_preview(ir), "warm": job["warm"],
+           "consensus": job["consensus"]}
+    render_model(run)
+
+    with trace.stage("execute"):
+        exec_result = wait_with_progress(job)
+    while ir is None and is_repairable(exec_result) and job["repairs"] < MAX_REPAIR_ATTEMPTS:
+        st.warning(f"运行出错，正在请求模型修复出错片段（第 {job['repairs'] + 1} 次）：{exec_result.error}")
+        with trace.stage("repair"):
+            repaired = repair_failed_run(job["code"], exec_result, job["model_id"])
+        job["repairs"] += 1
+        if not repaired:
+            break
+        job["code"] = run["code"] = repaired
+        with st.expander("🔧 修复后的代码"):
+            st.code(repaired, language="python")
+        job["points"] = []
+        job["future"] = execution_pool().submit(repaired, datasets=job["datasets"], solver_config=job["solver_config"],
+                                          hint=job["hint"], on_progress=job["progress"].put)
+        with trace.stage("execute"):
+            exec_result = wait_with_progress(job)
+    trace.record_result(exec_result)
+    # Only programs that ran cleanly are cached (with their repairs); a cached one that failed is dropped
+    cache_outcome(job["llm_output"], exec_result.ok, ir_json(ir) if ir is not None else job["code"])
+    job["result"] = exec_result
+    result_output = exec_result.stdout
+    run.update(status="ok" if exec_result.ok else "timeout" if exec_result.timed_out else "exec_error",
+               error=exec_result.error, stdout=result_output, stopped=exec_result.stopped,
+               elapsed=exec_result.elapsed, points=job["points"], metrics=[], variables=None,
+               summary=None, llm_summary=None)
+    if not exec_result.ok:
+        render_outcome(run)
+        return run
+
+    # Structured result read from the solver objects; fall back to scraping stdout
+    solve = exec_result.solve
+    with trace.stage("parse"):
+        run["metrics"], run["variables"], parsed = describe_result(exec_result)
+    if ir is None:
+        has_values = solve is not None and solve.has_solution
+        st.session_state["warm_start"] = WarmStart(
+            job["problem"], job["code"],
+            list(solve.names) if has_values else [],
+            [float(v) for v in solve.values] if has_values else [],
+            job["dataset_key"],
+        )
+
+    # Template conclusion from the structured result; the LLM reading is on demand
+    with trace.stage("summarize"):
+        run["summary"] = local_summary(solve, parsed, exec_result.stopped)
+    render_outcome(run)
+    return run
+
 
 # --- 现代化灵动风格 CSS ---
 st.set_page_config(page_title="AI+OR-Tools 优化求解器", layout="wide", page_icon="✨")
@@ -188,16 +479,37 @@ model_options = {
 }
 selected_model_label = st.sidebar.selectbox("选择推理模型：", list(model_options.keys()))
 selected_model_id = model_options[selected_model_label]
+generation_mode = st.sidebar.radio("生成模式：", ["Python 代码", "紧凑模型描述 (JSON IR)"],
+                                   help="JSON IR 模式下 LLM 只输出变量块与系数，由本地批量构建模型，适合大规模 LP/MIP。")
+use_ir = generation_mode != "Python 代码"
+auto_route = not use_ir and st.sidebar.checkbox("🧭 自动路由", value=False,
+                                    help="本地识别问题类型（LP/MIP/CP/指派背包），只发送对应的精简提示词；简单问题改用快速模型并关闭思考（速度更快，但准确性低于所选模型），其余使用所选模型。")
+hedge_enabled = not use_ir and st.sidebar.checkbox("⚡ 对冲生成", value=False,
+                                    help="延迟若干秒或首次生成失败时，并行发起精简提示词请求，取最先得到可运行代码的结果。")
+if hedge_enabled:
+    hedge_delay = st.sidebar.slider("对冲延迟（秒）", 0, 60, int(DEFAULT_HEDGE_DELAY))
+    hedge_model_label = st.sidebar.selectbox("对冲模型：", list(model_options.keys()), index=len(model_options) - 1)
+    hedge_model_id = model_options[hedge_model_label]
+consensus_enabled = not use_ir and st.sidebar.checkbox("🗳️ 多候选共识", value=False,
+                                    help="并行生成多个候选程序并同时执行，按求解状态与目标值投票选出结果，并报告候选之间的分歧。")
+if consensus_enabled:
+    consensus_n = st.sidebar.slider("候选程序数", 2, 5, DEFAULT_CANDIDATES)
+with st.sidebar.expander("🧮 求解器设置"):
+    solver_threads = st.number_input("求解线程数（0 为默认）", 0, os.cpu_count() or 64, 0,
+                                     help="CP-SAT 搜索线程数；SCIP 等 MIP 求解器的线程数。")
+    solver_time_limit = st.number_input("单次求解时间上限（秒，0 为不限）", 0, 3600, 0)
+    solver_gap = st.number_input("相对最优间隙（0 为求证最优）", 0.0, 1.0, 0.0, step=0.01, format="%.3f")
+    solver_portfolio = st.checkbox("多求解器竞速", value=False,
+                                   help="对 pywraplp 模型并行运行 GLOP/PDLP/SCIP/CP-SAT，取最先证明最优的结果。")
+solver_config = SolverConfig(num_workers=solver_threads or None, time_limit=solver_time_limit or None,
+                             relative_gap=solver_gap or None, portfolio=solver_portfolio)
+cache_stats = code_cache.stats()
+st.sidebar.caption(f"🗂️ 代码缓存：命中 {cache_stats['hits']} 次 · 未命中 {cache_stats['misses']} 次 · 共 {cache_stats['entries']} 条")
+show_trace = st.sidebar.checkbox("⏱️ 显示阶段耗时", value=False, help="在侧边栏显示本次运行各阶段耗时、首 token 时间与生成速度。")
 
 st.sidebar.markdown("---")
 st.sidebar.header("📚 案例库")
-example_options = {
-    "自定义输入": "",
-    "生产计划 (线性规划)": "最大化 3x + 4y，约束：x + 2y <= 14，3x - y >= 0，x - y <= 2，x >= 0，y >= 0。",
-    "资源分配 (背包问题)": "有 4 个物品，重量 [2, 3, 4, 5]，价值 [3, 4, 5, 6]，背包容量 5，选择哪些物品使总价值最大？",
-    "人员调度 (指派问题)": "把 3 位工人分配到 3 个任务。成本矩阵：[[90, 80, 75], [35, 85, 55], [125, 95, 90]]，使总成本最小。",
-    "逻辑推理 (三位数谜题)": "在 1 到 9 之间找三个互不相同的数字 X、Y、Z，使得 X + Y = Z，并且 Z 最大。"
-}
+example_options = {"自定义输入": "", **EXAMPLE_PROBLEMS}
 
 selected_example = st.sidebar.radio("加载标准案例：", list(example_options.keys()))
 
@@ -206,6 +518,11 @@ if selected_example == "自定义输入":
 else:
     default_text = example_options[selected_example]
 
+# Spawns the execution workers while the problem is being typed. Streamlit installs this script as
+# __main__, so spawned workers import it again as __mp_main__; they must not start a pool of their own.
+if __name__ != "__mp_main__":
+    execution_pool()
+
 # 主界面布局
 col1, col2 = st.columns([1, 1])
 
@@ -217,6 +534,20 @@ with col1:
         height=300,
         help="请尽可能清晰地描述目标函数、决策变量及约束条件。"
     )
+
+    data_files = st.file_uploader(
+        "附加数据文件（可选）：", type=["csv", "parquet", "npy"], accept_multiple_files=True,
+        help="数据不会发送给 LLM，只把名称、形状与列名写入提示词；执行时以同名只读 NumPy 数组注入代码。",
+    )
+    datasets = []
+    if data_files:
+        try:
+            datasets = register_uploads(data_files)
+        except (OSError, ValueError) as e:
+            st.error(f"数据文件读取失败：{e}")
+        for ref in datasets:
+            columns = f"，列：{', '.join(ref.columns[:10])}{' ...' if len(ref.columns) > 10 else ''}" if ref.columns else ""
+            st.caption(f"📎 `{ref.name}` · shape={ref.shape} · {ref.dtype}{columns}")
     
     solve_btn = st.button("🚀 开始计算求解", type="primary", use_container_width=True)
 
@@ -224,106 +555,287 @@ if solve_btn:
     if not problem_description.strip():
         st.warning("⚠️ 请先输入问题描述。")
     else:
+        # A new request replaces a solve still running from the previous one
+        stale = st.session_state.pop("active_job", None)
+        if stale is not None:
+            execution_pool().stop(stale["future"])
+            stale["trace"].finish("cancelled")
+        trace = Trace("app", model=selected_model_id)
+        run_status = "no_code"
         with st.spinner("⏳ 正在构建数学模型并求解..."):
             try:
                 # 1. Stream Generate Code with realtime thinking output（置于左栏，默认展开）
                 thinking_container = col1.expander("👁️ 查看推理过程 (Thinking Process)", expanded=True)
-                reasoning_placeholder = thinking_container.empty()
-                if 'thinking_buf' not in st.session_state:
-                    st.session_state['thinking_buf'] = ""
-                st.session_state['thinking_buf'] = "正在思考...\n\n"
-
-                def on_reasoning(chunk: str):
-                    st.session_state['thinking_buf'] += chunk
-                    reasoning_placeholder.text(st.session_state['thinking_buf'])
+                # Chunks are coalesced into at most 10 frames/s of a bounded tail window
+                reasoning_view = StreamRenderer(thinking_container, intro="正在思考...")
+                content_view = StreamRenderer(thinking_container, title="📄 模型输出")
 
                 def on_content(chunk: str):
-                    # optionally show partial final answer in expander as well
-                    pass
-
-                llm_output = get_ortools_code_stream(
-                    problem_description,
-                    selected_model_id,
-                    on_reasoning=on_reasoning,
-                    on_content=on_content,
-                )
-
-                # 2. Extract Code
-                code = extract_code(llm_output)
+                    # Reasoning is over once the answer starts; draw its last frame
+                    reasoning_view.flush()
+                    content_view.write(chunk)
+
+                on_reasoning, on_content = trace.stream(reasoning_view.write, on_content)
+
+                # The LLM only sees the schema of attached data; the arrays are injected at execution
+                llm_problem = with_datasets(problem_description, datasets)
+                if use_ir and datasets:
+                    col1.warning("JSON 模型描述模式不支持附加数据，已改用 Python 代码模式。")
+                    use_ir = False
+
+                # A numbers-only edit of the last solved problem reuses its code: no LLM round trip,
+                # and the previous solution is passed to the solver as a hint
+                warm = st.session_state.get("warm_start")
+                dataset_key = tuple((ref.name, ref.path) for ref in datasets)
+                warm_code = None if use_ir else prepare_resolve(warm, problem_description, dataset_key)
+                hint = warm.hint if warm_code else None
+
+                ir = None
+                outputs = None
+                with trace.stage("generate"):
+                    if warm_code:
+                        llm_output = ""
+                        reasoning_view.show("仅数值发生变化：已直接修改上次生成代码中的常数，并以上次的解作为初始解求解（未调用 LLM）。")
+                    elif use_ir:
+                        ir, llm_output = get_model_ir(
+                            problem_description,
+                            selected_model_id,
+                            on_reasoning=on_reasoning,
+                            on_content=on_content,
+                        )
+                    elif consensus_enabled:
+                        # Only the first candidate streams; all of them are requested at once
+                        outputs = get_ortools_code_candidates(
+                            llm_problem,
+                            selected_model_id,
+                            consensus_n,
+                            on_reasoning=on_reasoning,
+                            on_content=on_content,
+                        )
+                        llm_output = outputs[0]
+                    elif hedge_enabled:
+                        llm_output, _ = get_ortools_code_hedged(
+                            llm_problem,
+                            selected_model_id,
+                            on_reasoning=on_reasoning,
+                            on_content=on_content,
+                            hedge_delay=hedge_delay,
+                            hedge_model_id=hedge_model_id,
+                        )
+                    elif auto_route:
+                        llm_output, route = get_ortools_code_routed(
+                            llm_problem,
+                            selected_model_id,
+                            on_reasoning=on_reasoning,
+                            on_content=on_content,
+                            has_data=bool(datasets),
+                        )
+                        thinking_container.caption(
+                            f"🧭 问题类型：{route.label} · 模型：{route.model_id}"
+                            f"{' · 思考已关闭' if not route.enable_thinking else ''}"
+                            f"{' · 快速模型未生成可用代码，已改用所选模型' if route.escalated else ''}"
+                        )
+                    else:
+                        llm_output = get_ortools_code_stream(
+                            llm_problem,
+                            selected_model_id,
+                            on_reasoning=on_reasoning,
+                            on_content=on_content,
+                        )
+
+                reasoning_view.close()
+                content_view.close()
+
+                # 2. Extract Code (or validate the JSON IR)
+                with trace.stage("extract"):
+                    code = None if use_ir or warm_code else extract_code(llm_output)
                 final_code = None
+                consensus = None
+                # The output final_code (or the IR) came from, reported to the code cache after the run
+                source_output = None if warm_code else llm_output
                 
-                if code:
-                    final_code = sanitize_code(code)
+                if warm_code:
+                    final_code = warm_code
+                elif use_ir:
+                    with trace.stage("extract"):
+                        ir_errors = validate_ir(ir) if ir is not None else ["未找到 JSON 模型描述"]
+                    if ir_errors:
+                        ir = None
+                        with thinking_container:
+                            st.error("模型描述校验失败：\n\n" + "\n".join(f"- {e}" for e in ir_errors))
+                            st.text(llm_output)
+                elif outputs is not None:
+                    # Every candidate runs at once in the worker pool; the vote picks the program shown
+                    with trace.stage("preflight"):
+                        codes = prepare_candidates(outputs, [ref.name for ref in datasets])
+                    if any(codes):
+                        with trace.stage("execute"):
+                            consensus = run_candidates(execution_pool(), codes, objective_of=objective_from_output,
+                                                       datasets=datasets, solver_config=solver_config)
+                        thinking_container.caption(f"🗳️ {consensus.describe()}")
+                        # Without a clean run the first candidate goes on to the repair loop
+                        chosen = consensus.winner or next(c for c in consensus.candidates if c.code)
+                        final_code = chosen.code
+                        source_output = outputs[chosen.index]
+                    else:
+                        with thinking_container:
+                            st.error("所有候选响应均未包含有效代码。")
+                            st.text(llm_output)
+                elif code:
+                    final_code = code
+                elif hedge_enabled:
+                    # Both prompts already raced; another strict round would not add anything
+                    with thinking_container:
+                        st.error("对冲生成的两路请求均未生成有效代码。")
+                        st.text(llm_output)
                 else:
                     # Retry logic
-                    llm_output_retry = get_ortools_code_strict(problem_description, selected_model_id)
-                    code_retry = extract_code(llm_output_retry)
+                    with trace.stage("generate_retry"):
+                        llm_output_retry = get_ortools_code_strict(llm_problem, selected_model_id)
+                    with trace.stage("extract"):
+                        code_retry = extract_code(llm_output_retry)
                     if code_retry:
-                        final_code = sanitize_code(code_retry)
+                        final_code = code_retry
+                        source_output = llm_output_retry
                     if not final_code:
                         with thinking_container:
                             st.error("首次生成失败，已尝试重试但仍未生成有效代码。")
                             st.text(llm_output_retry)
 
-                # Execute and Show Results in Column 2
-                with col2:
-                    if final_code:
-                        st.subheader("💻 数学模型 (Python代码)")
-                        st.code(final_code, language="python")
-                        
-                        st.subheader("📊 计算结果分析")
-                        
-                        # Execute
-                        exec_output = io.StringIO()
-                        original_stdout = sys.stdout
-                        sys.stdout = exec_output
-                        try:
-                            exec_globals = {}
-                            exec(final_code, exec_globals)
-                            result_output = exec_output.getvalue()
-                            
-                            # Parse structured result
-                            parsed = parse_exec_output(result_output)
-                            
-                            # Display Summary
-                            st.markdown("##### 🧠 结论摘要")
-                            summary = summarize_result(problem_description, result_output, selected_model_id)
-                            st.info(summary)
-                            
-                            # Display Metrics
-                            if parsed["objective"]:
-                                st.metric("最优目标值 (Objective Value)", parsed["objective"])
-                            
-                            # Display Variables Table & Chart
-                            if parsed["variables"]:
-                                df_vars = pd.DataFrame(parsed["variables"])
-                                
-                                tab1, tab2 = st.tabs(["📋 变量数据表", "📈 变量分布图"])
-                                with tab1:
-                                    st.dataframe(df_vars, use_container_width=True, hide_index=True)
-                                with tab2:
-                                    # Scientific Chart using Altair
-                                    chart = alt.Chart(df_vars).mark_bar().encode(
-                                        x=alt.X('变量', sort=None, title='决策变量'),
-                                        y=alt.Y('值', title='数值结果'),
-                                        color=alt.Color('变量', legend=None),
-                                        tooltip=['变量', '值']
-                                    ).properties(
-                                        title='决策变量结果分布'
-                                    ).interactive()
-                                    st.altair_chart(chart, use_container_width=True)
-                            
-                            with st.expander("查看原始输出日志"):
-                                st.text(result_output)
-                                
-                        except Exception as e:
-                            st.error(f"❌ 运行时错误：{e}")
-                            st.text(exec_output.getvalue())
-                        finally:
-                            sys.stdout = original_stdout
+                # Deterministic AST fixes, then targeted repairs of what they cannot fix
+                repairs = 0
+                if final_code and not warm_code and consensus is None:
+                    with trace.stage("preflight"):
+                        final_code, analysis, repairs = preflight_code(final_code, selected_model_id,
+                                                                       [ref.name for ref in datasets])
+                    if repairs:
+                        thinking_container.caption(f"🔧 预检发现问题，已请求模型定点修复 {repairs} 次。")
+                    for issue in analysis.issues:
+                        thinking_container.warning(f"预检提示：{issue.message}")
+
+                # Execute in the shared worker pool (isolated stdout, time & memory limits). The job is
+                # kept in session state and rendered below, so a rerun (e.g. the stop button) resumes it.
+                if final_code or ir is not None:
+                    progress = queue.Queue()
+                    if consensus is not None:
+                        # Already executed with the other candidates
+                        exec_job = Future()
+                        exec_job.set_result(chosen.result)
+                    elif ir is not None:
+                        exec_job = execution_pool().submit_ir(ir, solver_config=solver_config, on_progress=progress.put)
                     else:
+                        exec_job = execution_pool().submit(final_code, datasets=datasets, solver_config=solver_config,
+                                                     hint=hint, on_progress=progress.put)
+                    run_id = st.session_state["run_seq"] = st.session_state.get("run_seq", 0) + 1
+                    st.session_state["active_job"] = {
+                        "id": run_id, "reasoning": reasoning_view.text(),
+                        "future": exec_job, "progress": progress, "points": [], "trace": trace,
+                        "code": final_code, "ir": ir, "llm_output": source_output, "datasets": datasets, "hint": hint, "repairs": repairs,
+                        "problem": problem_description, "model_id": selected_model_id,
+                        "solver_config": solver_config, "warm": bool(warm_code), "dataset_key": dataset_key,
+                        "consensus": consensus.to_dict() if consensus is not None else None,
+                    }
+                else:
+                    with col2:
                         st.error("❌ 未能生成有效的数学模型代码，请检查问题描述是否清晰。")
 
             except Exception as e:
-                sys.stdout = original_stdout
+                run_status = "error"
                 st.error(f"发生系统错误：{e}")
+        if "active_job" not in st.session_state:
+            st.session_state["last_trace"] = trace.finish(run_status)
+
+active_job = st.session_state.get("active_job")
+if active_job is not None:
+    run = None
+    with col2, st.spinner("⏳ 正在求解..."):
+        try:
+            run = show_job(active_job)
+        except Exception as e:
+            st.error(f"发生系统错误：{e}")
+    del st.session_state["active_job"]
+    st.session_state["last_trace"] = active_job["trace"].finish(run["status"] if run else "error")
+    if run is not None:
+        run["trace"] = st.session_state["last_trace"]
+        record_run(run, active_job)
+        save_run(run)
+elif not solve_btn:
+    # Any other rerun (widgets, sidebar, history) redraws the stored run instead of losing it
+    runs = {r["id"]: r for r in st.session_state.get("runs", [])}
+    view = runs.get(st.session_state.get("view_run"))
+    if view is not None:
+        with col1.expander("👁️ 查看推理过程 (Thinking Process)", expanded=False):
+            st.text(view["reasoning"])
+        with col2:
+            render_run(view)
+
+
+@fragment
+def history_drawer():
+    """Past runs of this session; browsing them reruns only this drawer."""
+    runs = st.session_state.get("runs", [])
+    if not runs:
+        st.caption("暂无求解记录。")
+        return
+    labels = {r["id"]: f"#{r['id']} {time.strftime('%H:%M:%S', time.localtime(r['time']))} · "
+                       f"{r['problem'][:16].strip()}{'…' if len(r['problem']) > 16 else ''}" for r in runs}
+    picked = st.selectbox("选择记录：", list(reversed(labels)), format_func=labels.get, key="history_pick")
+    run = next(r for r in runs if r["id"] == picked)
+    objective = next((v for k, v in run["metrics"] if k.startswith("最优目标值")), "—") if run["status"] == "ok" else "—"
+    st.caption(f"状态 {run['status']} · 目标值 {objective} · 总耗时 {run['trace']['stages'].get('total', 0):.2f} s")
+    if run["summary"]:
+        st.caption(run["summary"][:200])
+    if st.button("在结果区查看", key="history_show", disabled=picked == st.session_state.get("view_run")):
+        st.session_state["view_run"] = picked
+        st.rerun()
+
+
+@fragment
+def stored_history():
+    """Runs in the history store (any session, the CLI, batch); loading one re-serves it without a solve."""
+    only_current = st.checkbox("仅显示当前问题", key="stored_only_current")
+    problem = problem_description if only_current and problem_description.strip() else None
+    # Runs that never reached the solver have nothing to show
+    records = [r for r in history.find(problem=problem, limit=STORED_HISTORY_LIMIT) if r.elapsed is not None]
+    if not records:
+        st.caption("历史库中暂无记录。")
+        return
+    labels = {r.id: f"{time.strftime('%m-%d %H:%M', time.localtime(r.created))} · {r.source} · {r.status} · "
+                    f"{r.problem[:16].strip()}{'…' if len(r.problem) > 16 else ''}" for r in records}
+    picked = st.selectbox("选择运行：", list(labels), format_func=labels.get, key="stored_pick")
+    record = next(r for r in records if r.id == picked)
+    objective = "—" if record.objective is None else f"{record.objective:g}"
+    st.caption(f"模型 {record.model_id} · 目标值 {objective} · 变量 {record.num_variables} 个")
+    if st.button("载入结果", key="stored_load"):
+        save_run(load_stored_run(picked))
+        st.rerun()
+
+
+with st.sidebar.expander("🕘 历史记录"):
+    history_drawer()
+with st.sidebar.expander("🗄️ 历史库"):
+    stored_history()
+
+# Per-stage breakdown of the run on display
+runs = {r["id"]: r for r in st.session_state.get("runs", [])}
+view = runs.get(st.session_state.get("view_run"))
+last_trace = view["trace"] if view is not None and not solve_btn else st.session_state.get("last_trace")
+if show_trace and last_trace:
+    with st.sidebar.expander("⏱️ 运行阶段耗时", expanded=True):
+        stages = last_trace["stages"]
+        df_stages = pd.DataFrame(
+            [{"阶段": STAGE_LABELS.get(k, k), "耗时 (s)": round(v, 3)} for k, v in stages.items()
+             if k in STAGE_LABELS and k != "total"]
+        )
+        if len(df_stages):
+            st.dataframe(df_stages, hide_index=True, use_container_width=True)
+        st.caption(f"总耗时 {stages.get('total', 0):.2f} s · 状态 {last_trace['status']}")
+        generation = last_trace["generation"]
+        if generation and generation["ttft"] is not None:
+            rate = lambda r: "—" if r is None else f"{r:.1f} token/s"
+            st.caption(f"首 token {generation['ttft']:.2f} s · 推理 {generation['reasoning_tokens']} token（{rate(generation['reasoning_tokens_per_s'])}）"
+                       f" · 输出 {generation['content_tokens']} token（{rate(generation['content_tokens_per_s'])}）")
+        solver = last_trace["solver"]
+        if solver:
+            wall = "—" if solver["wall_time"] is None else f"{solver['wall_time']:.3f} s"
+            st.caption(f"求解器 {solver['backend']} · {solver['status']} · 求解耗时 {wall}")
@@ -0,0 +1,6 @@
+"""
+Offline end-to-end benchmark: a replaying OpenAI-compatible stub server
+(stub_server), a corpus of example and generated problems (corpus) and a
+runner that times every pipeline stage and compares against a baseline
+(runner). Run with `python -m bench.runner`.
+"""
@@ -0,0 +1,168 @@
+"""
+Benchmark corpus. Every item carries the problem text and a reference
+program; the stub server replays the reference program as the LLM's answer,
+so the extract, sanitize and solve stages see realistic code.
+
+Specs on the command line: `examples`, `knapsack:N`, `assignment:N`,
+`scheduling:JOBSxMACHINES`, optionally followed by `*COUNT` for several
+seeded instances (e.g. `knapsack:200*3`).
+"""
+import random
+
+from examples import EXAMPLE_PROBLEMS
+
+_EXAMPLE_CODE = {
+    "生产计划 (线性规划)": '''from ortools.linear_solver import pywraplp
+
+solver = pywraplp.Solver.CreateSolver('GLOP')
+x = solver.NumVar(0, solver.infinity(), 'x')
+y = solver.NumVar(0, solver.infinity(), 'y')
+solver.Add(x + 2 * y <= 14)
+solver.Add(3 * x - y >= 0)
+solver.Add(x - y <= 2)
+solver.Maximize(3 * x + 4 * y)
+status = solver.Solve()
+if status == pywraplp.Solver.OPTIMAL:
+    print('Objective value =', solver.Objective().Value())
+    print('x =', x.solution_value())
+    print('y =', y.solution_value())
+''',
+    "资源分配 (背包问题)": '''from ortools.linear_solver import pywraplp
+
+weights = [2, 3, 4, 5]
+values = [3, 4, 5, 6]
+capacity = 5
+solver = pywraplp.Solver.CreateSolver('SCIP')
+x = [solver.BoolVar(f'x_{i}') for i in range(len(weights))]
+solver.Add(sum(weights[i] * x[i] for i in range(len(weights))) <= capacity)
+solver.Maximize(sum(values[i] * x[i] for i in range(len(values))))
+status = solver.Solve()
+if status == pywraplp.Solver.OPTIMAL:
+    print('Objective value =', solver.Objective().Value())
+    for i in range(len(weights)):
+        print(f'x_{i} =', x[i].solution_value())
+''',
+    "人员调度 (指派问题)": '''from ortools.linear_solver import pywraplp
+
+costs = [[90, 80, 75], [35, 85, 55], [125, 95, 90]]
+n = len(costs)
+solver = pywraplp.Solver.CreateSolver('SCIP')
+x = [[solver.BoolVar(f'x_{i}_{j}') for j in range(n)] for i in range(n)]
+for i in range(n):
+    solver.Add(sum(x[i][j] for j in range(n)) <= 1)
+for j in range(n):
+    solver.Add(sum(x[i][j] for i in range(n)) == 1)
+solver.Minimize(sum(costs[i][j] * x[i][j] for i in range(n) for j in range(n)))
+status = solver.Solve()
+if status == pywraplp.Solver.OPTIMAL:
+    print('Objective value =', solver.Objective().Value())
+    for i in range(n):
+        for j in range(n):
+            print(f'x_{i}_{j} =', x[i][j].solution_value())
+''',
+    "逻辑推理 (三位数谜题)": '''from ortools.sat.python import cp_model
+
+model = cp_model.CpModel()
+x = model.NewIntVar(1, 9, 'X')
+y = model.NewIntVar(1, 9, 'Y')
+z = model.NewIntVar(1, 9, 'Z')
+model.AddAllDifferent([x, y, z])
+model.Add(x + y == z)
+model.Maximize(z)
+solver = cp_model.CpSolver()
+status = solver.Solve(model)
+if status in (cp_model.OPTIMAL, cp_model.FEASIBLE):
+    print('Objective value =', solver.ObjectiveValue())
+    print('X =', solver.Value(x))
+    print('Y =', solver.Value(y))
+    print('Z =', solver.Value(z))
+''',
+}
+
+
+def example_items():
+    return [{"id": f"example-{i}", "kind": "example", "problem": problem, "code": _EXAMPLE_CODE[name]}
+            for i, (name, problem) in enumerate(EXAMPLE_PROBLEMS.items())]
+
+
+def knapsack_item(n, seed=0):
+    rng = random.Random(seed)
+    weights = [rng.randint(1, 50) for _ in range(n)]
+    values = [rng.randint(1, 100) for _ in range(n)]
+    capacity = sum(weights) // 3
+    problem = (f"有 {n} 个物品，重量 {weights}，价值 {values}，背包容量 {capacity}，"
+               "选择哪些物品使总价值最大？")
+    code = _EXAMPLE_CODE["资源分配 (背包问题)"].replace(
+        "weights = [2, 3, 4, 5]", f"weights = {weights}").replace(
+        "values = [3, 4, 5, 6]", f"values = {values}").replace(
+        "capacity = 5", f"capacity = {capacity}")
+    return {"id": f"knapsack-{n}-{seed}", "kind": "knapsack", "problem": problem, "code": code}
+
+
+def assignment_item(n, seed=0):
+    rng = random.Random(seed)
+    costs = [[rng.randint(10, 200) for _ in range(n)] for _ in range(n)]
+    problem = f"把 {n} 位工人分配到 {n} 个任务。成本矩阵：{costs}，使总成本最小。"
+    code = _EXAMPLE_CODE["人员调度 (指派问题)"].replace(
+        "costs = [[90, 80, 75], [35, 85, 55], [125, 95, 90]]", f"costs = {costs}")
+    return {"id": f"assignment-{n}-{seed}", "kind": "assignment", "problem": problem, "code": code}
+
+
+def scheduling_item(jobs, machines, seed=0):
+    """Job shop: every job visits every machine once, in a random order."""
+    rng = random.Random(seed)
+    data = []
+    for _ in range(jobs):
+        order = rng.sample(range(machines), machines)
+        data.append([(m, rng.randint(1, 20)) for m in order])
+    problem = (f"车间调度：{jobs} 个工件在 {machines} 台机器上加工，每个工件的工序依次为（机器编号, 加工时长）："
+               f"{data}。同一机器同一时间只能加工一道工序，工件的工序必须按顺序进行，最小化最大完工时间。")
+    code = f'''from ortools.sat.python import cp_model
+
+jobs = {data}
+horizon = sum(d for job in jobs for _, d in job)
+model = cp_model.CpModel()
+starts, ends, per_machine = {{}}, {{}}, {{}}
+for j, job in enumerate(jobs):
+    for k, (m, d) in enumerate(job):
+        s = model.NewIntVar(0, horizon, f's_{{j}}_{{k}}')
+        e = model.NewIntVar(0, horizon, f'e_{{j}}_{{k}}')
+        per_machine.setdefault(m, []).append(model.NewIntervalVar(s, d, e, f'iv_{{j}}_{{k}}'))
+        starts[j, k], ends[j, k] = s, e
+        if k:
+            model.Add(s >= ends[j, k - 1])
+for intervals in per_machine.values():
+    model.AddNoOverlap(intervals)
+makespan = model.NewIntVar(0, horizon, 'makespan')
+model.AddMaxEquality(makespan, [ends[j, len(job) - 1] for j, job in enumerate(jobs)])
+model.Minimize(makespan)
+solver = cp_model.CpSolver()
+solver.parameters.max_time_in_seconds = 10
+status = solver.Solve(model)
+if status in (cp_model.OPTIMAL, cp_model.FEASIBLE):
+    print('Objective value =', solver.ObjectiveValue())
+    for (j, k), s in starts.items():
+        print(f's_{{j}}_{{k}} =', solver.Value(s))
+'''
+    return {"id": f"scheduling-{jobs}x{machines}-{seed}", "kind": "scheduling", "problem": problem, "code": code}
+
+
+def build_corpus(specs):
+    """Corpus items for a list of specs (see module docstring)."""
+    items = []
+    for spec in specs:
+        spec, _, count = spec.partition('*')
+        kind, _, size = spec.partition(':')
+        for seed in range(int(count or 1)):
+            if kind == 'examples':
+                items += example_items()
+            elif kind == 'knapsack':
+                items.append(knapsack_item(int(size or 100), seed))
+            elif kind == 'assignment':
+                items.append(assignment_item(int(size or 20), seed))
+            elif kind == 'scheduling':
+                jobs, _, machines = (size or '6x4').partition('x')
+                items.append(scheduling_item(int(jobs), int(machines or jobs), seed))
+            else:
+                raise ValueError(f"unknown corpus spec: {spec}")
+    return items
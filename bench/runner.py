@@ -0,0 +1,230 @@
+"""
+End-to-end pipeline benchmark against the local stub server.
+
+Each session runs one corpus problem through the same stages as the app:
+streamed generation, code extraction and sanitizing, sandboxed execution and
+the result summary. Timings per stage are reported as mean / p50 / p95 / max,
+plus throughput (sessions per second) for every concurrency level.
+
+    python -m bench.runner --corpus examples knapsack:200*2 scheduling:8x4 --sessions 1 4 8
+    python -m bench.runner --save-baseline bench/baseline.json
+    python -m bench.runner --baseline bench/baseline.json --tolerance 0.2
+
+With --baseline the exit status is 1 when any stage got slower than the
+baseline by more than the tolerance (and by more than --min-delta seconds,
+so millisecond jitter does not count).
+"""
+import argparse
+import json
+import os
+import platform
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from bench.corpus import build_corpus
+from bench.stub_server import StubServer, code_recording, load_recordings
+
+STAGES = ('ttft', 'generate', 'extract', 'solve', 'summary', 'total')
+DEFAULT_RECORDINGS = os.path.join(os.path.dirname(__file__), 'recordings')
+
+
+def _pipeline(base_url):
+    """Imports main pointed at the stub; the clients are built at import time."""
+    os.environ['ORTOOLS_LLM_BASE_URL'] = base_url
+    os.environ.setdefault('ORTOOLS_LLM_API_KEY', 'bench')
+    import main
+    if main.LLM_BASE_URL != base_url:
+        raise RuntimeError("main was imported before the stub server started")
+    return main
+
+
+def run_session(pipeline, pool, item, model_id, summarize=True):
+    """Times one problem through the pipeline; returns a flat record."""
+    record = {"id": item["id"], "kind": item["kind"], "status": "ok"}
+    first = []
+
+    def mark(_):
+        if not first:
+            first.append(time.perf_counter())
+
+    start = time.perf_counter()
+    output = pipeline.get_ortools_code_stream(item["problem"], model_id, on_reasoning=mark, on_content=mark,
+                                              use_cache=False)
+    generated = time.perf_counter()
+    record["ttft"] = (first[0] if first else generated) - start
+    record["generate"] = generated - start
+
+    code = pipeline.extract_code(output)
+    if code:
+        code = pipeline.sanitize_code(code)
+        pipeline.analyze(code)
+    record["extract"] = time.perf_counter() - generated
+    if not code:
+        record["status"] = "no_code"
+        record["total"] = time.perf_counter() - start
+        return record
+
+    solve_start = time.perf_counter()
+    result = pool.run(code)
+    record["solve"] = time.perf_counter() - solve_start
+    if not result.ok:
+        record["status"] = "timeout" if result.timed_out else "exec_error"
+        record["error"] = result.error
+    elif result.solve is not None:
+        record["objective"] = result.solve.objective
+
+    if summarize and result.ok:
+        summary_start = time.perf_counter()
+        pipeline.run_async(pipeline.asummarize_result(item["problem"], result.stdout, model_id,
+                                                          use_cache=False)).result()
+        record["summary"] = time.perf_counter() - summary_start
+    record["total"] = time.perf_counter() - start
+    return record
+
+
+def _percentile(sorted_values, q):
+    index = min(len(sorted_values) - 1, max(0, round(q * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def stage_stats(records):
+    stats = {}
+    for stage in STAGES:
+        values = sorted(r[stage] for r in records if stage in r)
+        if values:
+            stats[stage] = {
+                "mean": sum(values) / len(values),
+                "p50": _percentile(values, 0.5),
+                "p95": _percentile(values, 0.95),
+                "max": values[-1],
+                "n": len(values),
+            }
+    return stats
+
+
+def run_level(pipeline, pool, items, sessions, model_id, summarize=True):
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=sessions) as sessions_pool:
+        records = list(sessions_pool.map(lambda item: run_session(pipeline, pool, item, model_id, summarize), items))
+    wall = time.perf_counter() - start
+    return {
+        "sessions": sessions,
+        "wall": wall,
+        "throughput": len(records) / wall if wall else 0.0,
+        "errors": sum(1 for r in records if r["status"] != "ok"),
+        "stages": stage_stats(records),
+        "records": records,
+    }
+
+
+def compare(current, baseline, tolerance=0.2, min_delta=0.005):
+    """
+    Rows (level, stage, metric, baseline, current, change, regressed) for every
+    stage metric and throughput present in both reports.
+    """
+    rows = []
+    for level, cur in current["levels"].items():
+        base = baseline.get("levels", {}).get(level)
+        if base is None:
+            continue
+        for stage in STAGES:
+            for metric in ("p50", "p95"):
+                b = base["stages"].get(stage, {}).get(metric)
+                c = cur["stages"].get(stage, {}).get(metric)
+                if b is None or c is None:
+                    continue
+                change = (c - b) / b if b else 0.0
+                rows.append((level, stage, metric, b, c, change, change > tolerance and c - b > min_delta))
+        b, c = base["throughput"], cur["throughput"]
+        change = (c - b) / b if b else 0.0
+        rows.append((level, "throughput", "sessions/s", b, c, change, change < -tolerance))
+    return rows
+
+
+def print_report(report):
+    for level, data in report["levels"].items():
+        print(f"\n并发会话 {level}：{data['throughput']:.2f} 会话/秒，总耗时 {data['wall']:.2f}s，"
+              f"失败 {data['errors']}")
+        print(f"  {'阶段':<10}{'mean':>9}{'p50':>9}{'p95':>9}{'max':>9}")
+        for stage in STAGES:
+            s = data["stages"].get(stage)
+            if s:
+                print(f"  {stage:<10}{s['mean']:>9.3f}{s['p50']:>9.3f}{s['p95']:>9.3f}{s['max']:>9.3f}")
+
+
+def print_comparison(rows):
+    print("\n与基线对比：")
+    for level, stage, metric, b, c, change, regressed in rows:
+        flag = "  <-- 退化" if regressed else ""
+        print(f"  [{level}] {stage:<10} {metric:<10} {b:>9.3f} -> {c:>9.3f} ({change:+.1%}){flag}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="OR-Tools 流水线离线基准测试")
+    parser.add_argument('--corpus', nargs='+', default=['examples', 'knapsack:200', 'assignment:30', 'scheduling:8x4'],
+                        help="examples、knapsack:N、assignment:N、scheduling:JxM，可加 *K 生成多个实例")
+    parser.add_argument('--sessions', type=int, nargs='+', default=[1, 4], help="并发会话数（可给多个）")
+    parser.add_argument('--repeat', type=int, default=1, help="每个并发级别重复语料的次数")
+    parser.add_argument('--model', default='deepseek-ai/DeepSeek-V3.2')
+    parser.add_argument('--recordings', default=DEFAULT_RECORDINGS, help="录制回复目录，优先于合成回复")
+    parser.add_argument('--speed', type=float, default=1.0, help="回放加速倍数")
+    parser.add_argument('--ttft', type=float, default=0.8, help="合成回复的首 token 延迟（秒）")
+    parser.add_argument('--no-summary', action='store_true', help="跳过结果总结阶段")
+    parser.add_argument('--error-rate', type=float, default=0.0, help="回放服务器以该比例返回 429（测试重试）")
+    parser.add_argument('--drop-rate', type=float, default=0.0, help="回放服务器以该比例中途断开流（测试重试）")
+    parser.add_argument('--output', help="将完整报告（含逐条记录）写入 JSON 文件")
+    parser.add_argument('--baseline', help="与基线报告对比，出现退化时退出码为 1")
+    parser.add_argument('--save-baseline', help="将本次结果保存为基线")
+    parser.add_argument('--tolerance', type=float, default=0.2, help="允许的相对退化比例")
+    parser.add_argument('--min-delta', type=float, default=0.005, help="忽略小于该秒数的绝对变化")
+    args = parser.parse_args()
+
+    items = build_corpus(args.corpus) * args.repeat
+    server = StubServer(speed=args.speed, error_rate=args.error_rate, drop_rate=args.drop_rate)
+    for item in items:
+        server.add(code_recording(item["problem"], item["code"], ttft=args.ttft))
+    server.recordings.update(load_recordings(args.recordings))
+    pipeline = _pipeline(server.start())
+
+    from executor import get_pool
+    pool = get_pool()
+    # Warm the workers and the HTTP connection pool outside the measurement
+    run_session(pipeline, pool, items[0], args.model, summarize=False)
+
+    report = {
+        "meta": {
+            "corpus": args.corpus, "items": len(items), "speed": args.speed, "ttft": args.ttft,
+            "python": platform.python_version(), "platform": platform.platform(), "created": time.time(),
+        },
+        "levels": {},
+    }
+    for sessions in args.sessions:
+        report["levels"][str(sessions)] = run_level(pipeline, pool, items, sessions, args.model,
+                                                    summarize=not args.no_summary)
+    report["meta"]["llm_requests"] = server.requests
+    print_report(report)
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+    summary = {**report, "levels": {k: {n: v for n, v in lvl.items() if n != "records"}
+                                    for k, lvl in report["levels"].items()}}
+    if args.save_baseline:
+        with open(args.save_baseline, 'w', encoding='utf-8') as f:
+            json.dump(summary, f, ensure_ascii=False, indent=2)
+        print(f"\n基线已保存到 {args.save_baseline}")
+    status = 0
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            rows = compare(summary, json.load(f), args.tolerance, args.min_delta)
+        print_comparison(rows)
+        if any(row[-1] for row in rows):
+            status = 1
+    server.stop()
+    pool.shutdown()
+    sys.exit(status)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,279 @@
+"""
+Local OpenAI-compatible stub for /v1/chat/completions.
+
+Streams recorded `reasoning_content` / `content` chunks as server-sent events
+with the recorded inter-chunk delays (scaled by `speed`). Recordings are
+matched on the normalized user message; unknown requests get a synthesized
+reply (a short summary for summary prompts, otherwise text without code).
+
+    python -m bench.stub_server serve --port 8900 --recordings bench/recordings
+    python -m bench.stub_server record --out bench/recordings "最大化 3x + 4y ..."
+
+Point the app at it with ORTOOLS_LLM_BASE_URL=http://127.0.0.1:8900/v1.
+--error-rate and --drop-rate inject 429 answers and streams cut off halfway,
+to exercise the client's retries (llm_gateway).
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import random
+import threading
+import time
+import unicodedata
+from dataclasses import dataclass, field
+
+REASONING_CHARS_PER_CHUNK = 6
+CONTENT_CHARS_PER_CHUNK = 12
+
+
+@dataclass
+class Recording:
+    """A reply as (kind, text, delay-before-chunk) triples; kind is 'reasoning' or 'content'."""
+    problem: str = ""
+    chunks: list = field(default_factory=list)
+
+    def to_json(self):
+        return {"problem": self.problem, "chunks": [list(c) for c in self.chunks]}
+
+    @classmethod
+    def from_json(cls, data):
+        return cls(data.get("problem", ""), [tuple(c) for c in data["chunks"]])
+
+
+def _key(text):
+    text = " ".join(unicodedata.normalize('NFKC', text).split())
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()[:24]
+
+
+def _pieces(text, size):
+    return [text[i:i + size] for i in range(0, len(text), size)]
+
+
+def synthesize(problem, answer, ttft=0.8, reasoning_chars=600, reasoning_delay=0.02, content_delay=0.015):
+    """
+    A recording with typical thinking-model timing: a first-token wait, a
+    reasoning phase of reasoning_chars, then `answer` streamed as content.
+    """
+    reasoning = ("先识别决策变量、目标函数与约束条件，再选择合适的 OR-Tools 求解器。" * (reasoning_chars // 30 + 1))
+    chunks = [('reasoning', piece, reasoning_delay)
+              for piece in _pieces(reasoning[:reasoning_chars], REASONING_CHARS_PER_CHUNK)]
+    chunks += [('content', piece, content_delay) for piece in _pieces(answer, CONTENT_CHARS_PER_CHUNK)]
+    if chunks:
+        chunks[0] = (chunks[0][0], chunks[0][1], ttft)
+    return Recording(problem, chunks)
+
+
+def code_recording(problem, code, **timing):
+    return synthesize(problem, f"```python\n{code.strip()}\n```", **timing)
+
+
+def load_recordings(directory):
+    recordings = {}
+    for name in sorted(os.listdir(directory)) if os.path.isdir(directory) else []:
+        if name.endswith('.json'):
+            with open(os.path.join(directory, name), encoding='utf-8') as f:
+                rec = Recording.from_json(json.load(f))
+            recordings[_key(rec.problem)] = rec
+    return recordings
+
+
+def save_recording(directory, recording):
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, f"{_key(recording.problem)}.json")
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(recording.to_json(), f, ensure_ascii=False)
+    return path
+
+
+class StubServer:
+    """
+    Replays recordings over HTTP/1.1 keep-alive connections with chunked
+    server-sent events, the way the OpenAI client expects them. A share of
+    requests can be failed on purpose: error_rate answers 429, drop_rate
+    closes the connection after half of the reply.
+    """
+
+    def __init__(self, recordings=None, speed=1.0, summary_delay=0.3, error_rate=0.0, drop_rate=0.0, seed=None):
+        self.recordings = dict(recordings or {})
+        self.speed = speed
+        self.summary_delay = summary_delay
+        self.error_rate = error_rate
+        self.drop_rate = drop_rate
+        self._random = random.Random(seed)
+        self.requests = 0
+        self.failed = 0
+        self.prompt_chars = 0
+        self.base_url = None
+        self._loop = None
+        self._server = None
+
+    def add(self, recording):
+        self.recordings[_key(recording.problem)] = recording
+
+    def _reply_for(self, messages):
+        system = next((m["content"] for m in messages if m["role"] == "system"), "")
+        user = next((m["content"] for m in reversed(messages) if m["role"] == "user"), "")
+        recording = self.recordings.get(_key(user))
+        if recording is not None:
+            return recording
+        if "求解器输出" in user:
+            return synthesize(user, "已找到最优解，目标值与各变量取值见求解器输出。", ttft=self.summary_delay,
+                              reasoning_chars=0)
+        # Repair prompts quote a snippet; echo it back unchanged
+        if "```python" in user and "代码修复" in system:
+            snippet = user.split("```python", 1)[1].split("```", 1)[0]
+            return synthesize(user, f"```python{snippet}```", reasoning_chars=0)
+        return synthesize(user, "未找到该问题的录制回复。", reasoning_chars=0)
+
+    async def _send(self, writer, data):
+        writer.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+        await writer.drain()
+
+    async def _chat(self, request, writer):
+        messages = request.get("messages", [])
+        self.requests += 1
+        self.prompt_chars += sum(len(m.get("content") or "") for m in messages)
+        recording = self._reply_for(messages)
+        created = int(time.time())
+        if self._random.random() < self.error_rate:
+            self.failed += 1
+            body = b'{"error": {"message": "rate limited (stub)", "type": "rate_limit"}}'
+            writer.write(b"HTTP/1.1 429 Too Many Requests\r\nContent-Type: application/json\r\nRetry-After: 0\r\n"
+                         + f"Content-Length: {len(body)}\r\n\r\n".encode() + body)
+            await writer.drain()
+            return
+        drop_at = len(recording.chunks) // 2 if self._random.random() < self.drop_rate else None
+        if not request.get("stream"):
+            for _, _, delay in recording.chunks:
+                await asyncio.sleep(delay / self.speed)
+            body = json.dumps({
+                "id": "stub", "object": "chat.completion", "created": created, "model": request.get("model"),
+                "choices": [{"index": 0, "finish_reason": "stop", "message": {
+                    "role": "assistant",
+                    "content": "".join(t for k, t, _ in recording.chunks if k == 'content'),
+                    "reasoning_content": "".join(t for k, t, _ in recording.chunks if k == 'reasoning'),
+                }}],
+            }, ensure_ascii=False).encode('utf-8')
+            writer.write(b"HTTP/1.1 200 OK\r\nContent-Type: application/json\r\n"
+                         + f"Content-Length: {len(body)}\r\n\r\n".encode() + body)
+            await writer.drain()
+            return
+        writer.write(b"HTTP/1.1 200 OK\r\nContent-Type: text/event-stream\r\n"
+                     b"Cache-Control: no-cache\r\nTransfer-Encoding: chunked\r\n\r\n")
+        for i, (kind, text, delay) in enumerate(recording.chunks):
+            if i == drop_at:
+                self.failed += 1
+                # Connection lost mid-stream: no terminating chunk
+                raise ConnectionResetError("stub dropped the stream")
+            await asyncio.sleep(delay / self.speed)
+            delta = {"reasoning_content": text} if kind == 'reasoning' else {"content": text}
+            event = {"id": "stub", "object": "chat.completion.chunk", "created": created,
+                     "model": request.get("model"),
+                     "choices": [{"index": 0, "delta": delta, "finish_reason": None}]}
+            await self._send(writer, f"data: {json.dumps(event, ensure_ascii=False)}\n\n".encode('utf-8'))
+        await self._send(writer, b"data: [DONE]\n\n")
+        writer.write(b"0\r\n\r\n")
+        await writer.drain()
+
+    async def _handle(self, reader, writer):
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line.strip():
+                    break
+                method, path, _ = request_line.decode('latin-1').split(' ', 2)
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b'\r\n', b'\n', b''):
+                        break
+                    name, _, value = line.decode('latin-1').partition(':')
+                    headers[name.strip().lower()] = value.strip()
+                body = await reader.readexactly(int(headers.get('content-length', 0)))
+                if method == 'POST' and path.rstrip('/').endswith('/chat/completions'):
+                    await self._chat(json.loads(body or b'{}'), writer)
+                else:
+                    writer.write(b"HTTP/1.1 404 Not Found\r\nContent-Length: 0\r\n\r\n")
+                    await writer.drain()
+                if headers.get('connection', '').lower() == 'close':
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            # The client closes streams early once the code block is complete
+            pass
+        finally:
+            writer.close()
+
+    def start(self, host='127.0.0.1', port=0):
+        """Serves on a background thread; returns the base URL to use as the OpenAI base_url."""
+        ready = threading.Event()
+
+        def run():
+            self._loop = asyncio.new_event_loop()
+            self._server = self._loop.run_until_complete(asyncio.start_server(self._handle, host, port))
+            ready.set()
+            self._loop.run_forever()
+
+        threading.Thread(target=run, name='stub-llm-server', daemon=True).start()
+        ready.wait()
+        bound = self._server.sockets[0].getsockname()[1]
+        self.base_url = f"http://{host}:{bound}/v1"
+        return self.base_url
+
+    def stop(self):
+        # Stops accepting connections; open keep-alive connections end with the daemon thread
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._server.close)
+
+
+def record_live(problem, model_id):
+    """Records a real generation (main's endpoint and system prompt) with its chunk timing."""
+    import main
+
+    chunks = []
+    last = [time.perf_counter()]
+
+    def capture(kind):
+        def on_chunk(text):
+            now = time.perf_counter()
+            chunks.append((kind, text, round(now - last[0], 4)))
+            last[0] = now
+        return on_chunk
+
+    main._get_ortools_code_stream(problem, model_id, on_reasoning=capture('reasoning'),
+                                  on_content=capture('content'))
+    return Recording(problem, chunks)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="OpenAI 兼容的本地回放服务器")
+    sub = parser.add_subparsers(dest='command', required=True)
+    serve = sub.add_parser('serve', help="回放录制的流式回复")
+    serve.add_argument('--host', default='127.0.0.1')
+    serve.add_argument('--port', type=int, default=8900)
+    serve.add_argument('--recordings', default=os.path.join(os.path.dirname(__file__), 'recordings'))
+    serve.add_argument('--speed', type=float, default=1.0, help="回放加速倍数")
+    serve.add_argument('--error-rate', type=float, default=0.0, help="以该比例返回 429")
+    serve.add_argument('--drop-rate', type=float, default=0.0, help="以该比例在回复中途断开连接")
+    record = sub.add_parser('record', help="调用真实接口并录制回复")
+    record.add_argument('problem', nargs='+')
+    record.add_argument('--model', default='deepseek-ai/DeepSeek-V3.2')
+    record.add_argument('--out', default=os.path.join(os.path.dirname(__file__), 'recordings'))
+    args = parser.parse_args()
+
+    if args.command == 'record':
+        for problem in args.problem:
+            print(save_recording(args.out, record_live(problem, args.model)))
+        return
+    server = StubServer(load_recordings(args.recordings), speed=args.speed, error_rate=args.error_rate,
+                        drop_rate=args.drop_rate)
+    print(f"回放 {len(server.recordings)} 条录制，地址 {server.start(args.host, args.port)}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
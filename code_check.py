@@ -0,0 +1,372 @@
+"""
+AST-based pre-flight analysis of generated OR-Tools programs.
+
+analyze() parses a program once and fixes the mistakes that have exactly one
+correct rewrite: CP-SAT results read through the pywraplp API and vice versa,
+a missing CpSolver, model.Solve(), and well-known modules used without an
+import. Fixes are spliced into the original source by position, so comments
+and layout survive. Problems without a deterministic fix (syntax errors, !=
+constraints in pywraplp, models that are never solved, undefined names) are
+reported as Issues for a targeted LLM repair of the surrounding lines.
+"""
+import ast
+import builtins
+import re
+import textwrap
+import threading
+from dataclasses import dataclass, field
+
+# Modules generated programs often use without importing them
+KNOWN_IMPORTS = {
+    'cp_model': 'from ortools.sat.python import cp_model',
+    'pywraplp': 'from ortools.linear_solver import pywraplp',
+    'np': 'import numpy as np',
+    'numpy': 'import numpy',
+    'pd': 'import pandas as pd',
+    'math': 'import math',
+    'itertools': 'import itertools',
+    'collections': 'import collections',
+}
+
+SOLVE_METHODS = {'Solve', 'solve', 'SolveWithSolutionCallback', 'SearchForAllSolutions',
+                 'solve_with_solution_callback'}
+# Methods that only exist on the other API; calling them is a mixed-API mistake
+CP_ONLY_METHODS = {'NewIntVar', 'NewBoolVar', 'NewIntervalVar', 'NewOptionalIntervalVar', 'AddAllDifferent',
+                   'AddAllowedAssignments', 'AddNoOverlap', 'AddCumulative', 'AddElement', 'AddMaxEquality',
+                   'AddMinEquality', 'AddMultiplicationEquality', 'AddBoolOr', 'AddBoolAnd', 'AddImplication',
+                   'StatusName', 'BooleanValue', 'AddHint'}
+LP_ONLY_METHODS = {'NumVar', 'IntVar', 'BoolVar', 'Objective', 'Constraint', 'SetTimeLimit', 'NumVariables',
+                   'NumConstraints', 'SetHint'}
+
+SNIPPET_CONTEXT = 10
+_MAX_PASSES = 4
+# ast.parse is not thread-safe on CPython 3.11 ("AST constructor recursion depth
+# mismatch"), and generations are checked from many threads at once
+_parse_lock = threading.Lock()
+# PEP 263 source encoding declaration
+_CODING = re.compile(r'^[ \t\f]*#.*?coding[:=]')
+
+
+def _parse(code):
+    with _parse_lock:
+        return ast.parse(code)
+
+
+@dataclass
+class Issue:
+    kind: str
+    message: str
+    lineno: int = None
+
+
+@dataclass
+class CodeAnalysis:
+    code: str
+    fixes: list = field(default_factory=list)
+    issues: list = field(default_factory=list)
+
+    @property
+    def ok(self):
+        return not self.issues
+
+
+class _Source:
+    """Maps AST positions (UTF-8 byte columns) to offsets in the source string."""
+
+    def __init__(self, code):
+        self.code = code
+        self.lines = code.splitlines(keepends=True)
+        self.starts = [0]
+        for line in self.lines:
+            self.starts.append(self.starts[-1] + len(line))
+
+    def offset(self, lineno, col):
+        if lineno > len(self.lines):
+            return len(self.code)
+        line = self.lines[lineno - 1]
+        return self.starts[lineno - 1] + len(line.encode('utf-8')[:col].decode('utf-8', errors='ignore'))
+
+    def span(self, node):
+        return self.offset(node.lineno, node.col_offset), self.offset(node.end_lineno, node.end_col_offset)
+
+    def text(self, node):
+        start, end = self.span(node)
+        return self.code[start:end]
+
+    def indent(self, lineno):
+        line = self.lines[lineno - 1]
+        return line[:len(line) - len(line.lstrip())]
+
+
+def _dotted(node):
+    parts = []
+    while isinstance(node, ast.Attribute):
+        parts.append(node.attr)
+        node = node.value
+    if isinstance(node, ast.Name):
+        parts.append(node.id)
+    return ".".join(reversed(parts))
+
+
+def _method_call(node):
+    """(receiver name, method) for calls like `name.method(...)`, else (None, None)."""
+    if isinstance(node, ast.Call) and isinstance(node.func, ast.Attribute) and isinstance(node.func.value, ast.Name):
+        return node.func.value.id, node.func.attr
+    return None, None
+
+
+def _bound_names(tree):
+    bound = set()
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Name) and isinstance(node.ctx, (ast.Store, ast.Del)):
+            bound.add(node.id)
+        elif isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+            bound.add(node.name)
+        elif isinstance(node, ast.arg):
+            bound.add(node.arg)
+        elif isinstance(node, (ast.Import, ast.ImportFrom)):
+            bound.update((a.asname or a.name).split('.')[0] for a in node.names)
+        elif isinstance(node, ast.ExceptHandler) and node.name:
+            bound.add(node.name)
+        elif isinstance(node, (ast.Global, ast.Nonlocal)):
+            bound.update(node.names)
+        elif isinstance(node, (ast.MatchAs, ast.MatchStar)) and node.name:
+            bound.add(node.name)
+    return bound
+
+
+class _Pass:
+    """One analysis pass: collects edits and issues against a single parse."""
+
+    def __init__(self, code, tree, known_names):
+        self.src = _Source(code)
+        self.tree = tree
+        self.known_names = set(known_names)
+        self.edits = []
+        self.fixes = []
+        self.issues = []
+        self.cp_models, self.cp_solvers, self.lp_solvers = [], [], []
+        self.first_cp_model = None
+        for node in ast.walk(tree):
+            if isinstance(node, ast.Assign) and isinstance(node.value, ast.Call):
+                callee = _dotted(node.value.func)
+                names = [t.id for t in node.targets if isinstance(t, ast.Name)]
+                if callee.endswith('CpModel'):
+                    self.cp_models += names
+                    if self.first_cp_model is None:
+                        self.first_cp_model = node
+                elif callee.endswith('CpSolver'):
+                    self.cp_solvers += names
+                elif callee.endswith('CreateSolver') or callee == 'pywraplp.Solver':
+                    self.lp_solvers += names
+
+    def edit(self, node, replacement, fix):
+        start, end = self.src.span(node)
+        self.edits.append((start, end, replacement))
+        self.fixes.append(f"第 {node.lineno} 行：{fix}")
+
+    def run(self):
+        cp_solver = self.cp_solvers[0] if self.cp_solvers else None
+        if self.cp_models and cp_solver is None:
+            cp_solver = 'cp_solver' if 'solver' in self.lp_solvers else 'solver'
+            stmt = self.first_cp_model
+            # Own line right after the statement, past any trailing comment
+            pos = self.src.starts[stmt.end_lineno]
+            line = f"{self.src.indent(stmt.lineno)}{cp_solver} = cp_model.CpSolver()\n"
+            self.edits.append((pos, pos, line if self.src.code[:pos].endswith("\n") else "\n" + line))
+            self.fixes.append(f"第 {stmt.lineno} 行后：补充 {cp_solver} = cp_model.CpSolver()")
+        cp_solvers = set(self.cp_solvers) | ({cp_solver} if cp_solver else set())
+        lp_solvers = set(self.lp_solvers)
+        cp_model_name = self.cp_models[0] if self.cp_models else None
+        solved = False
+
+        for node in ast.walk(self.tree):
+            if not (isinstance(node, ast.Call) and isinstance(node.func, ast.Attribute)):
+                continue
+            method = node.func.attr
+            receiver = node.func.value.id if isinstance(node.func.value, ast.Name) else None
+            if method in SOLVE_METHODS:
+                solved = True
+            if method == 'solution_value' and not node.args and cp_model_name and not lp_solvers:
+                target = self.src.text(node.func.value)
+                self.edit(node, f"{cp_solver}.Value({target})",
+                          f"{target}.solution_value() 改为 {cp_solver}.Value({target})")
+                continue
+            if self._fix_objective_call(node, cp_solvers) or receiver is None:
+                continue
+            if method == 'Solve' and not node.args and cp_model_name and (
+                    receiver in self.cp_models or receiver in cp_solvers
+                    or (receiver == 'solver' and receiver not in lp_solvers)):
+                self.edit(node, f"{cp_solver}.Solve({cp_model_name})",
+                          f"{receiver}.Solve() 改为 {cp_solver}.Solve({cp_model_name})")
+            elif receiver in lp_solvers and method == 'Value' and len(node.args) == 1:
+                target = self.src.text(node.args[0])
+                self.edit(node, f"{target}.solution_value()", f"{receiver}.Value(...) 改为 pywraplp 的 solution_value()")
+            elif receiver in lp_solvers and method in ('ObjectiveValue', 'BestObjectiveBound') and not node.args:
+                getter = 'Value' if method == 'ObjectiveValue' else 'BestBound'
+                self.edit(node, f"{receiver}.Objective().{getter}()", f"{receiver}.{method}() 改为 pywraplp 写法")
+            elif receiver in lp_solvers and method in CP_ONLY_METHODS:
+                self.issues.append(Issue('mixed_api', f"第 {node.lineno} 行：{receiver} 是 pywraplp 求解器，"
+                                                      f"却调用了 CP-SAT 的 {method}()", node.lineno))
+            elif (receiver in self.cp_models or receiver in cp_solvers) and method in LP_ONLY_METHODS:
+                self.issues.append(Issue('mixed_api', f"第 {node.lineno} 行：{receiver} 是 CP-SAT 对象，"
+                                                      f"却调用了 pywraplp 的 {method}()", node.lineno))
+            elif receiver in lp_solvers and method == 'Add' and node.args and any(
+                    isinstance(op, ast.NotEq) for n in ast.walk(node.args[0]) if isinstance(n, ast.Compare)
+                    for op in n.ops):
+                self.issues.append(Issue('lp_not_equal', f"第 {node.lineno} 行：pywraplp 不支持 != 约束，"
+                                                         "需要引入 0-1 变量与大 M 约束改写，或改用 CP-SAT", node.lineno))
+
+        if (self.cp_models or lp_solvers) and not solved:
+            self.issues.append(Issue('missing_solve', "模型已建立，但程序中没有调用 Solve() 求解"))
+        self._check_names()
+
+    def _fix_objective_call(self, node, cp_solvers):
+        # cp_solver.Objective().Value() / .BestBound() -> ObjectiveValue() / BestObjectiveBound()
+        if not (isinstance(node, ast.Call) and isinstance(node.func, ast.Attribute) and not node.args):
+            return False
+        inner = node.func.value
+        receiver, method = _method_call(inner)
+        if method != 'Objective' or receiver not in cp_solvers:
+            return False
+        getter = {'Value': 'ObjectiveValue', 'value': 'ObjectiveValue', 'BestBound': 'BestObjectiveBound'}.get(node.func.attr)
+        if getter is None:
+            return False
+        self.edit(node, f"{receiver}.{getter}()", f"{receiver}.Objective().{node.func.attr}() 改为 {receiver}.{getter}()")
+        return True
+
+    def _check_names(self):
+        if any(isinstance(n, ast.ImportFrom) and any(a.name == '*' for a in n.names) for n in ast.walk(self.tree)):
+            return
+        defined = _bound_names(self.tree) | set(dir(builtins)) | self.known_names | {'__name__', '__file__'}
+        missing_imports = []
+        reported = set()
+        for node in ast.walk(self.tree):
+            if not (isinstance(node, ast.Name) and isinstance(node.ctx, ast.Load)) or node.id in defined:
+                continue
+            if node.id in KNOWN_IMPORTS:
+                if node.id not in missing_imports:
+                    missing_imports.append(node.id)
+            elif node.id not in reported:
+                reported.add(node.id)
+                self.issues.append(Issue('undefined_name', f"第 {node.lineno} 行：名称 {node.id} 未定义", node.lineno))
+        if missing_imports:
+            lineno = self._header_end()
+            offset = self.src.starts[lineno]
+            # A header that ends the file without a newline
+            lead = "\n" if lineno and not self.src.lines[lineno - 1].endswith("\n") else ""
+            self.edits.append((offset, offset, lead + "".join(KNOWN_IMPORTS[n] + "\n" for n in missing_imports)))
+            self.fixes.append("补充导入：" + "、".join(KNOWN_IMPORTS[n] for n in missing_imports))
+
+    def _header_end(self):
+        """Number of leading lines imports must follow: shebang, encoding line, docstring, __future__ imports."""
+        end = 0
+        for i, line in enumerate(self.src.lines[:2]):
+            if (i == 0 and line.startswith('#!')) or _CODING.match(line):
+                end = i + 1
+            elif not line.lstrip().startswith('#'):
+                break
+        for i, node in enumerate(self.tree.body):
+            docstring = (i == 0 and isinstance(node, ast.Expr) and isinstance(node.value, ast.Constant)
+                         and isinstance(node.value.value, str))
+            if not (docstring or (isinstance(node, ast.ImportFrom) and node.module == '__future__')):
+                break
+            end = node.end_lineno
+        return end
+
+    def apply(self):
+        code = self.src.code
+        last_start = len(code) + 1
+        # Apply back to front; an edit nested in one already applied waits for the next pass
+        for start, end, replacement in sorted(self.edits, key=lambda e: (e[0], e[1]), reverse=True):
+            if end > last_start:
+                continue
+            code = code[:start] + replacement + code[end:]
+            last_start = start
+        return code
+
+
+def analyze(code, known_names=()):
+    """
+    Checks and deterministically fixes a generated program. known_names are
+    globals injected at execution time (dataset arrays). Returns a CodeAnalysis
+    whose `code` carries the fixes and whose `issues` still need a repair.
+    """
+    fixes = []
+    for _ in range(_MAX_PASSES):
+        try:
+            tree = _parse(code)
+        except SyntaxError as e:
+            return CodeAnalysis(code, fixes, [Issue('syntax', f"第 {e.lineno} 行语法错误：{e.msg}", e.lineno)])
+        check = _Pass(code, tree, known_names)
+        check.run()
+        if not check.edits:
+            return CodeAnalysis(code, fixes, check.issues)
+        fixes += check.fixes
+        code = check.apply()
+    return CodeAnalysis(code, fixes, check.issues)
+
+
+def sanitize_code(code: str) -> str:
+    """Applies the deterministic fixes only."""
+    return analyze(code).code
+
+
+def failing_line(traceback_text):
+    """Line of the generated program that a worker traceback points to last."""
+    lines = re.findall(r'File "<generated>", line (\d+)', traceback_text or "")
+    return int(lines[-1]) if lines else None
+
+
+def _innermost_block(body, lineno, context):
+    # Descend into compound statements too long to send whole
+    while True:
+        stmt = next((s for s in body if s.lineno <= lineno <= s.end_lineno), None)
+        if stmt is None or stmt.end_lineno - stmt.lineno <= 2 * context:
+            return body
+        blocks = [getattr(stmt, name, None) or [] for name in ('body', 'orelse', 'finalbody')]
+        blocks += [h.body for h in getattr(stmt, 'handlers', [])] + [c.body for c in getattr(stmt, 'cases', [])]
+        inner = next((b for b in blocks if b and b[0].lineno <= lineno <= b[-1].end_lineno), None)
+        if inner is None:
+            return body
+        body = inner
+
+
+def snippet_bounds(code, lineno, context=SNIPPET_CONTEXT):
+    """
+    1-based inclusive line range to send for repair around `lineno`: whole
+    sibling statements of the innermost block, so that replacing the range
+    keeps the program well-formed. Without a line number the tail is used.
+    """
+    total = len(code.splitlines())
+    if lineno is None:
+        lineno = total
+    try:
+        body = _innermost_block(_parse(code).body, lineno, context)
+    except SyntaxError:
+        return max(1, lineno - context), min(total, lineno + context)
+    near = [s for s in body if s.end_lineno >= lineno - context and s.lineno <= lineno + context]
+    if not near:
+        return max(1, lineno - context), min(total, lineno + context)
+    start = min(near[0].lineno, lineno)
+    # Decorators and leading comments belong to the statement
+    start = min([start] + [d.lineno for d in getattr(near[0], 'decorator_list', [])])
+    return start, max(near[-1].end_lineno, min(lineno, total))
+
+
+def get_snippet(code, start, end):
+    """The lines start..end dedented, plus the indent that was removed."""
+    lines = code.splitlines()[start - 1:end]
+    snippet = textwrap.dedent("\n".join(lines))
+    first = next((line for line in lines if line.strip()), "")
+    indent = first[:len(first) - len(first.lstrip())]
+    if not all(line.startswith(indent) or not line.strip() for line in lines):
+        indent = ""
+    return snippet, indent
+
+
+def replace_lines(code, start, end, replacement, indent=""):
+    """Replaces lines start..end with replacement, re-indented by indent."""
+    lines = code.splitlines()
+    new = textwrap.indent(textwrap.dedent(replacement).strip("\n"), indent).splitlines()
+    return "\n".join(lines[:start - 1] + new + lines[end:]) + ("\n" if code.endswith("\n") else "")
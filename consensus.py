@@ -0,0 +1,160 @@
+"""
+Consensus over several independently generated programs for one problem.
+
+A single LLM sample can be a wrong formulation that still runs cleanly. In
+consensus mode N candidate programs are generated concurrently
+(main.get_ortools_code_candidates) and executed concurrently in the shared
+worker pool. select() groups the finished runs by outcome: solver status
+class and objective value, equal within a relative tolerance. It returns
+the largest group and prefers proven-optimal results on ties. Minority
+outcomes and failed candidates are reported as disagreement, not dropped.
+"""
+import math
+from dataclasses import dataclass, field
+
+OBJECTIVE_RTOL = 1e-6
+OBJECTIVE_ATOL = 1e-9
+
+
+@dataclass
+class Candidate:
+    """One generated program and its execution result (executor.ExecResult)."""
+    index: int
+    code: str = None
+    result: object = None
+    objective: float = None
+
+    @property
+    def ok(self):
+        return self.result is not None and self.result.ok
+
+    @property
+    def status(self):
+        if self.code is None:
+            return "NO_CODE"
+        if not self.ok:
+            return "TIMEOUT" if self.result is not None and self.result.timed_out else "ERROR"
+        solve = self.result.solve
+        return solve.status if solve is not None else "UNKNOWN"
+
+    @property
+    def proven(self):
+        return self.status == "OPTIMAL"
+
+    def outcome(self):
+        """Key the candidate votes with; None for candidates that did not run cleanly."""
+        if not self.ok:
+            return None
+        if self.objective is not None and math.isfinite(self.objective):
+            return ("objective", self.objective)
+        solve = self.result.solve
+        if solve is not None and solve.has_solution:
+            # Satisfaction models: any feasible assignment agrees
+            return ("feasible",)
+        return ("status", self.status)
+
+
+def _same(a, b):
+    if a[0] == "objective" and b[0] == "objective":
+        return math.isclose(a[1], b[1], rel_tol=OBJECTIVE_RTOL, abs_tol=OBJECTIVE_ATOL)
+    return a == b
+
+
+def _label(candidate):
+    return f"目标值 {candidate.objective:g}" if candidate.objective is not None else f"状态 {candidate.status}"
+
+
+@dataclass
+class Consensus:
+    candidates: list
+    groups: list = field(default_factory=list)
+    winner: Candidate = None
+
+    @property
+    def failed(self):
+        return [c for c in self.candidates if c.outcome() is None]
+
+    @property
+    def agreeing(self):
+        return len(self.groups[0]) if self.groups else 0
+
+    @property
+    def unanimous(self):
+        return self.agreeing == len(self.candidates)
+
+    def rows(self):
+        """Per-candidate table rows for reports and UIs."""
+        agreeing = {c.index for c in self.groups[0]} if self.groups else set()
+        return [{
+            "候选": c.index + 1,
+            "状态": c.status,
+            "目标值": c.objective,
+            "耗时 (s)": None if c.result is None else round(c.result.elapsed, 3),
+            "采纳": "✅" if c is self.winner else ("一致" if c.index in agreeing else ""),
+        } for c in self.candidates]
+
+    def describe(self):
+        n = len(self.candidates)
+        if self.winner is None:
+            return f"{n} 个候选程序均未成功运行。"
+        text = f"{n} 个候选中 {self.agreeing} 个结果一致（{_label(self.winner)}）"
+        others = [f"{len(group)} 个得到{_label(group[0])}" for group in self.groups[1:]]
+        if self.failed:
+            others.append(f"{len(self.failed)} 个运行失败")
+        return text + ("；" + "，".join(others) if others else "") + "。"
+
+    def to_dict(self):
+        return {
+            "winner": None if self.winner is None else self.winner.index,
+            "agreeing": self.agreeing,
+            "candidates": len(self.candidates),
+            "unanimous": self.unanimous,
+            "summary": self.describe(),
+            "rows": self.rows(),
+        }
+
+
+def select(candidates):
+    """
+    Groups clean runs by outcome and picks the winner: the largest group, ties
+    broken by a proven-optimal member, then by having a solution at all, then
+    by the earliest candidate. Within the group a proven-optimal run wins.
+    """
+    groups = []
+    for candidate in candidates:
+        key = candidate.outcome()
+        if key is None:
+            continue
+        for group in groups:
+            if _same(group[0].outcome(), key):
+                group.append(candidate)
+                break
+        else:
+            groups.append([candidate])
+    groups.sort(key=lambda g: (-len(g), not any(c.proven for c in g), g[0].outcome()[0] == "status",
+                               g[0].index))
+    winner = None
+    if groups:
+        winner = next((c for c in groups[0] if c.proven), groups[0][0])
+    return Consensus(candidates, groups, winner)
+
+
+def run_candidates(pool, codes, objective_of=None, **submit_kwargs):
+    """
+    Executes every candidate program at once in the worker pool (one worker
+    each, so N candidates cost about one run of wall time on N free cores)
+    and returns the Consensus. objective_of(stdout) supplies an objective for
+    programs whose solver the executor cannot read (e.g. routing).
+    """
+    futures = [pool.submit(code, **submit_kwargs) if code else None for code in codes]
+    candidates = []
+    for i, (code, future) in enumerate(zip(codes, futures)):
+        result = future.result() if future is not None else None
+        objective = None
+        if result is not None and result.ok:
+            if result.solve is not None:
+                objective = result.solve.objective
+            elif objective_of is not None:
+                objective = objective_of(result.stdout)
+        candidates.append(Candidate(i, code, result, objective))
+    return select(candidates)
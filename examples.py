@@ -0,0 +1,8 @@
+"""Standard example problems shown in the app sidebar and used by the benchmark corpus."""
+
+EXAMPLE_PROBLEMS = {
+    "生产计划 (线性规划)": "最大化 3x + 4y，约束：x + 2y <= 14，3x - y >= 0，x - y <= 2，x >= 0，y >= 0。",
+    "资源分配 (背包问题)": "有 4 个物品，重量 [2, 3, 4, 5]，价值 [3, 4, 5, 6]，背包容量 5，选择哪些物品使总价值最大？",
+    "人员调度 (指派问题)": "把 3 位工人分配到 3 个任务。成本矩阵：[[90, 80, 75], [35, 85, 55], [125, 95, 90]]，使总成本最小。",
+    "逻辑推理 (三位数谜题)": "在 1 到 9 之间找三个互不相同的数字 X、Y、Z，使得 X + Y = Z，并且 Z 最大。",
+}
@@ -0,0 +1,533 @@
+"""
+Process-pool execution engine for generated OR-Tools code.
+
+Each worker process imports pywraplp and cp_model once at start-up and then
+runs jobs one at a time with its own stdout. The parent enforces a wall-clock
+limit and a resident-memory limit per job; a worker that exceeds either is
+killed and replaced by a freshly warmed one. Jobs submitted with on_progress
+stream anytime progress (see progress.py) back over the worker's pipe and can
+be stopped early with ExecutionPool.stop(), keeping the best solution found.
+"""
+import atexit
+import io
+import multiprocessing
+import os
+import queue
+import threading
+import time
+import traceback
+from concurrent.futures import Future
+from contextlib import redirect_stdout
+from dataclasses import dataclass, field
+
+import numpy as np
+
+DEFAULT_TIMEOUT = float(os.environ.get('ORTOOLS_EXEC_TIMEOUT', 120))
+DEFAULT_MEMORY_MB = int(os.environ.get('ORTOOLS_EXEC_MEMORY_MB', 4096))
+DEFAULT_WORKERS = int(os.environ.get('ORTOOLS_EXEC_WORKERS', os.cpu_count() or 2))
+
+_POLL_INTERVAL = 0.05
+# Seconds a new worker may take to import and warm up OR-Tools, and the respawn backoff after failures
+_START_TIMEOUT = 120
+_RESPAWN_BACKOFF_MAX = 30.0
+_PAGE_SIZE = os.sysconf('SC_PAGE_SIZE') if hasattr(os, 'sysconf') else 4096
+
+
+@dataclass
+class SolveResult:
+    """
+    Solver state read directly from the solver objects after a run.
+    Variable values are kept column-wise: `names` and a float64 `values` array.
+    """
+    backend: str
+    status: str
+    objective: float = None
+    best_bound: float = None
+    wall_time: float = None
+    names: list = field(default_factory=list)
+    values: np.ndarray = field(default_factory=lambda: np.zeros(0))
+
+    @property
+    def has_solution(self):
+        return self.status in ('OPTIMAL', 'FEASIBLE')
+
+    def to_frame(self):
+        import pandas as pd
+        return pd.DataFrame({"变量": self.names, "值": self.values})
+
+    def to_records(self):
+        return [{"变量": n, "值": float(v)} for n, v in zip(self.names, self.values)]
+
+
+@dataclass
+class ExecResult:
+    ok: bool
+    stdout: str = ""
+    error: str = None
+    traceback: str = None
+    elapsed: float = 0.0
+    timed_out: bool = False
+    solve: SolveResult = None
+    stopped: bool = False
+
+
+# (backend, solver, model, status) for every Solve() made by the current job
+_solves = []
+# solver_config.SolverConfig applied to every Solve() of the current job
+_config = None
+# (names, values) of a previous solution, passed as a hint to every Solve() of the current job
+_hint = None
+# Sends a progress point to the parent while a job that asked for progress runs
+_report = None
+# Set by the parent (ExecutionPool.stop) to interrupt the running solve
+_stop_event = None
+
+
+def _install_solve_hooks():
+    from ortools.linear_solver import pywraplp
+    from ortools.sat.python import cp_model
+    import progress
+    import solver_config
+    import warm_start
+
+    lp_solve = pywraplp.Solver.Solve
+
+    def solve_lp_anytime(self, args):
+        with progress.watch_stop(_stop_event, self.InterruptSolve):
+            if not self.SolverVersion().startswith('SCIP'):
+                return lp_solve(self, *args)
+            with progress.scip_log_progress(self, progress.ProgressTracker(_report, 'pywraplp')):
+                return lp_solve(self, *args)
+
+    def solve_lp(self, *args):
+        if _hint is not None:
+            warm_start.apply_lp_hint(self, _hint)
+        if _config is not None and _config.portfolio:
+            status, self.portfolio_backend = solver_config.solve_portfolio(
+                self, _config, args, lp_solve, _stop_event if _report is not None else None, _report)
+        else:
+            if _config is not None:
+                solver_config.configure_lp(self, _config)
+                args = solver_config.lp_solve_args(args, _config)
+            status = solve_lp_anytime(self, args) if _report is not None else lp_solve(self, *args)
+        _solves.append(('pywraplp', self, None, status))
+        return status
+
+    # solve_ir() recognises the hook by __wrapped__ and lets it race IR models too
+    solve_lp.__wrapped__ = lp_solve
+    pywraplp.Solver.Solve = solve_lp
+
+    # Newer releases route Solve() and SolveWithSolutionCallback() through solve().
+    cp_name = 'solve' if hasattr(cp_model.CpSolver, 'solve') else 'Solve'
+    cp_solve = getattr(cp_model.CpSolver, cp_name)
+
+    def solve_cp_anytime(self, model, args, kwargs):
+        if not model.HasObjective():
+            with progress.watch_stop(_stop_event, self.StopSearch):
+                return cp_solve(self, model, *args, **kwargs)
+        tracker = progress.ProgressTracker(_report, 'cp_sat')
+        # A callback of the generated code's own takes precedence; bounds are still reported.
+        # The deprecated Solve() passes solution_callback=None positionally.
+        callback = args[0] if args else kwargs.get('solution_callback')
+        if callback is None:
+            args, kwargs = (), dict(kwargs, solution_callback=progress.cp_solution_callback(tracker))
+        previous = self.best_bound_callback
+
+        def on_bound(bound):
+            tracker.update(bound=bound)
+            if previous is not None:
+                previous(bound)
+
+        self.best_bound_callback = on_bound
+        try:
+            with progress.watch_stop(_stop_event, self.StopSearch):
+                return cp_solve(self, model, *args, **kwargs)
+        finally:
+            self.best_bound_callback = previous
+
+    def solve_cp(self, model, *args, **kwargs):
+        if _hint is not None:
+            warm_start.apply_cp_hint(model, _hint)
+        if _config is not None:
+            solver_config.configure_cp(self, _config)
+        if _report is not None:
+            status = solve_cp_anytime(self, model, args, kwargs)
+        else:
+            status = cp_solve(self, model, *args, **kwargs)
+        _solves.append(('cp_sat', self, model, status))
+        return status
+
+    setattr(cp_model.CpSolver, cp_name, solve_cp)
+
+
+def _warm_up():
+    from ortools.linear_solver import pywraplp  # noqa: F401
+    from ortools.sat.python import cp_model  # noqa: F401
+    _install_solve_hooks()
+
+
+def _lp_result(solver, status):
+    from ortools.linear_solver import pywraplp
+    names = {getattr(pywraplp.Solver, s): s for s in
+             ('OPTIMAL', 'FEASIBLE', 'INFEASIBLE', 'UNBOUNDED', 'ABNORMAL', 'MODEL_INVALID', 'NOT_SOLVED')}
+    portfolio_backend = getattr(solver, 'portfolio_backend', None)
+    result = SolveResult(f'pywraplp/{portfolio_backend}' if portfolio_backend else 'pywraplp',
+                         names.get(status, 'UNKNOWN') if status is not None else 'UNKNOWN',
+                         wall_time=solver.wall_time() / 1000.0)
+    variables = solver.variables()
+    result.names = [v.name() for v in variables]
+    if result.has_solution:
+        result.objective = solver.Objective().Value()
+        result.best_bound = solver.Objective().BestBound()
+        result.values = np.fromiter((v.solution_value() for v in variables), dtype=np.float64, count=len(variables)) + 0.0
+    else:
+        result.values = np.full(len(variables), np.nan)
+    return result
+
+
+def _cp_result(solver, model, status):
+    result = SolveResult('cp_sat', solver.StatusName(status), wall_time=solver.WallTime())
+    proto_vars = model.Proto().variables
+    result.names = [v.name or f"_v{i}" for i, v in enumerate(proto_vars)]
+    if result.has_solution:
+        if model.HasObjective():
+            result.objective = solver.ObjectiveValue()
+            result.best_bound = solver.BestObjectiveBound()
+        result.values = np.asarray(solver.ResponseProto().solution, dtype=np.float64)[:len(proto_vars)]
+    else:
+        result.values = np.full(len(proto_vars), np.nan)
+    return result
+
+
+def _collect_solve(exec_globals):
+    """
+    Structured result of the last Solve() made by the job. When none was
+    recorded, the job's globals are searched for solver objects instead.
+    """
+    from ortools.linear_solver import pywraplp
+    from ortools.sat.python import cp_model
+    if _solves:
+        backend, solver, model, status = _solves[-1]
+        return _lp_result(solver, status) if backend == 'pywraplp' else _cp_result(solver, model, status)
+    objects = list(exec_globals.values())
+    lp = [o for o in objects if isinstance(o, pywraplp.Solver)]
+    if lp:
+        return _lp_result(lp[-1], None)
+    cp_solvers = [o for o in objects if isinstance(o, cp_model.CpSolver)]
+    cp_models = [o for o in objects if isinstance(o, cp_model.CpModel)]
+    if cp_models:
+        result = SolveResult('cp_sat', 'UNKNOWN' if cp_solvers else 'NOT_SOLVED')
+        result.names = [v.name for v in cp_models[-1].Proto().variables]
+        result.values = np.full(len(result.names), np.nan)
+        return result
+    return None
+
+
+def _configured(run):
+    """Makes a runner take a trailing SolverConfig and hint that are active while it runs."""
+    def runner(*payload):
+        global _config, _hint
+        *args, _config, _hint = payload
+        try:
+            return run(*args)
+        finally:
+            _config = _hint = None
+    return runner
+
+
+def _run_job(code, datasets=None):
+    out = io.StringIO()
+    exec_globals = {'__name__': '__main__'}
+    del _solves[:]
+    start = time.perf_counter()
+    try:
+        if datasets:
+            import problem_data
+            exec_globals.update(problem_data.load_namespace(datasets))
+        with redirect_stdout(out):
+            exec(compile(code, '<generated>', 'exec'), exec_globals)
+    except MemoryError:
+        return ExecResult(False, out.getvalue(), "内存不足", traceback.format_exc(), time.perf_counter() - start)
+    except BaseException as e:
+        return ExecResult(False, out.getvalue(), f"{type(e).__name__}: {e}", traceback.format_exc(),
+                          time.perf_counter() - start)
+    elapsed = time.perf_counter() - start
+    try:
+        solve = _collect_solve(exec_globals)
+    except Exception:
+        solve = None
+    finally:
+        del _solves[:]
+    return ExecResult(True, out.getvalue(), elapsed=elapsed, solve=solve)
+
+
+def _run_ir(ir):
+    import model_ir
+    start = time.perf_counter()
+    try:
+        solve = model_ir.solve_ir(ir, config=_config)
+    except model_ir.IRValidationError as e:
+        return ExecResult(False, error=f"IR 校验失败：{e}", elapsed=time.perf_counter() - start)
+    except BaseException as e:
+        return ExecResult(False, error=f"{type(e).__name__}: {e}", traceback=traceback.format_exc(),
+                          elapsed=time.perf_counter() - start)
+    finally:
+        # CP models are solved through the hooked CpSolver, which records them
+        del _solves[:]
+    return ExecResult(True, model_ir.format_solution(solve), elapsed=time.perf_counter() - start, solve=solve)
+
+
+_RUNNERS = {'code': _configured(_run_job), 'ir': _configured(_run_ir)}
+
+
+def _worker_main(conn, stop_event):
+    global _report, _stop_event
+    import solver_config
+    _warm_up()
+    _stop_event = stop_event
+    # Progress is sent from solver threads while the main thread runs the job
+    send_lock = threading.Lock()
+
+    def send(msg):
+        with send_lock:
+            conn.send(msg)
+
+    send(('ready', os.getpid()))
+    while True:
+        try:
+            msg = conn.recv()
+        except EOFError:
+            break
+        if msg is None:
+            break
+        job_id, kind, payload, with_progress = msg
+        if with_progress:
+            _report = lambda point, job_id=job_id: send(('progress', job_id, point))
+        try:
+            result = _RUNNERS[kind](*payload)
+        finally:
+            _report = None
+        # Portfolio racers that could not be interrupted would steal the next job's CPU
+        send(('recycle' if solver_config.has_stragglers() else 'result', job_id, result))
+
+
+def _rss_mb(pid):
+    try:
+        with open(f'/proc/{pid}/statm') as f:
+            return int(f.read().split()[1]) * _PAGE_SIZE / (1024 * 1024)
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+class _Worker:
+    def __init__(self, ctx):
+        self.conn, child_conn = ctx.Pipe()
+        self.stop_event = ctx.Event()
+        self.process = ctx.Process(target=_worker_main, args=(child_conn, self.stop_event), daemon=True)
+        self.process.start()
+        child_conn.close()
+        try:
+            if not self.conn.poll(_START_TIMEOUT):
+                raise RuntimeError(f"工作进程 {_START_TIMEOUT} 秒内未就绪")
+            self.conn.recv()
+        except EOFError:
+            self.process.join(5)
+            exitcode = self.process.exitcode
+            self.kill()
+            raise RuntimeError(f"工作进程启动失败（exit code {exitcode}）") from None
+        except BaseException:
+            self.kill()
+            raise
+
+    def kill(self):
+        self.process.kill()
+        self.process.join()
+        self.conn.close()
+
+    def close(self):
+        try:
+            self.conn.send(None)
+        except (OSError, BrokenPipeError):
+            pass
+        self.process.join(1)
+        if self.process.is_alive():
+            self.kill()
+
+
+class ExecutionPool:
+    """
+    Runs generated code in a pool of pre-warmed worker processes.
+    submit() returns a concurrent.futures.Future resolving to an ExecResult.
+    """
+
+    def __init__(self, workers=DEFAULT_WORKERS, timeout=DEFAULT_TIMEOUT, memory_mb=DEFAULT_MEMORY_MB):
+        self.timeout = timeout
+        self.memory_mb = memory_mb
+        self._ctx = multiprocessing.get_context('spawn')
+        self._jobs = queue.Queue()
+        self._next_id = 0
+        self._id_lock = threading.Lock()
+        self._closed = False
+        self._threads = []
+        # future -> worker running it, and futures asked to stop before they started
+        self._running = {}
+        self._stopping = set()
+        self._running_lock = threading.Lock()
+        for i in range(max(1, workers)):
+            t = threading.Thread(target=self._dispatch, name=f'exec-dispatch-{i}', daemon=True)
+            t.start()
+            self._threads.append(t)
+
+    def submit(self, code, timeout=None, memory_mb=None, datasets=None, solver_config=None, hint=None,
+               on_progress=None):
+        """
+        Runs code in a worker. datasets (problem_data.DatasetRef objects) are
+        memory-mapped into the job's globals under their names; solver_config
+        (solver_config.SolverConfig) is applied to every Solve() the code makes,
+        and hint, a previous solution as (names, values), warm-starts them.
+        on_progress(point) receives anytime progress (progress.py) on a pool
+        thread while the solve runs, and makes the job stoppable with stop().
+        """
+        pairs = [(ref.name, ref.path) for ref in datasets or []]
+        return self._submit('code', (code, pairs), timeout, memory_mb, solver_config, hint, on_progress)
+
+    def submit_ir(self, ir, timeout=None, memory_mb=None, solver_config=None, on_progress=None):
+        """Builds and solves a model_ir IR in a worker instead of running code."""
+        return self._submit('ir', (ir,), timeout, memory_mb, solver_config, None, on_progress)
+
+    def run(self, code, timeout=None, memory_mb=None, datasets=None, solver_config=None, hint=None,
+            on_progress=None):
+        return self.submit(code, timeout, memory_mb, datasets, solver_config, hint, on_progress).result()
+
+    def stop(self, future):
+        """
+        Interrupts the solve of a job submitted with on_progress. The solver
+        returns its best solution so far and the job finishes normally, with
+        ExecResult.stopped set. A job still queued is stopped when it starts.
+        """
+        with self._running_lock:
+            worker = self._running.get(future)
+            if worker is None and not future.done():
+                self._stopping.add(future)
+            elif worker is not None:
+                worker.stop_event.set()
+
+    def _submit(self, kind, payload, timeout, memory_mb, solver_config=None, hint=None, on_progress=None):
+        if self._closed:
+            raise RuntimeError("ExecutionPool is shut down")
+        if solver_config is not None and solver_config.is_default:
+            solver_config = None
+        if timeout is None:
+            timeout = self.timeout
+            if solver_config is not None and solver_config.time_limit:
+                # Leave room for model building and one full-length solve
+                timeout = max(timeout, solver_config.time_limit + 30)
+        future = Future()
+        with self._id_lock:
+            self._next_id += 1
+            job_id = self._next_id
+        self._jobs.put((job_id, kind, payload + (solver_config, hint), timeout, memory_mb or self.memory_mb, future,
+                        on_progress))
+        return future
+
+    def shutdown(self):
+        self._closed = True
+        for _ in self._threads:
+            self._jobs.put(None)
+        for t in self._threads:
+            t.join(5)
+
+    def _start_worker(self):
+        """(worker, None), or (None, error) when the worker cannot start."""
+        try:
+            return _Worker(self._ctx), None
+        except Exception as e:
+            return None, e
+
+    def _dispatch(self):
+        worker, error = self._start_worker()
+        failures = 0
+        while True:
+            job = self._jobs.get()
+            if job is None:
+                if worker is not None:
+                    worker.close()
+                return
+            job_id, kind, payload, timeout, memory_mb, future, on_progress = job
+            if not future.set_running_or_notify_cancel():
+                continue
+            if worker is None:
+                # Back off between respawns so that a persistent failure does not spin
+                time.sleep(min(_RESPAWN_BACKOFF_MAX, 0.5 * 2 ** failures) if failures else 0)
+                worker, error = self._start_worker()
+            if worker is None:
+                failures += 1
+                with self._running_lock:
+                    self._stopping.discard(future)
+                future.set_result(ExecResult(False, error=f"执行引擎错误：{error}"))
+                continue
+            failures = 0
+            worker.stop_event.clear()
+            with self._running_lock:
+                self._running[future] = worker
+                if future in self._stopping:
+                    self._stopping.discard(future)
+                    worker.stop_event.set()
+            try:
+                result, healthy = self._run_on(worker, (job_id, kind, payload, on_progress is not None), timeout,
+                                               memory_mb, on_progress)
+            except Exception as e:
+                result, healthy = ExecResult(False, error=f"执行引擎错误：{e}"), False
+            with self._running_lock:
+                del self._running[future]
+            result.stopped = worker.stop_event.is_set()
+            future.set_result(result)
+            if not healthy:
+                worker.kill()
+                worker, error = self._start_worker()
+                if worker is None:
+                    failures += 1
+
+    def _run_on(self, worker, msg, timeout, memory_mb, on_progress=None):
+        start = time.perf_counter()
+        worker.conn.send(msg)
+        while True:
+            while not worker.conn.poll(_POLL_INTERVAL):
+                elapsed = time.perf_counter() - start
+                if elapsed > timeout:
+                    return ExecResult(False, error=f"超出时间限制（{timeout:g} 秒）", elapsed=elapsed,
+                                      timed_out=True), False
+                rss = _rss_mb(worker.process.pid)
+                if rss is not None and rss > memory_mb:
+                    return ExecResult(False, error=f"超出内存限制（{memory_mb} MB）", elapsed=elapsed), False
+                if not worker.process.is_alive():
+                    return ExecResult(False, error=f"工作进程异常退出（exit code {worker.process.exitcode}）",
+                                      elapsed=elapsed), False
+            try:
+                kind, _, payload = worker.conn.recv()
+            except EOFError:
+                worker.process.join(1)
+                return ExecResult(False, error=f"工作进程异常退出（exit code {worker.process.exitcode}）",
+                                  elapsed=time.perf_counter() - start), False
+            if kind in ('result', 'recycle'):
+                # 'recycle': the result is valid, but the worker must be replaced
+                return payload, kind == 'result'
+            if on_progress is not None:
+                try:
+                    on_progress(payload)
+                except Exception:
+                    pass
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    """Process-wide shared pool, created on first use."""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ExecutionPool()
+            atexit.register(_pool.shutdown)
+        return _pool
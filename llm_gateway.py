@@ -0,0 +1,314 @@
+"""
+Shared gateway for every LLM request the process makes.
+
+All streams run on one background event loop (run_async) through a single
+AsyncOpenAI client, so the limits below hold across threads, Streamlit
+sessions and service jobs:
+ - a token bucket caps how fast new upstream requests start (ORTOOLS_LLM_RATE
+   per second, bursts of ORTOOLS_LLM_BURST) and a semaphore caps the streams
+   open at once (ORTOOLS_LLM_MAX_STREAMS);
+ - connect and read timeouts bound a hung connection or a stalled stream
+   (ORTOOLS_LLM_TIMEOUT, ORTOOLS_LLM_IDLE_TIMEOUT);
+ - 429s, 5xx answers, timeouts and dropped connections are retried up to
+   ORTOOLS_LLM_MAX_RETRIES times with full-jitter exponential backoff,
+   honouring Retry-After. A retry always starts a fresh stream; when the
+   broken one had already produced output, callers get a restart event:
+   the returned text is that of the fresh stream alone, and streaming
+   callbacks see RESTART_NOTICE before the new output;
+ - single flight: identical requests (model, messages, thinking, stop rule)
+   issued while one is in flight join it instead of opening another stream.
+   A late joiner first receives the chunks already streamed, then follows
+   live; the upstream stream is closed once every caller has left.
+"""
+import asyncio
+import hashlib
+import json
+import os
+import queue
+import random
+import threading
+import time
+
+import openai
+
+from metrics import REGISTRY
+
+RATE = float(os.environ.get('ORTOOLS_LLM_RATE', 4.0))
+BURST = int(os.environ.get('ORTOOLS_LLM_BURST', 16))
+MAX_STREAMS = int(os.environ.get('ORTOOLS_LLM_MAX_STREAMS', 32))
+MAX_RETRIES = int(os.environ.get('ORTOOLS_LLM_MAX_RETRIES', 4))
+# Seconds to establish a connection, and of silence tolerated while waiting for the next chunk
+CONNECT_TIMEOUT = float(os.environ.get('ORTOOLS_LLM_TIMEOUT', 15.0))
+IDLE_TIMEOUT = float(os.environ.get('ORTOOLS_LLM_IDLE_TIMEOUT', 120.0))
+BACKOFF_BASE = 0.5
+BACKOFF_MAX = 30.0
+
+RESTART_NOTICE = "\n\n[连接中断，正在重新生成...]\n\n"
+
+REGISTRY.describe('ortools_llm_requests', 'counter', "Upstream LLM streams opened, by model.")
+REGISTRY.describe('ortools_llm_retries', 'counter', "Upstream LLM streams retried, by error type.")
+REGISTRY.describe('ortools_llm_coalesced', 'counter', "LLM requests served by joining an identical one in flight.")
+
+_loop = None
+_loop_lock = threading.Lock()
+
+
+def run_async(coro):
+    """
+    Schedules a coroutine on the background event loop that owns the gateway
+    and returns a concurrent.futures.Future for its result.
+    """
+    global _loop
+    with _loop_lock:
+        if _loop is None:
+            _loop = asyncio.new_event_loop()
+            threading.Thread(target=_loop.run_forever, name='llm-async-loop', daemon=True).start()
+    return asyncio.run_coroutine_threadsafe(coro, _loop)
+
+
+def timeout():
+    """Client timeout for LLM requests: the read timeout bounds the gap between streamed chunks."""
+    return openai.Timeout(IDLE_TIMEOUT, connect=CONNECT_TIMEOUT)
+
+
+def is_retryable(exc):
+    """Rate limits, server errors, timeouts and broken connections; not bad requests or auth failures."""
+    # Timeouts and connections dropped mid-stream also surface as APIConnectionError
+    if isinstance(exc, openai.APIConnectionError):
+        return True
+    if isinstance(exc, openai.APIStatusError):
+        return exc.status_code in (408, 409, 429) or exc.status_code >= 500
+    return False
+
+
+def backoff_delay(attempt, exc=None):
+    """Full-jitter exponential backoff; a Retry-After header sets the minimum."""
+    delay = random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt))
+    response = getattr(exc, 'response', None)
+    if response is not None:
+        try:
+            delay = max(delay, float(response.headers.get('retry-after')))
+        except (TypeError, ValueError):
+            pass
+    return delay
+
+
+class TokenBucket:
+    """Allows `rate` acquisitions per second on average and up to `burst` at once; event loop only."""
+
+    def __init__(self, rate=RATE, burst=BURST):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self._updated = time.monotonic()
+
+    async def acquire(self):
+        while True:
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return
+            await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+class _Flight:
+    """One upstream stream and the callers reading it. Touched on the event loop only."""
+
+    def __init__(self, key):
+        self.key = key
+        # Events of the current attempt, replayed to callers that join late
+        self.events = []
+        self.subscribers = []
+
+    def publish(self, event):
+        if event[0] == "restart":
+            self.events.clear()
+        elif event[0] in ("reasoning", "content"):
+            self.events.append(event)
+        for deliver in list(self.subscribers):
+            deliver(event)
+
+
+class _Reader:
+    """Turns flight events into caller callbacks and the final text."""
+
+    def __init__(self, on_reasoning=None, on_content=None):
+        self.on_reasoning = on_reasoning
+        self.on_content = on_content
+        self.content = ""
+        self.last_kind = None
+
+    def handle(self, kind, payload):
+        """Returns True once the stream has ended; self.content is then the final text."""
+        if kind == "reasoning":
+            self.last_kind = kind
+            if self.on_reasoning:
+                self.on_reasoning(payload)
+        elif kind == "content":
+            self.last_kind = kind
+            self.content += payload
+            if self.on_content:
+                self.on_content(payload)
+        elif kind == "restart":
+            self.content = ""
+            callback = self.on_content if self.last_kind == "content" else self.on_reasoning
+            if self.last_kind is not None and callback:
+                callback(RESTART_NOTICE)
+        elif kind == "error":
+            raise payload
+        elif kind == "end":
+            self.content = payload
+            return True
+        return False
+
+
+class LLMGateway:
+    """
+    Rate-limited, retrying, coalescing access to chat completions streams.
+    stop_extractor(languages) builds an object whose feed(chunk) returns True
+    once the content holds everything the caller needs (e.g. a closed code
+    block); the stream is then closed early.
+    """
+
+    def __init__(self, client, stop_extractor=None, rate=RATE, burst=BURST, max_streams=MAX_STREAMS,
+                 max_retries=MAX_RETRIES):
+        self.client = client
+        self.stop_extractor = stop_extractor
+        self.bucket = TokenBucket(rate, burst)
+        self.max_retries = max_retries
+        self._streams = asyncio.Semaphore(max_streams)
+        self._flights = {}
+
+    @staticmethod
+    def request_key(model_id, messages, enable_thinking, stop_languages):
+        raw = json.dumps([model_id, messages, enable_thinking, stop_languages], ensure_ascii=False, sort_keys=True)
+        return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+    def _join(self, request, deliver, coalesce):
+        key = self.request_key(*request) if coalesce else None
+        flight = self._flights.get(key) if key is not None else None
+        if flight is not None:
+            REGISTRY.inc('ortools_llm_coalesced', model=request[0])
+            for event in flight.events:
+                deliver(event)
+            flight.subscribers.append(deliver)
+            return flight
+        flight = _Flight(key)
+        flight.subscribers.append(deliver)
+        if key is not None:
+            self._flights[key] = flight
+        asyncio.ensure_future(self._upstream(flight, *request))
+        return flight
+
+    def _leave(self, flight, deliver):
+        if deliver in flight.subscribers:
+            flight.subscribers.remove(deliver)
+        # Nobody may join a stream that is about to be dropped
+        if not flight.subscribers and self._flights.get(flight.key) is flight:
+            del self._flights[flight.key]
+
+    def _close(self, flight, event):
+        if self._flights.get(flight.key) is flight:
+            del self._flights[flight.key]
+        flight.publish(event)
+
+    async def _upstream(self, flight, model_id, messages, enable_thinking, stop_languages):
+        attempt = 0
+        while True:
+            produced = False
+            try:
+                async with self._streams:
+                    await self.bucket.acquire()
+                    REGISTRY.inc('ortools_llm_requests', model=model_id)
+                    response = await self.client.chat.completions.create(
+                        model=model_id,
+                        messages=messages,
+                        stream=True,
+                        extra_body={"enable_thinking": enable_thinking},
+                    )
+                    full = ""
+                    extractor = self.stop_extractor(stop_languages) if stop_languages else None
+                    try:
+                        async for chunk in response:
+                            # Every caller has gone (cancelled or stopped early)
+                            if not flight.subscribers:
+                                break
+                            if not chunk.choices:
+                                continue
+                            delta = chunk.choices[0].delta
+                            rc = getattr(delta, 'reasoning_content', None)
+                            if rc:
+                                produced = True
+                                flight.publish(("reasoning", rc))
+                            c = getattr(delta, 'content', None)
+                            if c:
+                                produced = True
+                                full += c
+                                flight.publish(("content", c))
+                                if extractor and extractor.feed(c):
+                                    break
+                    finally:
+                        await response.close()
+            except Exception as e:
+                if not is_retryable(e) or attempt >= self.max_retries or not flight.subscribers:
+                    self._close(flight, ("error", e))
+                    return
+                attempt += 1
+                REGISTRY.inc('ortools_llm_retries', error=type(e).__name__)
+                if produced:
+                    flight.publish(("restart", None))
+                await asyncio.sleep(backoff_delay(attempt, e))
+                continue
+            self._close(flight, ("end", full))
+            return
+
+    async def astream(self, model_id, messages, enable_thinking, on_reasoning=None, on_content=None,
+                      stop_languages=None, coalesce=True):
+        """Streams one completion; callbacks run on the event loop thread. Returns the content."""
+        reader = _Reader(on_reasoning, on_content)
+        done = asyncio.get_running_loop().create_future()
+
+        def deliver(event):
+            if done.done():
+                return
+            try:
+                if reader.handle(*event):
+                    done.set_result(reader.content)
+            except Exception as e:
+                done.set_exception(e)
+
+        request = (model_id, messages, enable_thinking, tuple(stop_languages) if stop_languages else None)
+        flight = self._join(request, deliver, coalesce)
+        try:
+            return await done
+        finally:
+            self._leave(flight, deliver)
+
+    def stream(self, model_id, messages, enable_thinking, on_reasoning=None, on_content=None, stop_languages=None,
+               coalesce=True, cancel_event=None):
+        """
+        Blocking variant of astream for worker threads; callbacks run on the
+        calling thread. Setting cancel_event (a threading.Event) leaves the
+        stream and returns the content received so far.
+        """
+        events = queue.Queue()
+        reader = _Reader(on_reasoning, on_content)
+        request = (model_id, messages, enable_thinking, tuple(stop_languages) if stop_languages else None)
+
+        async def join():
+            return self._join(request, events.put, coalesce)
+
+        flight = run_async(join()).result()
+        try:
+            while not (cancel_event is not None and cancel_event.is_set()):
+                try:
+                    event = events.get(timeout=0.05)
+                except queue.Empty:
+                    continue
+                if reader.handle(*event):
+                    break
+            return reader.content
+        finally:
+            _loop.call_soon_threadsafe(self._leave, flight, events.put)
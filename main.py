@@ -1,19 +1,46 @@
+import argparse
+import asyncio
+import csv
+import hashlib
+import json
+import os
+import queue
 import re
-import sys
-from openai import OpenAI
+import sqlite3
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+from openai import AsyncOpenAI
 
-# Initialize the client as per user instruction
-client = OpenAI(
-    base_url='https://api-inference.modelscope.cn/v1',
-    api_key='ms-2d143f6e-cad4-45fe-a19f-3ba1d458028c', # ModelScope Token
+from code_check import analyze, failing_line, get_snippet, replace_lines, sanitize_code, snippet_bounds
+from consensus import run_candidates
+from executor import get_pool
+from llm_gateway import LLMGateway, run_async, timeout as llm_timeout
+from metrics import Trace, configure as configure_metrics
+from model_ir import IR_SYSTEM_PROMPT, extract_ir, validate_ir
+from problem_data import parse_data_args, with_datasets
+from problem_router import route_problem
+from result_summary import local_summary
+from run_store import RunStore
+from solver_config import SolverConfig
+
+# Overridable so that the pipeline can run against a local stub (see bench/)
+LLM_BASE_URL = os.environ.get('ORTOOLS_LLM_BASE_URL', 'https://api-inference.modelscope.cn/v1')
+LLM_API_KEY = os.environ.get('ORTOOLS_LLM_API_KEY', 'ms-2d143f6e-cad4-45fe-a19f-3ba1d458028c') # ModelScope Token
+
+# Shared async client: a single instance keeps one pooled, keep-alive
+# connection set, so it is only ever used from the gateway's event loop.
+# Retries are the gateway's job (llm_gateway), so the client's own are off.
+async_client = AsyncOpenAI(
+    base_url=LLM_BASE_URL,
+    api_key=LLM_API_KEY,
+    timeout=llm_timeout(),
+    max_retries=0,
 )
 
-def get_ortools_code(problem_description, model_id):
-    """
-    Sends the problem description to the LLM and retrieves the OR-Tools Python code.
-    """
-    
-    system_prompt = """你是 Google OR-Tools 专家。
+SYSTEM_PROMPT = """你是 Google OR-Tools 专家。
 你的任务是把自然语言的优化问题翻译为可执行的 Python 代码，使用 Google OR-Tools。
 
 For Linear Programming (LP) or Mixed Integer Programming (MIP) problems (like "maximize 3x+4y..." or "knapsack problem"):
@@ -50,119 +77,314 @@ For Constraint Programming (CP) problems (like logic puzzles, scheduling):
  - 明确打印目标值（如适用）和所有变量取值。
 """
 
-    extra_body = {
-        "enable_thinking": True
-    }
+STRICT_SYSTEM_PROMPT = """只输出 OR-Tools 可执行 Python 代码，并用 ```python 包裹。不要任何解释。
+线性/整数规划：使用 pywraplp（GLOP/SCIP）；离散约束：使用 cp_model。打印目标值与所有变量。"""
+
+CODE_CACHE_PATH = os.environ.get(
+    'ORTOOLS_CODE_CACHE',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), '.cache', 'code_cache.sqlite3'),
+)
 
-    print("正在思考...")
-    response = client.chat.completions.create(
-        model=model_id,
-        messages=[
-            {
-                'role': 'system',
-                'content': system_prompt
-            },
-            {
-                'role': 'user',
-                'content': problem_description
-            }
-        ],
-        stream=True,
-        extra_body=extra_body
+def normalize_problem(problem_description):
+    """
+    Canonical form of a problem text used for cache keys: full-width characters
+    are folded (NFKC), whitespace runs collapse, spaces next to punctuation or
+    CJK characters are dropped and trailing sentence punctuation is stripped.
+    """
+    text = unicodedata.normalize('NFKC', problem_description)
+    text = text.replace('。', '.').replace('、', ',')
+    text = re.sub(r"\s+", " ", text).strip()
+    text = re.sub(r"\s*([^\w\s])\s*", r"\1", text)
+    text = re.sub(r"(?<=[^\x00-\x7f]) | (?=[^\x00-\x7f])", "", text)
+    return text.rstrip('.!?;')
+
+def prompt_version(system_prompt):
+    return hashlib.sha256(system_prompt.encode('utf-8')).hexdigest()[:16]
+
+class CodeCache:
+    """
+    On-disk LRU cache of extracted, sanitized OR-Tools code.
+    Entries are keyed by model id, system prompt hash and normalized problem
+    text; the least recently used ones are evicted once either max_entries or
+    max_bytes is exceeded.
+    """
+
+    def __init__(self, path=CODE_CACHE_PATH, max_entries=2000, max_bytes=64 * 1024 * 1024):
+        self.path = path
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS code_cache ("
+                " key TEXT PRIMARY KEY, model_id TEXT, prompt_version TEXT,"
+                " code TEXT, size INTEGER, created REAL, last_access REAL, hit_count INTEGER DEFAULT 0)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS code_cache_lru ON code_cache (last_access)")
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=30)
+
+    @staticmethod
+    def make_key(model_id, system_prompt, problem_description):
+        raw = "\x1f".join([model_id, prompt_version(system_prompt), normalize_problem(problem_description)])
+        return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+    def get(self, model_id, system_prompt, problem_description):
+        key = self.make_key(model_id, system_prompt, problem_description)
+        with self._lock, self._connect() as conn:
+            row = conn.execute("SELECT code FROM code_cache WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            conn.execute(
+                "UPDATE code_cache SET last_access = ?, hit_count = hit_count + 1 WHERE key = ?",
+                (time.time(), key),
+            )
+            self.hits += 1
+            return row[0]
+
+    def put(self, model_id, system_prompt, problem_description, code):
+        key = self.make_key(model_id, system_prompt, problem_description)
+        now = time.time()
+        with self._lock, self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO code_cache (key, model_id, prompt_version, code, size, created, last_access)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (key, model_id, prompt_version(system_prompt), code, len(code.encode('utf-8')), now, now),
+            )
+            self._evict(conn)
+
+    def delete(self, model_id, system_prompt, problem_description):
+        key = self.make_key(model_id, system_prompt, problem_description)
+        with self._lock, self._connect() as conn:
+            conn.execute("DELETE FROM code_cache WHERE key = ?", (key,))
+
+    def _evict(self, conn):
+        count, total = conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM code_cache").fetchone()
+        if count <= self.max_entries and total <= self.max_bytes:
+            return
+        rows = conn.execute("SELECT key, size FROM code_cache ORDER BY last_access ASC").fetchall()
+        victims = []
+        for key, size in rows:
+            if count <= self.max_entries and total <= self.max_bytes:
+                break
+            victims.append((key,))
+            count -= 1
+            total -= size
+        conn.executemany("DELETE FROM code_cache WHERE key = ?", victims)
+
+    def clear(self):
+        with self._lock, self._connect() as conn:
+            conn.execute("DELETE FROM code_cache")
+        self.hits = self.misses = 0
+
+    def stats(self):
+        with self._connect() as conn:
+            count, total = conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM code_cache").fetchone()
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "entries": count,
+            "bytes": total,
+        }
+
+code_cache = CodeCache()
+# LLM summaries, keyed by problem text plus a hash of the solver output (see asummarize_result)
+summary_cache = CodeCache(os.environ.get(
+    'ORTOOLS_SUMMARY_CACHE', os.path.join(os.path.dirname(CODE_CACHE_PATH), 'summary_cache.sqlite3')))
+# Every finished run of the CLI and the app (see run_store)
+history = RunStore(normalize=normalize_problem)
+
+# Cache key of every recent generated output: output -> (model_id, system_prompt, problem, from_cache).
+# Code is only cached once it has run cleanly, so the key is kept until the caller reports the outcome.
+GENERATED_KEYS_LIMIT = 1024
+_generated = OrderedDict()
+_generated_lock = threading.Lock()
+
+def _note_generation(output, model_id, system_prompt, problem_description, from_cache):
+    with _generated_lock:
+        _generated[output] = (model_id, system_prompt, problem_description, from_cache)
+        _generated.move_to_end(output)
+        while len(_generated) > GENERATED_KEYS_LIMIT:
+            _generated.popitem(last=False)
+
+def cache_outcome(llm_output, ok, code=None):
+    """
+    Reports how the program generated as llm_output ran. After a clean run
+    `code` (the final program, including any repairs; the IR JSON for
+    get_model_ir) is cached for the next identical problem; a cached program
+    that failed is evicted. Outputs generated without the cache are ignored.
+    """
+    with _generated_lock:
+        key = _generated.pop(llm_output, None) if llm_output else None
+    if key is None:
+        return
+    model_id, system_prompt, problem_description, from_cache = key
+    if ok and code:
+        code_cache.put(model_id, system_prompt, problem_description, code)
+    elif not ok and from_cache:
+        code_cache.delete(model_id, system_prompt, problem_description)
+
+def _cache_lookup(problem_description, model_id, system_prompt):
+    """
+    code_cache hit as a fenced block (so extract_code works unchanged), or
+    None. Blocking sqlite I/O: async callers run it in an executor.
+    """
+    cached = code_cache.get(model_id, system_prompt, problem_description)
+    if cached is None:
+        return None
+    output = f"```python\n{cached}\n```"
+    _note_generation(output, model_id, system_prompt, problem_description, True)
+    return output
+
+def _generated_output(output, problem_description, model_id, system_prompt):
+    if extract_code(output):
+        _note_generation(output, model_id, system_prompt, problem_description, False)
+    return output
+
+def _cached_generation(problem_description, model_id, system_prompt, generate, on_content=None, use_cache=True):
+    """
+    Serves generation from code_cache when possible; otherwise runs generate().
+    Nothing is stored here: the caller reports the run with cache_outcome.
+    """
+    if not use_cache:
+        return generate()
+    output = _cache_lookup(problem_description, model_id, system_prompt)
+    if output is not None:
+        if on_content:
+            on_content(output)
+        return output
+    return _generated_output(generate(), problem_description, model_id, system_prompt)
+
+def get_ortools_code(problem_description, model_id, use_cache=True):
+    """
+    Sends the problem description to the LLM and retrieves the OR-Tools Python code.
+    Repeated problems are answered from code_cache without calling the LLM.
+    """
+    def on_hit(output):
+        print("命中代码缓存，跳过 LLM 生成。\n")
+
+    return _cached_generation(
+        problem_description, model_id, SYSTEM_PROMPT,
+        lambda: _get_ortools_code(problem_description, model_id),
+        on_content=on_hit, use_cache=use_cache,
     )
 
-    full_content = ""
+def _get_ortools_code(problem_description, model_id, stop_on_code=True):
+    print("正在思考...")
     done_thinking = False
-    
-    for chunk in response:
-        # Check for reasoning content (thinking)
-        if hasattr(chunk.choices[0].delta, 'reasoning_content'):
-            thinking_chunk = chunk.choices[0].delta.reasoning_content
-            if thinking_chunk:
-                print(thinking_chunk, end='', flush=True)
-        
-        # Check for actual content
-        if hasattr(chunk.choices[0].delta, 'content'):
-            answer_chunk = chunk.choices[0].delta.content
-            if answer_chunk:
-                if not done_thinking:
-                    print('\n\n === 最终答案 ===\n')
-                    done_thinking = True
-                print(answer_chunk, end='', flush=True)
-                full_content += answer_chunk
-                
+
+    def on_reasoning(thinking_chunk):
+        print(thinking_chunk, end='', flush=True)
+
+    def on_content(answer_chunk):
+        nonlocal done_thinking
+        if not done_thinking:
+            print('\n\n === 最终答案 ===\n')
+            done_thinking = True
+        print(answer_chunk, end='', flush=True)
+
+    # Stop paying for trailing tokens once the code block is closed
+    full_content = gateway.stream(
+        model_id,
+        [
+            {'role': 'system', 'content': SYSTEM_PROMPT},
+            {'role': 'user', 'content': problem_description},
+        ],
+        True, on_reasoning, on_content,
+        stop_languages=('python', 'py') if stop_on_code else None,
+    )
     print("\n")
     return full_content
 
-def get_ortools_code_stream(problem_description, model_id, on_reasoning=None, on_content=None):
+def get_ortools_code_stream(problem_description, model_id, on_reasoning=None, on_content=None, use_cache=True,
+                            stop_on_code=True, cancel_event=None):
     """
     Stream OR-Tools code generation with real-time callbacks.
     on_reasoning(chunk: str) and on_content(chunk: str) will be called as data arrives.
     Returns the final concatenated assistant content for downstream code extraction.
+    On a cache hit on_content receives the cached code block in a single call.
+    With stop_on_code the HTTP stream is closed as soon as a python block is complete;
+    setting cancel_event (a threading.Event) abandons the stream right away.
     """
-    system_prompt = """你是 Google OR-Tools 专家。
-你的任务是把自然语言的优化问题翻译为可执行的 Python 代码，使用 Google OR-Tools。
-
-For Linear Programming (LP) or Mixed Integer Programming (MIP) problems (like "maximize 3x+4y..." or "knapsack problem"):
-- Use `from ortools.linear_solver import pywraplp`
-- Create solver: `solver = pywraplp.Solver.CreateSolver('GLOP')` (for LP/Continuous) or `solver = pywraplp.Solver.CreateSolver('SCIP')` (for MIP/Integer/Binary).
-- Define variables: 
-    - Continuous: `x = solver.NumVar(0, solver.infinity(), 'x')`
-    - Integer: `x = solver.IntVar(0, 10, 'x')`
-    - Binary (0 or 1): `x = solver.BoolVar('x')`
-- Add constraints: `solver.Add(2*x + 3*y <= 10)`
-- Objective: `solver.Maximize(3*x + 4*y)`
-- Solve: `status = solver.Solve()`
-- Check status: `if status == pywraplp.Solver.OPTIMAL:`
-- Print solution: `print('Objective value =', solver.Objective().Value())`; `print('x =', x.solution_value())`
-
-Common Patterns:
-- "Select items to maximize value within capacity" (Knapsack): Use MIP (SCIP). Constraint `sum(w[i]*x[i]) <= C`.
-- "Assignment problem" (workers to tasks): Use MIP (SCIP) or CP.
-- "Distinct values", "Not equal", "Sudoku", "Scheduling", "Logic Puzzle": MUST use CP (`cp_model`). `pywraplp` DOES NOT support `!=`.
-
-For Constraint Programming (CP) problems (like logic puzzles, scheduling):
-- Use `from ortools.sat.python import cp_model`
-- Create model: `model = cp_model.CpModel()`
-- Define vars: `x = model.NewIntVar(0, 10, 'x')`
-- Add constraints: `model.Add(x != y)`
-- Solve: `solver = cp_model.CpSolver(); status = solver.Solve(model)`
-- Check status: `if status == cp_model.OPTIMAL or status == cp_model.FEASIBLE:`
-- Print solution: `print('x =', solver.Value(x))` (Print ALL variables)
-
- 规则：
- - 只输出被 ```python 包裹的代码块。
- - 代码块外不要有任何解释文字。
- - 假设所有输入数据均在脚本中硬编码。
- - 明确打印目标值（如适用）和所有变量取值。
-"""
+    return _cached_generation(
+        problem_description, model_id, SYSTEM_PROMPT,
+        lambda: _get_ortools_code_stream(problem_description, model_id, on_reasoning, on_content, stop_on_code,
+                                         cancel_event),
+        on_content=on_content, use_cache=use_cache,
+    )
 
-    extra_body = {"enable_thinking": True}
-    response = client.chat.completions.create(
-        model=model_id,
-        messages=[
+def _get_ortools_code_stream(problem_description, model_id, on_reasoning=None, on_content=None, stop_on_code=True,
+                             cancel_event=None, system_prompt=SYSTEM_PROMPT, fence_languages=('python', 'py'),
+                             enable_thinking=True):
+    return gateway.stream(
+        model_id,
+        [
             {"role": "system", "content": system_prompt},
             {"role": "user", "content": problem_description},
         ],
-        stream=True,
-        extra_body=extra_body,
+        enable_thinking, on_reasoning, on_content,
+        stop_languages=fence_languages if stop_on_code else None,
+        cancel_event=cancel_event,
     )
 
-    full_content = ""
-    for chunk in response:
-        # Real-time reasoning
-        if hasattr(chunk.choices[0].delta, 'reasoning_content'):
-            rc = chunk.choices[0].delta.reasoning_content
-            if rc and on_reasoning:
-                on_reasoning(rc)
-        # Real-time content
-        if hasattr(chunk.choices[0].delta, 'content'):
-            c = chunk.choices[0].delta.content
-            if c:
-                if on_content:
-                    on_content(c)
-                full_content += c
-    return full_content
+class StreamingCodeExtractor:
+    """
+    Incremental counterpart of extract_code for streamed content.
+    feed() takes content chunks and returns True once a ```python (or ```py)
+    block has been closed, at which point the rest of the stream can be
+    dropped. code() applies extract_code's rule to the blocks seen so far:
+    python blocks first, then py, then any fence, longest block wins.
+    """
+
+    _OPEN = re.compile(r"```[ \t]*([A-Za-z0-9_+-]*)[ \t]*\r?\n")
+
+    def __init__(self, languages=('python', 'py')):
+        self.languages = languages
+        self.buffer = ""
+        self.blocks = []
+        self.done = False
+        self._search_from = 0
+        self._body_start = None
+        self._lang = None
+        self._close_from = 0
+
+    def feed(self, chunk):
+        self.buffer += chunk
+        while True:
+            if self._body_start is None:
+                m = self._OPEN.search(self.buffer, self._search_from)
+                if not m:
+                    break
+                self._body_start = self._close_from = m.end()
+                self._lang = m.group(1).lower()
+            end = self.buffer.find("```", self._close_from)
+            if end < 0:
+                # Keep two characters back in case the fence is split across chunks.
+                self._close_from = max(self._body_start, len(self.buffer) - 2)
+                break
+            self.blocks.append((self._lang, self.buffer[self._body_start:end]))
+            if self._lang in self.languages:
+                self.done = True
+            self._body_start = None
+            self._search_from = end + 3
+        return self.done
+
+    def code(self):
+        for langs in (('python',), ('py',), None):
+            candidates = [b for lang, b in self.blocks if langs is None or lang in langs]
+            if candidates:
+                return max(candidates, key=len).strip()
+        return None
+
+# Every LLM request of the process: rate limit, retries and single flight (see llm_gateway)
+gateway = LLMGateway(async_client, stop_extractor=StreamingCodeExtractor)
 
 def extract_code(llm_output):
     """
@@ -181,99 +403,852 @@ def extract_code(llm_output):
             return code
     return None
 
-def sanitize_code(code: str) -> str:
-    if ('from ortools.sat.python import cp_model' in code) or ('cp_model.' in code):
-        import re as _re
-        m = _re.search(r"([A-Za-z_][A-Za-z0-9_]*)\s*=\s*cp_model\.CpModel\(\)", code)
-        model_var = m.group(1) if m else 'model'
-        if 'CpSolver' not in code:
-            if m:
-                insert_pos = m.end()
-                code = code[:insert_pos] + "\nsolver = cp_model.CpSolver()" + code[insert_pos:]
-            else:
-                m2 = _re.search(r"from ortools\.sat\.python import cp_model", code)
-                insert_pos = m2.end() if m2 else 0
-                code = code[:insert_pos] + "\nsolver = cp_model.CpSolver()" + code[insert_pos:]
-        code = _re.sub(rf"\b{model_var}\.Solve\(\s*\)", f"solver.Solve({model_var})", code)
-        code = _re.sub(r"\bsolver\.Solve\(\s*\)", f"solver.Solve({model_var})", code)
-        code = code.replace('solver.Objective().Value()', 'solver.ObjectiveValue()')
-        code = code.replace('solver.Objective().value()', 'solver.ObjectiveValue()')
-        code = _re.sub(r"([A-Za-z_][A-Za-z0-9_]*)\.solution_value\(\)", r"solver.Value(\1)", code)
-    return code
-
-def get_ortools_code_strict(problem_description, model_id):
-    system_prompt = """只输出 OR-Tools 可执行 Python 代码，并用 ```python 包裹。不要任何解释。
-线性/整数规划：使用 pywraplp（GLOP/SCIP）；离散约束：使用 cp_model。打印目标值与所有变量。"""
-    extra_body = {"enable_thinking": False}
-    response = client.chat.completions.create(
-        model=model_id,
-        messages=[
-            {'role': 'system', 'content': system_prompt},
+def get_ortools_code_strict(problem_description, model_id, use_cache=True, stop_on_code=True, cancel_event=None):
+    return _cached_generation(
+        problem_description, model_id, STRICT_SYSTEM_PROMPT,
+        lambda: _get_ortools_code_strict(problem_description, model_id, stop_on_code, cancel_event),
+        use_cache=use_cache,
+    )
+
+def _get_ortools_code_strict(problem_description, model_id, stop_on_code=True, cancel_event=None):
+    return gateway.stream(
+        model_id,
+        [
+            {'role': 'system', 'content': STRICT_SYSTEM_PROMPT},
             {'role': 'user', 'content': problem_description}
         ],
-        stream=True,
-        extra_body=extra_body
+        False,
+        stop_languages=('python', 'py') if stop_on_code else None,
+        cancel_event=cancel_event,
     )
-    full = ""
-    for c in response:
-        if hasattr(c.choices[0].delta, 'content'):
-            s = c.choices[0].delta.content
-            if s:
-                full += s
-    return full
+
+REPAIR_SYSTEM_PROMPT = """你是 OR-Tools 代码修复助手。用户给出生成程序中出错的一段代码（已去掉公共缩进）及错误信息。
+只输出修正后的这一段代码，用于整体替换原片段：
+1. 放在一个 ```python 代码块中，不要解释；
+2. 不要输出片段以外的代码，不要重复导入或重新建模；
+3. 保持片段内部的相对缩进与变量名不变，只改必要的地方。"""
+
+MAX_REPAIR_ATTEMPTS = 2
+
+def repair_code(code, error, model_id, lineno=None):
+    """
+    Sends only the statements around `lineno` and the error to the LLM and
+    splices the corrected snippet back. Returns the patched, sanitized
+    program, or None when the reply holds no code.
+    """
+    start, end = snippet_bounds(code, lineno)
+    snippet, indent = get_snippet(code, start, end)
+    total = len(code.splitlines())
+    full = gateway.stream(
+        model_id,
+        [
+            {'role': 'system', 'content': REPAIR_SYSTEM_PROMPT},
+            {'role': 'user', 'content': f"以下是生成程序第 {start}-{end} 行（全程序共 {total} 行）：\n"
+                                        f"```python\n{snippet}\n```\n\n错误信息：\n{error}"},
+        ],
+        False,
+        stop_languages=('python', 'py'),
+    )
+    fixed = extract_code(full)
+    if not fixed:
+        return None
+    return sanitize_code(replace_lines(code, start, end, fixed, indent))
+
+def preflight_code(code, model_id, known_names=(), max_attempts=MAX_REPAIR_ATTEMPTS):
+    """
+    Applies code_check's deterministic fixes, then asks for targeted repairs
+    of the remaining issues. Returns (code, analysis, repairs); the code may
+    still carry issues once max_attempts repairs are used up.
+    """
+    analysis = analyze(code, known_names)
+    repairs = 0
+    while analysis.issues and repairs < max_attempts:
+        repaired = repair_code(analysis.code, "\n".join(i.message for i in analysis.issues), model_id,
+                               analysis.issues[0].lineno)
+        repairs += 1
+        if not repaired:
+            break
+        analysis = analyze(repaired, known_names)
+    return analysis.code, analysis, repairs
+
+def is_repairable(result):
+    """Failures raised by the program itself; time and memory limits are not code bugs."""
+    return not result.ok and bool(result.traceback) and not result.timed_out and result.error != "内存不足"
+
+def repair_failed_run(code, result, model_id):
+    """Targeted repair of a program whose execution raised; None if no fix came back."""
+    tail = "\n".join(result.traceback.strip().splitlines()[-12:])
+    return repair_code(code, f"{result.error}\n\n{tail}", model_id, failing_line(result.traceback))
+
+def get_model_ir(problem_description, model_id, on_reasoning=None, on_content=None, use_cache=True):
+    """
+    Asks the LLM for a compact model_ir JSON description instead of Python code.
+    Returns (ir, llm_output); ir is None when no JSON object could be parsed.
+    IRs are cached in code_cache under IR_SYSTEM_PROMPT once they have solved
+    (cache_outcome with ir_json(ir)).
+    """
+    if use_cache:
+        cached = code_cache.get(model_id, IR_SYSTEM_PROMPT, problem_description)
+        if cached is not None:
+            output = f"```json\n{cached}\n```"
+            _note_generation(output, model_id, IR_SYSTEM_PROMPT, problem_description, True)
+            if on_content:
+                on_content(output)
+            return json.loads(cached), output
+    output = _get_ortools_code_stream(
+        problem_description, model_id, on_reasoning, on_content,
+        system_prompt=IR_SYSTEM_PROMPT, fence_languages=('json',),
+    )
+    ir = extract_ir(output)
+    if ir is not None and use_cache:
+        _note_generation(output, model_id, IR_SYSTEM_PROMPT, problem_description, False)
+    return ir, output
+
+def ir_json(ir):
+    """The text an IR is cached as."""
+    return json.dumps(ir, ensure_ascii=False)
 
 DEFAULT_MODEL = 'deepseek-ai/DeepSeek-V3.2'
+FAST_MODEL = 'Qwen/Qwen3-0.6B'
+DEFAULT_HEDGE_DELAY = 20.0
+
+def has_usable_code(llm_output):
+    """True when llm_output contains a code block that sanitizes and compiles."""
+    code = extract_code(llm_output or "")
+    if not code:
+        return False
+    try:
+        compile(sanitize_code(code), '<generated>', 'exec')
+    except (SyntaxError, ValueError):
+        return False
+    return True
+
+def get_ortools_code_routed(problem_description, model_id=DEFAULT_MODEL, on_reasoning=None, on_content=None,
+                            use_cache=True, stop_on_code=True, cancel_event=None, fast_model_id=FAST_MODEL,
+                            has_data=False):
+    """
+    Classifies the problem locally (problem_router) and generates with that
+    class's short prompt. Easy, well-recognised problems go to fast_model_id
+    with thinking disabled, everything else to model_id with thinking; a fast
+    answer without usable code is regenerated once on model_id. has_data
+    (datasets attached) always keeps model_id. Returns (llm_output, decision).
+    """
+    decision = route_problem(problem_description, model_id, fast_model_id, has_data)
+
+    def generate(decision):
+        return _cached_generation(
+            problem_description, decision.model_id, decision.system_prompt,
+            lambda: _get_ortools_code_stream(problem_description, decision.model_id, on_reasoning, on_content,
+                                             stop_on_code, cancel_event, system_prompt=decision.system_prompt,
+                                             enable_thinking=decision.enable_thinking),
+            on_content=on_content, use_cache=use_cache,
+        )
+
+    output = generate(decision)
+    if decision.easy and not has_usable_code(output) and not (cancel_event is not None and cancel_event.is_set()):
+        decision.model_id, decision.enable_thinking, decision.escalated = model_id, True, True
+        output = generate(decision)
+    return output, decision
+
+def get_ortools_code_hedged(problem_description, model_id, on_reasoning=None, on_content=None,
+                            hedge_delay=DEFAULT_HEDGE_DELAY, hedge_model_id=None, use_cache=True):
+    """
+    Races the thinking prompt on model_id against a strict-prompt request on
+    hedge_model_id (model_id when not given). The hedge starts after
+    hedge_delay seconds, or as soon as the primary ends without usable code.
+    The first output with compilable code wins and the other request is
+    cancelled. Only the primary streams to the callbacks, which always run on
+    the calling thread. Returns (llm_output, winner) with winner 'primary',
+    'hedge' or None when neither produced usable code.
+    """
+    events = queue.Queue()
+    cancels = {"primary": threading.Event(), "hedge": threading.Event()}
+
+    def run(name, generate):
+        try:
+            events.put(("done", name, generate()))
+        except Exception as e:
+            events.put(("error", name, e))
+
+    def start(name, generate):
+        threading.Thread(target=run, args=(name, generate), name=f'hedge-{name}', daemon=True).start()
+
+    start("primary", lambda: get_ortools_code_stream(
+        problem_description, model_id,
+        on_reasoning=lambda c: events.put(("reasoning", None, c)),
+        on_content=lambda c: events.put(("content", None, c)),
+        use_cache=use_cache, cancel_event=cancels["primary"],
+    ))
+    running = {"primary"}
+    deadline = time.monotonic() + hedge_delay
+    last_output, last_error = "", None
+
+    while running:
+        timeout = max(0.0, deadline - time.monotonic()) if deadline is not None else None
+        try:
+            kind, name, payload = events.get(timeout=timeout)
+        except queue.Empty:
+            kind, name, payload = "hedge_due", None, None
+        if kind == "reasoning":
+            if on_reasoning:
+                on_reasoning(payload)
+            continue
+        if kind == "content":
+            if on_content:
+                on_content(payload)
+            continue
+        if kind in ("done", "error"):
+            running.discard(name)
+            if kind == "done" and has_usable_code(payload):
+                for other, event in cancels.items():
+                    if other != name:
+                        event.set()
+                return payload, name
+            if kind == "done":
+                last_output = payload
+            else:
+                last_error = payload
+        if deadline is not None and (kind == "hedge_due" or not running):
+            deadline = None
+            running.add("hedge")
+            start("hedge", lambda: get_ortools_code_strict(
+                problem_description, hedge_model_id or model_id,
+                use_cache=use_cache, cancel_event=cancels["hedge"],
+            ))
+    if last_error is not None and not last_output:
+        raise last_error
+    return last_output, None
+
+DEFAULT_CANDIDATES = 3
+
+def get_ortools_code_candidates(problem_description, model_id, n=DEFAULT_CANDIDATES, on_reasoning=None,
+                                on_content=None, use_cache=True):
+    """
+    Requests n independent generations at once on the shared async client, so
+    n samples take about the wall time of one. Only the first streams to the
+    callbacks (on the calling thread) and only it may come from code_cache;
+    the others are always fresh samples (no cache, no joining an identical
+    request in flight), since an answer repeated n times would be a vote of one. Returns the n outputs in request order,
+    '' for requests that failed; raises only when all of them failed.
+    """
+    events = queue.Queue()
+    futures = [run_async(aget_ortools_code_stream(
+        problem_description, model_id,
+        on_reasoning=(lambda c: events.put(("reasoning", c))) if i == 0 else None,
+        on_content=(lambda c: events.put(("content", c))) if i == 0 else None,
+        use_cache=use_cache and i == 0, coalesce=i == 0,
+    )) for i in range(n)]
+    while not (all(f.done() for f in futures) and events.empty()):
+        try:
+            kind, chunk = events.get(timeout=0.05)
+        except queue.Empty:
+            continue
+        callback = on_reasoning if kind == "reasoning" else on_content
+        if callback:
+            callback(chunk)
+    errors = [f.exception() for f in futures if f.exception() is not None]
+    if len(errors) == n:
+        raise errors[0]
+    return ["" if f.exception() is not None else f.result() for f in futures]
+
+def prepare_candidates(outputs, known_names=()):
+    """
+    Extracted code of every candidate output with code_check's deterministic
+    fixes (None where no code block came back). Unlike preflight_code no
+    repair is requested: a broken candidate is simply outvoted.
+    """
+    codes = []
+    for output in outputs:
+        code = extract_code(output)
+        codes.append(analyze(code, known_names).code if code else None)
+    return codes
+
+def objective_from_output(text):
+    """Objective printed by a program whose solver the executor cannot read; None if absent."""
+    objective = parse_exec_output(text)["objective"]
+    return float(objective) if objective is not None else None
+
+def conclusion(result):
+    """Local, template-based conclusion of a successful executor.ExecResult (no LLM call)."""
+    parsed = parse_exec_output(result.stdout) if result.solve is None else None
+    return local_summary(result.solve, parsed, result.stopped)
+
+def parse_exec_output(text: str):
+    obj = None
+    m = re.search(r"Objective\s*value\s*[:=]\s*([-+]?\d*\.?\d+(?:[eE][-+]?\d+)?)", text, re.IGNORECASE)
+    if m:
+        obj = m.group(1)
+    vars = []
+    for name, val in re.findall(r"([A-Za-z_][A-Za-z0-9_]*)\s*=\s*([-+]?\d*\.?\d+(?:[eE][-+]?\d+)?)", text):
+        vars.append({"变量": name, "值": float(val)})
+    return {"objective": obj, "variables": vars}
+
+def load_problems(path):
+    """
+    Reads a batch corpus. JSONL lines and CSV rows need a `problem` field
+    (`problem_description` and `text` are accepted too) and may carry an `id`;
+    records without one are numbered by position. An optional `data` field
+    attaches datasets: a {name: path} object, a list of "name=path" strings,
+    or (in CSV) a ";"-separated string of them. Relative paths are resolved
+    against the corpus file's directory.
+    """
+    base_dir = os.path.dirname(os.path.abspath(path))
+    if path.lower().endswith('.csv'):
+        with open(path, newline='', encoding='utf-8-sig') as f:
+            rows = list(csv.DictReader(f))
+    else:
+        with open(path, encoding='utf-8') as f:
+            rows = [json.loads(line) for line in f if line.strip()]
+    problems = []
+    for i, row in enumerate(rows):
+        # Lines that are not objects (numbers, lists, ...) carry no problem
+        if not isinstance(row, dict):
+            continue
+        text = row.get('problem') or row.get('problem_description') or row.get('text')
+        if not text:
+            continue
+        record_id = row.get('id')
+        problems.append({"id": str(i if record_id is None or record_id == '' else record_id), "problem": text,
+                         "data": _data_specs(row.get('data'), base_dir)})
+    return problems
+
+def _data_specs(data, base_dir):
+    if not data:
+        return []
+    if isinstance(data, dict):
+        data = [f"{name}={path}" for name, path in data.items()]
+    elif isinstance(data, str):
+        data = [spec.strip() for spec in data.split(';') if spec.strip()]
+    specs = []
+    for spec in data:
+        name, sep, path = spec.rpartition('=')
+        specs.append(f"{name}{sep}{os.path.join(base_dir, os.path.expanduser(path))}")
+    return specs
+
+# Outcomes that solving again would not change; llm_error and data_error may be transient (e.g. a 429)
+TERMINAL_STATUSES = ('ok', 'exec_error', 'no_code', 'invalid_ir')
+
+def _completed_ids(output_path):
+    """
+    Ids already recorded in output_path with a terminal status; records of
+    other statuses are retried by a resumed run. A torn last line left by a
+    crash is truncated away so that its problem is solved again.
+    """
+    done = set()
+    if not os.path.exists(output_path):
+        return done
+    with open(output_path, 'rb+') as f:
+        data = f.read()
+        keep = data.rfind(b"\n") + 1
+        if keep < len(data):
+            f.truncate(keep)
+    for line in data[:keep].decode('utf-8').splitlines():
+        try:
+            record = json.loads(line)
+        except ValueError:
+            continue
+        if isinstance(record, dict) and 'id' in record and record.get('status') in TERMINAL_STATUSES:
+            done.add(record['id'])
+    return done
+
+def _generate_ir_for_batch(item, model_id, trace):
+    on_reasoning, on_content = trace.stream()
+    with trace.stage("generate"):
+        ir, llm_output = get_model_ir(item["problem"], model_id, on_reasoning=on_reasoning, on_content=on_content)
+    with trace.stage("extract"):
+        errors = validate_ir(ir) if ir is not None else ["未找到 JSON 模型描述"]
+    return ir, errors, llm_output
+
+def _generate_for_batch(item, model_id, trace, hedge_delay=None, hedge_model_id=None, known_names=(), route=False):
+    decision = None
+    on_reasoning, on_content = trace.stream()
+    with trace.stage("generate"):
+        if hedge_delay is not None:
+            llm_output, _ = get_ortools_code_hedged(item["problem"], model_id, on_reasoning, on_content,
+                                                    hedge_delay=hedge_delay, hedge_model_id=hedge_model_id)
+        elif route:
+            llm_output, decision = get_ortools_code_routed(item["problem"], model_id, on_reasoning, on_content,
+                                                           has_data=bool(known_names))
+        else:
+            llm_output = get_ortools_code_stream(item["problem"], model_id, on_reasoning, on_content)
+    with trace.stage("extract"):
+        code = extract_code(llm_output)
+    if not code and hedge_delay is None:
+        with trace.stage("generate_retry"):
+            llm_output = get_ortools_code_strict(item["problem"], model_id)
+        with trace.stage("extract"):
+            code = extract_code(llm_output)
+    repairs = 0
+    if code:
+        with trace.stage("preflight"):
+            code, _, repairs = preflight_code(code, model_id, known_names)
+    return code, repairs, decision, llm_output
+
+def run_batch(input_path, output_path, model_id=DEFAULT_MODEL, concurrency=4, pool=None,
+              hedge_delay=None, hedge_model_id=None, use_ir=False, datasets=None, solver_config=None,
+              route=False):
+    """
+    Solves every problem in input_path and appends one JSON record per problem
+    to output_path. Up to `concurrency` LLM generations stream at once; each
+    extracted program goes to the execution pool as soon as it is ready, so
+    solving overlaps with the generations still in flight. Records already in
+    output_path are skipped, which makes a rerun resume after a crash.
+    With use_ir the LLM writes a model_ir description instead of code.
+    datasets (DatasetRefs) are attached to every problem, in addition to the
+    ones named by each record's `data` field. solver_config (SolverConfig)
+    applies to every solve. With route each problem is classified locally and
+    easy ones are generated by FAST_MODEL (see get_ortools_code_routed).
+    """
+    pool = pool or get_pool()
+    done = _completed_ids(output_path)
+    pending = [p for p in load_problems(input_path) if p["id"] not in done]
+    total = len(pending)
+    print(f"批量求解：共 {total} 个待处理问题（已完成 {len(done)} 个）")
+
+    write_lock = threading.Lock()
+    finished = [0]
+    out = open(output_path, 'a', encoding='utf-8')
+
+    def write(record):
+        with write_lock:
+            out.write(json.dumps(record, ensure_ascii=False) + "\n")
+            out.flush()
+            os.fsync(out.fileno())
+            finished[0] += 1
+            print(f"[{finished[0]}/{total}] {record['id']}: {record['status']}")
+
+    def process(item):
+        record = {"id": item["id"], "problem": item["problem"], "model": model_id, "code": None,
+                  "status": None, "objective": None, "variables": [], "error": None, "repairs": 0}
+        trace = Trace("batch", id=item["id"], model=model_id)
+        # Stage timings accumulate in the trace; the record stores the same dict
+        timings = record["timings"] = trace.stages
+
+        def close(status, result=None):
+            record["status"] = status
+            finished_trace = trace.finish(status)
+            if trace.generation is not None:
+                record["generation"] = trace.generation.to_dict()
+            try:
+                history.record(item["problem"], record["model"], status, result, source='batch', code=record["code"],
+                               ir=record.get("ir"), trace=finished_trace, batch_id=item["id"])
+            except Exception as e:
+                # The JSONL output is the batch's source of truth; a failing history store must not stop it
+                print(f"运行记录写入失败（{item['id']}）：{e}")
+            write(record)
+
+        try:
+            refs = list(datasets or []) + parse_data_args(item.get("data"))
+            if refs and use_ir:
+                raise ValueError("JSON 模型描述模式不支持附加数据文件")
+        except (OSError, ValueError) as e:
+            record["error"] = str(e)
+            close("data_error")
+            return None
+        if refs:
+            record["data"] = [{"name": r.name, "source": r.source, "shape": list(r.shape)} for r in refs]
+            item = dict(item, problem=with_datasets(item["problem"], refs))
+        try:
+            if use_ir:
+                ir, errors, llm_output = _generate_ir_for_batch(item, model_id, trace)
+                record["ir"] = ir
+            else:
+                code, record["repairs"], decision, llm_output = _generate_for_batch(
+                    item, model_id, trace, hedge_delay, hedge_model_id, [r.name for r in refs], route)
+                record["code"] = code
+                if decision is not None:
+                    record.update(problem_class=decision.problem_class, model=decision.model_id)
+                    trace.fields.update(problem_class=decision.problem_class, model=decision.model_id)
+        except Exception as e:
+            record["error"] = str(e)
+            close("llm_error")
+            return None
+        if (use_ir and errors) or (not use_ir and not code):
+            if use_ir:
+                record["error"] = "; ".join(errors)
+            close("invalid_ir" if use_ir else "no_code")
+            return None
+
+        recorded = Future()
+
+        def run(job_code):
+            if use_ir:
+                job = pool.submit_ir(ir, solver_config=solver_config)
+            else:
+                job = pool.submit(job_code, datasets=refs, solver_config=solver_config)
+            job.add_done_callback(on_executed)
+
+        def repair(result):
+            with trace.stage("repair"):
+                try:
+                    fixed = repair_failed_run(record["code"], result, model_id)
+                except Exception:
+                    fixed = None
+            if fixed is None:
+                finish(result)
+                return
+            record["code"] = fixed
+            record["repairs"] += 1
+            run(fixed)
+
+        def on_executed(future):
+            result = future.result()
+            trace.add("execute", result.elapsed)
+            # LLM repairs run on their own threads, never on the pool's dispatcher thread
+            if not use_ir and is_repairable(result) and record["repairs"] < MAX_REPAIR_ATTEMPTS:
+                repairers.submit(repair, result)
+            else:
+                finish(result)
+
+        def finish(result):
+            if result.ok:
+                status = "ok"
+            else:
+                status = "timeout" if result.timed_out else "exec_error"
+            with trace.stage("parse"):
+                if result.solve is not None:
+                    solve = result.solve
+                    record.update(solver_status=solve.status, objective=solve.objective, best_bound=solve.best_bound,
+                                  variables=solve.to_records() if solve.has_solution else [])
+                    timings["solver_wall_time"] = solve.wall_time
+                else:
+                    parsed = parse_exec_output(result.stdout)
+                    record.update(objective=parsed["objective"], variables=parsed["variables"])
+            trace.record_result(result)
+            record.update(stdout=result.stdout, error=result.error)
+            cache_outcome(llm_output, result.ok, ir_json(ir) if use_ir else record["code"])
+            try:
+                close(status, result)
+            finally:
+                recorded.set_result(record)
+
+        run(code)
+        return recorded
+
+    repairers = ThreadPoolExecutor(max_workers=max(1, concurrency), thread_name_prefix='batch-repair')
+    try:
+        with ThreadPoolExecutor(max_workers=max(1, concurrency)) as generators:
+            recorded = [f.result() for f in [generators.submit(process, p) for p in pending]]
+        wait([f for f in recorded if f is not None])
+    finally:
+        repairers.shutdown()
+        out.close()
+
+def show_history(problem=None, limit=20):
+    """Prints the most recent runs, optionally only those of one problem."""
+    records = history.find(problem=problem, limit=limit)
+    if not records:
+        print("暂无运行记录。")
+        return
+    for r in records:
+        objective = "—" if r.objective is None else f"{r.objective:g}"
+        text = r.problem.replace("\n", " ")
+        print(f"{r.id}  {time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(r.created))}  {r.source:<5} "
+              f"{r.status:<10} 目标值 {objective:<12} {r.model_id}  {text[:30]}{'…' if len(text) > 30 else ''}")
+
+def replay_run(run_id):
+    """Prints a stored run from the history store: code, solver output and conclusion."""
+    record = history.get(run_id)
+    if record is None:
+        print(f"未找到运行记录：{run_id}")
+        return
+    result = history.load_result(run_id)
+    print(f"问题：{record.problem}")
+    print(f"模型：{record.model_id} · 状态：{record.status} · "
+          f"{time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(record.created))}")
+    print("-" * 50)
+    if record.code:
+        print(record.code)
+        print("-" * 50)
+    print(result.stdout, end='')
+    if result.ok:
+        print(f"结论：{record.summary or conclusion(result)}")
+    elif result.error:
+        print(f"运行出错：{result.error}")
 
 def main():
-    if len(sys.argv) > 1:
-        problem = " ".join(sys.argv[1:])
+    parser = argparse.ArgumentParser(description="用自然语言描述优化问题，由 LLM 生成并执行 OR-Tools 代码。")
+    parser.add_argument('problem', nargs='*', help="优化问题描述")
+    parser.add_argument('--model', default=DEFAULT_MODEL, help="推理模型 ID")
+    parser.add_argument('--batch', metavar='FILE', help="批量模式：JSONL/CSV 问题文件")
+    parser.add_argument('--output', metavar='FILE', help="批量结果 JSONL 文件（默认 <输入文件名>.results.jsonl）")
+    parser.add_argument('--concurrency', type=int, default=4, help="批量模式下同时进行的 LLM 请求数")
+    parser.add_argument('--hedge-delay', type=float, metavar='SECONDS',
+                        help="启用对冲生成：等待该秒数（或首次生成失败）后并行发起精简提示词请求")
+    parser.add_argument('--hedge-model', help="对冲请求使用的模型 ID（默认与 --model 相同）")
+    parser.add_argument('--ir', action='store_true', help="让 LLM 输出紧凑 JSON 模型描述，由本地批量构建并求解")
+    parser.add_argument('--data', action='append', metavar='NAME=PATH',
+                        help="附加 CSV/Parquet/NPY 数据文件，执行时以只读数组 NAME 注入（可重复）")
+    parser.add_argument('--auto-route', action='store_true',
+                        help="本地识别问题类型，使用对应的精简提示词；简单问题改用快速模型并关闭思考")
+    parser.add_argument('--solver-threads', type=int, metavar='N',
+                        help="CP-SAT 搜索线程数 / SCIP 等 MIP 求解器线程数")
+    parser.add_argument('--time-limit', type=float, metavar='SECONDS', help="每次 Solve() 的求解时间上限")
+    parser.add_argument('--gap', type=float, metavar='REL_GAP', help="相对最优间隙达到该值即停止（如 0.01）")
+    parser.add_argument('--portfolio', action='store_true',
+                        help="对 pywraplp 模型并行运行 GLOP/PDLP/SCIP/CP-SAT，取最先证明最优的结果")
+    parser.add_argument('--candidates', type=int, metavar='N',
+                        help="共识模式：并行生成并执行 N 个候选程序，按状态与目标值投票选出结果")
+    parser.add_argument('--trace-log', metavar='FILE', help="将每次运行的分阶段耗时以 JSON 行写入该文件")
+    parser.add_argument('--metrics-file', metavar='FILE', help="将 Prometheus/OpenMetrics 指标写入该文件")
+    parser.add_argument('--metrics-port', type=int, metavar='PORT', help="在该端口提供 /metrics 抓取接口")
+    parser.add_argument('--history', type=int, nargs='?', const=20, metavar='N',
+                        help="列出最近 N 条运行记录（给出问题描述时只列出该问题的记录）")
+    parser.add_argument('--replay', metavar='RUN_ID', help="重新展示已保存的运行结果，不调用 LLM 也不重新求解")
+    args = parser.parse_args()
+    configure_metrics(args.trace_log, args.metrics_file, args.metrics_port)
+
+    if args.history is not None:
+        show_history(" ".join(args.problem) or None, args.history)
+        return
+    if args.replay:
+        replay_run(args.replay)
+        return
+
+    solver_config = SolverConfig(num_workers=args.solver_threads, time_limit=args.time_limit,
+                                 relative_gap=args.gap, portfolio=args.portfolio)
+    datasets = parse_data_args(args.data)
+    if datasets and args.ir:
+        parser.error("--data 仅支持代码生成模式，不能与 --ir 同时使用")
+
+    if args.batch:
+        output = args.output or os.path.splitext(args.batch)[0] + '.results.jsonl'
+        run_batch(args.batch, output, model_id=args.model, concurrency=args.concurrency,
+                  hedge_delay=args.hedge_delay, hedge_model_id=args.hedge_model, use_ir=args.ir,
+                  datasets=datasets, solver_config=solver_config, route=args.auto_route)
+        return
+
+    if args.problem:
+        problem = " ".join(args.problem)
     else:
         # Default example problem
         problem = "最大化 3x + 4y，约束：x + 2y <= 14，3x - y >= 0，x - y <= 2，x >= 0，y >= 0。"
         print(f"未提供问题，使用默认示例：\n{problem}\n")
-        print("用法：python main.py <你的优化问题描述>")
+        print("用法：python main.py <你的优化问题描述>  或  python main.py --batch problems.jsonl")
 
     print("-" * 50)
     print(f"问题：{problem}")
     print("-" * 50)
+    # The LLM sees the schema only; the arrays themselves are injected at execution
+    prompt = with_datasets(problem, datasets)
+    trace = Trace("cli", model=args.model)
+
+    def echo(chunk):
+        print(chunk, end='', flush=True)
 
-    llm_output = get_ortools_code(problem, DEFAULT_MODEL)
+    def finish(status, result=None, code=None, ir=None, **fields):
+        """Closes the trace and records the run in the history store."""
+        summary = None
+        if result is not None and result.ok:
+            summary = conclusion(result)
+            print(f"结论：{summary}")
+        run_id = history.record(problem, args.model, status, result, code=code, ir=ir, summary=summary,
+                                trace=trace.finish(status, **fields), **fields)
+        print(f"（运行记录 {run_id}，可用 --replay 重新查看）")
+
+    if args.ir:
+        print("正在思考...")
+        on_reasoning, on_content = trace.stream(echo, echo)
+        with trace.stage("generate"):
+            ir, llm_output = get_model_ir(problem, args.model, on_reasoning=on_reasoning, on_content=on_content)
+        print("\n")
+        with trace.stage("extract"):
+            errors = validate_ir(ir) if ir is not None else ["未找到 JSON 模型描述"]
+        if errors:
+            print("模型描述无效：\n" + "\n".join(errors))
+            finish("invalid_ir", ir=ir)
+            return
+        with trace.stage("execute"):
+            result = get_pool().submit_ir(ir, solver_config=solver_config).result()
+        trace.record_result(result)
+        cache_outcome(llm_output, result.ok, ir_json(ir))
+        print(result.stdout, end='')
+        if not result.ok:
+            print(f"求解出错：{result.error}")
+        finish("ok" if result.ok else "exec_error", result, ir=ir)
+        return
+
+    if args.candidates and args.candidates > 1:
+        print(f"正在并行生成 {args.candidates} 个候选程序（仅显示第 1 个的输出）...")
+        on_reasoning, on_content = trace.stream(echo, echo)
+        with trace.stage("generate"):
+            outputs = get_ortools_code_candidates(prompt, args.model, args.candidates,
+                                                  on_reasoning=on_reasoning, on_content=on_content)
+        with trace.stage("preflight"):
+            codes = prepare_candidates(outputs, [ref.name for ref in datasets])
+        if not any(codes):
+            print("\n未从任何候选响应中找到有效的 Python 代码块。")
+            finish("no_code", candidates=args.candidates)
+            return
+        print("\n" + "-" * 50)
+        print(f"正在并行执行 {sum(1 for c in codes if c)} 个候选程序：")
+        print("-" * 50)
+        with trace.stage("execute"):
+            consensus = run_candidates(get_pool(), codes, objective_of=objective_from_output, datasets=datasets,
+                                       solver_config=solver_config)
+        for row in consensus.rows():
+            objective = "—" if row["目标值"] is None else f"{row['目标值']:g}"
+            print(f"  候选 {row['候选']}：{row['状态']:<10} 目标值 {objective:<12} {row['采纳']}")
+        print(consensus.describe())
+        winner = consensus.winner
+        if winner is None:
+            finish("exec_error", candidates=args.candidates, agreeing=0)
+            return
+        trace.record_result(winner.result)
+        cache_outcome(outputs[winner.index], True, winner.code)
+        print("-" * 50)
+        print(winner.result.stdout, end='')
+        finish("ok", winner.result, code=winner.code, candidates=args.candidates, agreeing=consensus.agreeing)
+        return
+
+    if args.hedge_delay is not None:
+        print("正在思考...")
+        on_reasoning, on_content = trace.stream(echo, echo)
+        with trace.stage("generate"):
+            llm_output, winner = get_ortools_code_hedged(
+                prompt, args.model,
+                on_reasoning=on_reasoning,
+                on_content=on_content,
+                hedge_delay=args.hedge_delay, hedge_model_id=args.hedge_model,
+            )
+        print(f"\n\n（采用 {winner or '无'} 请求的结果）")
+    elif args.auto_route:
+        on_reasoning, on_content = trace.stream(echo, echo)
+        with trace.stage("generate"):
+            llm_output, decision = get_ortools_code_routed(
+                prompt, args.model,
+                on_reasoning=on_reasoning,
+                on_content=on_content,
+                has_data=bool(datasets),
+            )
+        print(f"\n\n（问题类型：{decision.label}，模型：{decision.model_id}"
+              f"{'，快速模型未生成可用代码，已改用强模型' if decision.escalated else ''}）")
+    else:
+        # get_ortools_code prints the stream itself, so only the wall time is traced
+        with trace.stage("generate"):
+            llm_output = get_ortools_code(prompt, args.model)
     
-    code = extract_code(llm_output)
+    with trace.stage("extract"):
+        code = extract_code(llm_output)
     
     if code:
-        code = sanitize_code(code)
+        known_names = [ref.name for ref in datasets]
+        with trace.stage("preflight"):
+            analysis = analyze(code, known_names)
+            for fix in analysis.fixes:
+                print(f"已自动修正：{fix}")
+            code, analysis, repairs = preflight_code(analysis.code, args.model, known_names)
+        if repairs:
+            print(f"已请求模型定点修复 {repairs} 次" + ("" if analysis.ok else "，仍存在问题：\n" + "\n".join(i.message for i in analysis.issues)))
         print("-" * 50)
         print("正在执行生成的 OR-Tools 代码：")
         print("-" * 50)
         
-        # Execute the code
-        try:
-            exec_globals = {}
-            exec(code, exec_globals)
-        except Exception as e:
-            print(f"运行代码出错：{e}")
+        # Execute the code in an isolated worker process
+        with trace.stage("execute"):
+            result = get_pool().run(code, datasets=datasets, solver_config=solver_config)
+        while is_repairable(result) and repairs < MAX_REPAIR_ATTEMPTS:
+            print(f"运行代码出错：{result.error}\n正在请求模型修复出错片段...")
+            with trace.stage("repair"):
+                repaired = repair_failed_run(code, result, args.model)
+            repairs += 1
+            if not repaired:
+                break
+            code = repaired
+            with trace.stage("execute"):
+                result = get_pool().run(code, datasets=datasets, solver_config=solver_config)
+        trace.record_result(result)
+        cache_outcome(llm_output, result.ok, code)
+        print(result.stdout, end='')
+        if not result.ok:
+            print(f"运行代码出错：{result.error}")
+        finish("ok" if result.ok else ("timeout" if result.timed_out else "exec_error"), result, code=code,
+               repairs=repairs)
     else:
         print("未从响应中找到有效的 Python 代码块。")
+        finish("no_code")
+
+SUMMARY_SYSTEM_PROMPT = "你是优化问题的中文解释助手。根据给定的自然语言问题与求解器输出，生成简洁结论，包括：是否找到可行/最优解、若有目标值则给出目标值、列出主要变量的取值，并用一两句话说明含义。"
 
-    if __name__ == "__main__":
-        main()
 def summarize_result(problem_description, exec_output, model_id):
-    system_prompt = "你是优化问题的中文解释助手。根据给定的自然语言问题与求解器输出，生成简洁结论，包括：是否找到可行/最优解、若有目标值则给出目标值、列出主要变量的取值，并用一两句话说明含义。"
-    extra_body = {"enable_thinking": False}
-    response = client.chat.completions.create(
-        model=model_id,
-        messages=[
-            {"role": "system", "content": system_prompt},
+    return gateway.stream(
+        model_id,
+        [
+            {"role": "system", "content": SUMMARY_SYSTEM_PROMPT},
             {"role": "user", "content": f"问题：\n{problem_description}\n\n求解器输出：\n{exec_output}\n\n请用中文给出简洁结论。"},
         ],
-        stream=True,
-        extra_body=extra_body,
+        False,
+    )
+
+async def _astream(model_id, messages, enable_thinking, on_reasoning=None, on_content=None, stop_on_code=False,
+                   coalesce=True):
+    return await gateway.astream(model_id, messages, enable_thinking, on_reasoning, on_content,
+                                 stop_languages=('python', 'py') if stop_on_code else None, coalesce=coalesce)
+
+async def _acached_generation(problem_description, model_id, system_prompt, generate, on_content=None, use_cache=True):
+    """_cached_generation for coroutines; the cache lookup runs off the event loop."""
+    if not use_cache:
+        return await generate()
+    loop = asyncio.get_running_loop()
+    output = await loop.run_in_executor(None, _cache_lookup, problem_description, model_id, system_prompt)
+    if output is not None:
+        if on_content:
+            on_content(output)
+        return output
+    return _generated_output(await generate(), problem_description, model_id, system_prompt)
+
+async def aget_ortools_code_stream(problem_description, model_id, on_reasoning=None, on_content=None, use_cache=True,
+                                   stop_on_code=True, coalesce=True):
+    """
+    Async variant of get_ortools_code_stream; callbacks run on the event loop
+    thread. coalesce=False always opens a stream of its own (an independent sample).
+    """
+    messages = [
+        {"role": "system", "content": SYSTEM_PROMPT},
+        {"role": "user", "content": problem_description},
+    ]
+    return await _acached_generation(
+        problem_description, model_id, SYSTEM_PROMPT,
+        lambda: _astream(model_id, messages, True, on_reasoning, on_content, stop_on_code, coalesce),
+        on_content=on_content, use_cache=use_cache,
+    )
+
+async def aget_ortools_code_strict(problem_description, model_id, use_cache=True, stop_on_code=True):
+    messages = [
+        {"role": "system", "content": STRICT_SYSTEM_PROMPT},
+        {"role": "user", "content": problem_description},
+    ]
+    return await _acached_generation(
+        problem_description, model_id, STRICT_SYSTEM_PROMPT,
+        lambda: _astream(model_id, messages, False, stop_on_code=stop_on_code),
+        use_cache=use_cache,
     )
-    full = ""
-    for c in response:
-        if hasattr(c.choices[0].delta, 'content'):
-            s = c.choices[0].delta.content
-            if s:
-                full += s
-    return full
+
+def _summary_key(problem_description, exec_output):
+    return f"{problem_description}\x1f{hashlib.sha256(exec_output.encode('utf-8')).hexdigest()}"
+
+async def asummarize_result(problem_description, exec_output, model_id, on_content=None, use_cache=True):
+    """
+    LLM explanation of a solve. Repeats of the same problem and solver output
+    are served from summary_cache; on a hit on_content receives the whole text
+    in a single call. result_summary.local_summary is the free alternative.
+    """
+    key = _summary_key(problem_description, exec_output)
+    loop = asyncio.get_running_loop()
+    if use_cache:
+        cached = await loop.run_in_executor(None, summary_cache.get, model_id, SUMMARY_SYSTEM_PROMPT, key)
+        if cached is not None:
+            if on_content:
+                on_content(cached)
+            return cached
+    messages = [
+        {"role": "system", "content": SUMMARY_SYSTEM_PROMPT},
+        {"role": "user", "content": f"问题：\n{problem_description}\n\n求解器输出：\n{exec_output}\n\n请用中文给出简洁结论。"},
+    ]
+    summary = await _astream(model_id, messages, False, on_content=on_content)
+    if summary and use_cache:
+        await loop.run_in_executor(None, summary_cache.put, model_id, SUMMARY_SYSTEM_PROMPT, key, summary)
+    return summary
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,295 @@
+"""
+Per-stage tracing and an exportable metrics surface.
+
+A Trace follows one solve through the pipeline: generation (time to first
+token, streamed tokens and tokens/s for reasoning and content), extraction,
+preflight sanitizing, execution, parsing and summarisation, plus the solver's
+status and wall time. Every stage duration also feeds the process-wide
+REGISTRY, which renders as OpenMetrics text for a Prometheus scrape (HTTP
+endpoint or a file for the node-exporter textfile collector). Finished traces
+are written as one JSON object per line to the trace log.
+
+Configured from the environment (ORTOOLS_TRACE_LOG, ORTOOLS_METRICS_FILE,
+ORTOOLS_METRICS_PORT) or with configure(); nothing is exported by default.
+"""
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Seconds; spans cached generations (milliseconds) up to long reasoning streams and solves
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0)
+RATE_BUCKETS = (1, 5, 10, 20, 40, 80, 160, 320)
+OPENMETRICS_CONTENT_TYPE = 'application/openmetrics-text; version=1.0.0; charset=utf-8'
+
+_log = logging.getLogger('ortools_ai.trace')
+_log.addHandler(logging.NullHandler())
+_log.setLevel(logging.INFO)
+_log.propagate = False
+
+
+def _label_text(labels):
+    if not labels:
+        return ''
+    pairs = []
+    for k, v in labels:
+        v = str(v).replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n')
+        pairs.append(f'{k}="{v}"')
+    return '{' + ','.join(pairs) + '}'
+
+
+class Registry:
+    """Thread-safe counters and histograms keyed by metric name and labels."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._meta = {}
+        self._counters = {}
+        self._histograms = {}
+
+    def describe(self, name, kind, help_text, buckets=None):
+        self._meta[name] = (kind, help_text, buckets)
+
+    def inc(self, name, value=1.0, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0.0) + value
+
+    def observe(self, name, value, **labels):
+        buckets = self._meta[name][2]
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            counts, count, total = self._histograms.get(key, ([0] * len(buckets), 0, 0.0))
+            self._histograms[key] = ([c + (value <= b) for c, b in zip(counts, buckets)], count + 1, total + value)
+
+    def render(self):
+        """OpenMetrics text exposition of every metric observed so far."""
+        with self._lock:
+            counters = sorted(self._counters.items())
+            histograms = sorted(self._histograms.items())
+        lines = []
+        for name, (kind, help_text, buckets) in self._meta.items():
+            lines += [f"# TYPE {name} {kind}", f"# HELP {name} {help_text}"]
+            if kind == 'counter':
+                lines += [f"{name}_total{_label_text(labels)} {value:g}"
+                          for (n, labels), value in counters if n == name]
+                continue
+            for (n, labels), (counts, count, total) in histograms:
+                if n != name:
+                    continue
+                for bound, c in zip(buckets, counts):
+                    lines.append(f"{name}_bucket{_label_text(labels + (('le', f'{bound:g}'),))} {c}")
+                lines.append(f"{name}_bucket{_label_text(labels + (('le', '+Inf'),))} {count}")
+                lines.append(f"{name}_count{_label_text(labels)} {count}")
+                lines.append(f"{name}_sum{_label_text(labels)} {total:g}")
+        lines.append("# EOF")
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+REGISTRY.describe('ortools_stage_seconds', 'histogram', "Wall time per pipeline stage.", LATENCY_BUCKETS)
+REGISTRY.describe('ortools_llm_ttft_seconds', 'histogram', "Time to the first streamed LLM chunk.", LATENCY_BUCKETS)
+REGISTRY.describe('ortools_llm_tokens_per_second', 'histogram',
+                  "Streamed tokens per second, by kind (reasoning, content).", RATE_BUCKETS)
+REGISTRY.describe('ortools_llm_tokens', 'counter', "Streamed LLM tokens, by kind (reasoning, content).")
+REGISTRY.describe('ortools_solver_seconds', 'histogram', "Solver wall time reported by the solver.", LATENCY_BUCKETS)
+REGISTRY.describe('ortools_solver_status', 'counter', "Solves by backend and solver status.")
+REGISTRY.describe('ortools_runs', 'counter', "Finished pipeline runs by source and status.")
+
+
+class StreamStats:
+    """
+    Chunk timing of one LLM stream. Providers send about one token per
+    streamed delta, so chunk counts stand in for token counts.
+    """
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.first = None
+        self.tokens = {'reasoning': 0, 'content': 0}
+        self.chars = {'reasoning': 0, 'content': 0}
+        self._span = {}
+        self._lock = threading.Lock()
+
+    def wrap(self, kind, callback=None):
+        def on_chunk(text):
+            now = time.perf_counter()
+            with self._lock:
+                if self.first is None:
+                    self.first = now
+                self.tokens[kind] += 1
+                self.chars[kind] += len(text)
+                first, _ = self._span.get(kind, (now, now))
+                self._span[kind] = (first, now)
+            if callback is not None:
+                callback(text)
+        return on_chunk
+
+    @property
+    def ttft(self):
+        return None if self.first is None else self.first - self.start
+
+    def rate(self, kind):
+        """Tokens/s between the first and last chunk of a kind; None when too short to tell."""
+        first, last = self._span.get(kind, (0.0, 0.0))
+        return self.tokens[kind] / (last - first) if last > first and self.tokens[kind] > 1 else None
+
+    def to_dict(self):
+        return {
+            "ttft": self.ttft,
+            "reasoning_tokens": self.tokens['reasoning'],
+            "content_tokens": self.tokens['content'],
+            "reasoning_tokens_per_s": self.rate('reasoning'),
+            "content_tokens_per_s": self.rate('content'),
+        }
+
+
+class Trace:
+    """
+    Timings of one run. `stages` maps stage name to seconds (repeated stages
+    accumulate), so it can be stored as a batch record's `timings`.
+    """
+
+    def __init__(self, source, **fields):
+        self.source = source
+        self.fields = fields
+        self.stages = {}
+        self.generation = None
+        self.solver = None
+        self.started = time.time()
+        self._start = time.perf_counter()
+
+    def add(self, stage, seconds):
+        self.stages[stage] = self.stages.get(stage, 0.0) + seconds
+        REGISTRY.observe('ortools_stage_seconds', seconds, stage=stage)
+
+    @contextmanager
+    def stage(self, name):
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - t0)
+
+    def stream(self, on_reasoning=None, on_content=None):
+        """Wrapped (on_reasoning, on_content) callbacks that time the next generation."""
+        self.generation = StreamStats()
+        return self.generation.wrap('reasoning', on_reasoning), self.generation.wrap('content', on_content)
+
+    def record_result(self, result):
+        """Solver status and wall time of an executor.ExecResult."""
+        solve = getattr(result, 'solve', None)
+        if solve is None:
+            return
+        self.solver = {"backend": solve.backend, "status": solve.status, "wall_time": solve.wall_time,
+                       "objective": solve.objective}
+        REGISTRY.inc('ortools_solver_status', backend=solve.backend, status=solve.status)
+        if solve.wall_time is not None:
+            REGISTRY.observe('ortools_solver_seconds', solve.wall_time)
+
+    def _record_generation(self):
+        stats = self.generation
+        if stats is None or stats.first is None:
+            return
+        REGISTRY.observe('ortools_llm_ttft_seconds', stats.ttft)
+        for kind in ('reasoning', 'content'):
+            if stats.tokens[kind]:
+                REGISTRY.inc('ortools_llm_tokens', stats.tokens[kind], kind=kind)
+            rate = stats.rate(kind)
+            if rate is not None:
+                REGISTRY.observe('ortools_llm_tokens_per_second', rate, kind=kind)
+
+    def to_dict(self):
+        return {
+            "source": self.source,
+            "started": self.started,
+            **self.fields,
+            "stages": dict(self.stages),
+            "generation": self.generation.to_dict() if self.generation is not None else None,
+            "solver": self.solver,
+        }
+
+    def finish(self, status, **fields):
+        """Closes the trace: totals, registry updates, JSON log line and metrics file."""
+        self.fields.update(fields, status=status)
+        self.stages.setdefault("total", time.perf_counter() - self._start)
+        self._record_generation()
+        REGISTRY.inc('ortools_runs', source=self.source, status=status)
+        record = self.to_dict()
+        _log.info(json.dumps(record, ensure_ascii=False, default=str))
+        if _metrics_file:
+            write_metrics_file(_metrics_file)
+        return record
+
+
+_metrics_file = None
+_server = None
+_configure_lock = threading.Lock()
+
+
+def write_metrics_file(path):
+    """Atomically writes the exposition, e.g. for the node-exporter textfile collector."""
+    # Traces finish concurrently on batch and dispatcher threads: one temp file per thread
+    tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp, 'w', encoding='utf-8') as f:
+        f.write(REGISTRY.render())
+    os.replace(tmp, path)
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split('?')[0] not in ('/metrics', '/'):
+            self.send_error(404)
+            return
+        body = REGISTRY.render().encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', OPENMETRICS_CONTENT_TYPE)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def serve_metrics(port, host='0.0.0.0'):
+    """
+    Serves /metrics on a daemon thread; later calls reuse the running server.
+    Returns the bound port, or None when the address is already taken (e.g.
+    by the parent process of a spawned worker); metrics are then not served.
+    """
+    global _server
+    with _configure_lock:
+        if _server is None:
+            try:
+                _server = ThreadingHTTPServer((host, port), _MetricsHandler)
+            except OSError as e:
+                logging.getLogger(__name__).warning("metrics port %s unavailable: %s", port, e)
+                return None
+            threading.Thread(target=_server.serve_forever, name='metrics-http', daemon=True).start()
+    return _server.server_address[1]
+
+
+def configure(trace_log=None, metrics_file=None, metrics_port=None):
+    """
+    Enables the exports; arguments left as None fall back to the environment.
+    Safe to call repeatedly (Streamlit reruns): handlers and the HTTP server
+    are only set up once.
+    """
+    global _metrics_file
+    trace_log = trace_log or os.environ.get('ORTOOLS_TRACE_LOG')
+    metrics_file = metrics_file or os.environ.get('ORTOOLS_METRICS_FILE')
+    metrics_port = metrics_port or os.environ.get('ORTOOLS_METRICS_PORT')
+    with _configure_lock:
+        if trace_log and not any(getattr(h, 'baseFilename', None) == os.path.abspath(trace_log)
+                                 for h in _log.handlers):
+            handler = logging.FileHandler(trace_log, encoding='utf-8')
+            handler.setFormatter(logging.Formatter('%(message)s'))
+            _log.addHandler(handler)
+        if metrics_file:
+            _metrics_file = metrics_file
+    if metrics_port:
+        serve_metrics(int(metrics_port))
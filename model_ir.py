@@ -0,0 +1,488 @@
+"""
+Compact JSON intermediate representation (IR) for optimization models.
+
+Instead of scalar Python, the LLM can describe a model as variable blocks,
+sparse or dense coefficient lists and row-sum constraint blocks. The IR is
+validated, compiled into flat NumPy index/coefficient arrays and then built in
+bulk with model_builder (LP/MIP) or cp_model (CP).
+
+IR format::
+
+    {
+      "problem_type": "LP" | "MIP" | "CP",
+      "sense": "maximize" | "minimize",
+      "variables": [
+        {"name": "x", "shape": [3, 4], "type": "continuous" | "integer" | "binary",
+         "lb": 0, "ub": 10}                 # scalars or nested lists of `shape`
+      ],
+      "objective": {"terms": [["x", [0, 1], 3.5]],   # [var, index, coeff]
+                    "dense": {"x": [[...]]},          # coefficients of every element
+                    "constant": 0},
+      "constraints": [
+        {"name": "c1", "terms": [...], "dense": {...}, "lb": null, "ub": 10},
+        {"name": "rows", "sum": "x", "axis": 1, "coeffs": [[...]], "lb": 1, "ub": 1}
+      ],
+      "all_different": [[["x", [0]], ["x", [1]]]]    # CP only
+    }
+
+A "sum" constraint adds one row per slice: summing a [3, 4] block over axis 1
+gives three rows, over axis null gives a single row over all elements.
+"""
+import json
+import math
+import re
+from dataclasses import replace
+
+import numpy as np
+
+VAR_TYPES = ('continuous', 'integer', 'binary')
+PROBLEM_TYPES = ('LP', 'MIP', 'CP')
+# Unbounded integer variables are given this domain in CP-SAT
+CP_DOMAIN_LIMIT = 2 ** 31 - 1
+
+IR_SYSTEM_PROMPT = """你是 Google OR-Tools 建模专家。把自然语言的优化问题翻译为紧凑的 JSON 模型描述（不要写 Python 代码）。
+
+JSON 结构：
+{
+  "problem_type": "LP" | "MIP" | "CP",
+  "sense": "maximize" | "minimize",
+  "variables": [{"name": "x", "shape": [3, 4], "type": "continuous" | "integer" | "binary", "lb": 0, "ub": 10}],
+  "objective": {"terms": [["x", [0, 1], 3.5]], "dense": {"x": [[1, 2, 3, 4], [5, 6, 7, 8], [9, 10, 11, 12]]}, "constant": 0},
+  "constraints": [
+    {"name": "cap", "terms": [["x", [0, 0], 2], ["x", [1, 0], 3]], "lb": null, "ub": 10},
+    {"name": "row_once", "sum": "x", "axis": 1, "lb": 1, "ub": 1},
+    {"name": "weight", "dense": {"x": [[...]]}, "lb": null, "ub": 50}
+  ],
+  "all_different": [[["x", [0, 0]], ["x", [0, 1]]]]
+}
+
+规则：
+- 同类变量用一个带 shape 的变量块表示；标量变量的 shape 为 []，下标写 []。
+- 系数矩阵、成本矩阵用 "dense" 整块给出；稀疏关系用 "terms"。
+- "sum" 约束对变量块沿 axis 求和，每个切片生成一条约束（axis 为 null 时对全部元素求和）；可用同形状的 "coeffs" 加权。
+- lb/ub 为 null 表示无界；等式约束令 lb 与 ub 相等。
+- "!="、互不相同等离散约束必须使用 "CP"，并写在 "all_different" 中；CP 模型的所有系数与边界必须为整数。
+- 只输出被 ```json 包裹的一个 JSON 对象，不要任何解释。
+"""
+
+
+class IRValidationError(ValueError):
+    def __init__(self, errors):
+        super().__init__("; ".join(errors))
+        self.errors = errors
+
+
+def extract_ir(llm_output):
+    """Parses the JSON object from a ```json fence (or the first {...} span)."""
+    m = re.search(r"```\s*(?:json)?\s*(\{.*?\})\s*```", llm_output, re.DOTALL | re.IGNORECASE)
+    text = m.group(1) if m else None
+    if text is None:
+        start, end = llm_output.find('{'), llm_output.rfind('}')
+        if start < 0 or end <= start:
+            return None
+        text = llm_output[start:end + 1]
+    try:
+        ir = json.loads(text)
+    except ValueError:
+        return None
+    return ir if isinstance(ir, dict) else None
+
+
+def _bound(value, default):
+    return default if value is None else value
+
+
+def _is_number(value):
+    return isinstance(value, (int, float)) and not isinstance(value, bool) and math.isfinite(value)
+
+
+def _is_index(value):
+    return isinstance(value, int) and not isinstance(value, bool)
+
+
+def _array_shape(value):
+    """Shape of a nested list of numbers, or None when it is ragged or holds anything else."""
+    if _is_number(value):
+        return ()
+    if not isinstance(value, list):
+        return None
+    shapes = {_array_shape(item) for item in value}
+    if len(shapes) > 1 or None in shapes:
+        return None
+    return (len(value),) + (shapes.pop() if shapes else ())
+
+
+def _integral(values):
+    return all(float(v).is_integer() for v in np.ravel(np.asarray(values, dtype=np.float64)))
+
+
+def _index_ok(index, shape):
+    index = [] if index is None else ([index] if _is_index(index) else index)
+    return (isinstance(index, list) and len(index) == len(shape)
+            and all(_is_index(i) and 0 <= i < n for i, n in zip(index, shape)))
+
+
+def _list(ir, key):
+    value = ir.get(key)
+    return [] if value is None else value
+
+
+def validate_ir(ir):
+    """
+    Returns a list of human-readable problems with the IR; empty when valid.
+    Never raises: every field is type-checked, since the IR is LLM output.
+    """
+    errors = []
+    if not isinstance(ir, dict):
+        return ["IR 必须是 JSON 对象"]
+    problem_type = ir.get('problem_type')
+    if problem_type not in PROBLEM_TYPES:
+        errors.append(f"problem_type 必须是 {'/'.join(PROBLEM_TYPES)}")
+    is_cp = problem_type == 'CP'
+    if ir.get('sense', 'minimize') not in ('maximize', 'minimize'):
+        errors.append("sense 必须是 maximize 或 minimize")
+    # CP-SAT is integral: a fractional coefficient or bound must not be truncated silently
+    fractional = []
+    shapes = {}
+    variables = _list(ir, 'variables')
+    if not isinstance(variables, list):
+        errors.append("variables 必须是数组")
+        variables = []
+    for i, var in enumerate(variables):
+        if not isinstance(var, dict):
+            errors.append(f"variables[{i}] 必须是对象")
+            continue
+        name = var.get('name')
+        if not isinstance(name, str) or not name:
+            errors.append(f"variables[{i}] 缺少 name")
+            continue
+        if name in shapes:
+            errors.append(f"变量块 {name} 重复定义")
+        shape = var.get('shape', [])
+        if not (isinstance(shape, list) and all(_is_index(n) and n > 0 for n in shape)):
+            errors.append(f"变量块 {name} 的 shape 无效")
+            continue
+        kind = var.get('type', 'continuous')
+        if kind not in VAR_TYPES:
+            errors.append(f"变量块 {name} 的 type 必须是 {'/'.join(VAR_TYPES)}")
+        elif is_cp and kind == 'continuous':
+            errors.append(f"CP 模型不支持连续变量（变量块 {name}）")
+        for key in ('lb', 'ub'):
+            value = var.get(key)
+            if value is None:
+                continue
+            value_shape = _array_shape(value)
+            if value_shape is None:
+                errors.append(f"变量块 {name} 的 {key} 必须是数字、null 或与 shape 同形状的数字数组")
+            elif value_shape not in ((), tuple(shape)):
+                errors.append(f"变量块 {name} 的 {key} 形状与 shape 不一致")
+            elif is_cp and kind != 'binary' and not _integral(value):
+                fractional.append(f"变量块 {name} 的 {key}")
+        shapes[name] = shape
+    if not shapes:
+        errors.append("至少需要一个变量块")
+
+    def check_linear(where, spec):
+        terms = _list(spec, 'terms')
+        if not isinstance(terms, list):
+            errors.append(f"{where} 的 terms 必须是数组")
+            terms = []
+        for term in terms:
+            if not (isinstance(term, list) and len(term) == 3 and isinstance(term[0], str) and term[0] in shapes
+                    and _index_ok(term[1], shapes[term[0]]) and _is_number(term[2])):
+                errors.append(f"{where} 中的项 {term!r} 无效")
+            elif is_cp and not float(term[2]).is_integer():
+                fractional.append(f"{where} 中的项 {term!r}")
+        dense = _list(spec, 'dense') or {}
+        if not isinstance(dense, dict):
+            errors.append(f"{where} 的 dense 必须是对象")
+            dense = {}
+        for name, coeffs in dense.items():
+            if name not in shapes:
+                errors.append(f"{where} 引用了未定义的变量块 {name}")
+            elif _array_shape(coeffs) != tuple(shapes[name]):
+                errors.append(f"{where} 中 {name} 的系数必须是与变量块同形状的数字数组")
+            elif is_cp and not _integral(coeffs):
+                fractional.append(f"{where} 中 {name} 的系数")
+
+    objective = ir.get('objective') or {}
+    if isinstance(objective, dict):
+        check_linear("objective", objective)
+        constant = objective.get('constant')
+        if constant is not None and not _is_number(constant):
+            errors.append("objective 的 constant 必须是数字")
+        elif is_cp and constant is not None and not float(constant).is_integer():
+            fractional.append("objective 的 constant")
+    else:
+        errors.append("objective 必须是对象")
+    constraints = _list(ir, 'constraints')
+    if not isinstance(constraints, list):
+        errors.append("constraints 必须是数组")
+        constraints = []
+    for i, con in enumerate(constraints):
+        if not isinstance(con, dict):
+            errors.append(f"constraints[{i}] 必须是对象")
+            continue
+        where = f"constraints[{i}]" + (f"({con['name']})" if isinstance(con.get('name'), str) else "")
+        lb, ub = con.get('lb'), con.get('ub')
+        if lb is None and ub is None:
+            errors.append(f"{where} 缺少 lb/ub")
+        for key, value in (('lb', lb), ('ub', ub)):
+            if value is not None and not _is_number(value):
+                errors.append(f"{where} 的 {key} 必须是数字或 null")
+            elif is_cp and value is not None and not float(value).is_integer():
+                fractional.append(f"{where} 的 {key}")
+        if 'sum' in con:
+            name, axis = con['sum'], con.get('axis')
+            if not isinstance(name, str) or name not in shapes:
+                errors.append(f"{where} 引用了未定义的变量块 {name!r}")
+                continue
+            if axis is not None and not (_is_index(axis) and 0 <= axis < len(shapes[name])):
+                errors.append(f"{where} 的 axis 超出范围")
+            coeffs = con.get('coeffs')
+            if coeffs is not None:
+                if _array_shape(coeffs) != tuple(shapes[name]):
+                    errors.append(f"{where} 的 coeffs 必须是与变量块同形状的数字数组")
+                elif is_cp and not _integral(coeffs):
+                    fractional.append(f"{where} 的 coeffs")
+        else:
+            check_linear(where, con)
+    groups = _list(ir, 'all_different')
+    if not isinstance(groups, list):
+        errors.append("all_different 必须是数组")
+        groups = []
+    if groups and not is_cp:
+        errors.append("all_different 只能用于 CP 模型")
+    for g, group in enumerate(groups):
+        if not isinstance(group, list):
+            errors.append(f"all_different[{g}] 必须是数组")
+            continue
+        for ref in group:
+            if not (isinstance(ref, list) and len(ref) == 2 and isinstance(ref[0], str) and ref[0] in shapes
+                    and _index_ok(ref[1], shapes[ref[0]])):
+                errors.append(f"all_different[{g}] 中的引用 {ref!r} 无效")
+    if fractional:
+        errors.append("CP 模型的系数与边界必须为整数：" + "、".join(fractional))
+    return errors
+
+
+class CompiledIR:
+    """
+    The IR flattened to arrays: one global variable vector (bounds, integrality,
+    names) and every constraint as a (variable indices, coefficients, lb, ub) row.
+    """
+
+    def __init__(self, ir):
+        errors = validate_ir(ir)
+        if errors:
+            raise IRValidationError(errors)
+        self.problem_type = ir['problem_type']
+        self.maximize = ir.get('sense', 'minimize') == 'maximize'
+        self.offsets, self.shapes = {}, {}
+        lbs, ubs, integral, names = [], [], [], []
+        offset = 0
+        for var in ir['variables']:
+            name, shape = var['name'], tuple(var.get('shape', []))
+            size = int(np.prod(shape)) if shape else 1
+            kind = var.get('type', 'continuous')
+            lb = 0.0 if kind == 'binary' else _bound(var.get('lb'), 0.0)
+            ub = 1.0 if kind == 'binary' else _bound(var.get('ub'), math.inf)
+            lbs.append(np.broadcast_to(np.asarray(lb, dtype=np.float64), shape).ravel())
+            ubs.append(np.broadcast_to(np.asarray(ub, dtype=np.float64), shape).ravel())
+            integral.append(np.full(size, kind != 'continuous'))
+            if shape:
+                names.extend(f"{name}_" + "_".join(map(str, idx)) for idx in np.ndindex(*shape))
+            else:
+                names.append(name)
+            self.offsets[name], self.shapes[name] = offset, shape
+            offset += size
+        self.lower = np.concatenate(lbs)
+        self.upper = np.concatenate(ubs)
+        self.integral = np.concatenate(integral)
+        self.names = names
+
+        objective = ir.get('objective') or {}
+        self.objective = self._linear(objective)
+        self.objective_constant = float(objective.get('constant') or 0.0)
+        self.rows = []
+        for con in ir.get('constraints') or []:
+            lb, ub = _bound(con.get('lb'), -math.inf), _bound(con.get('ub'), math.inf)
+            if 'sum' in con:
+                for idx, coeffs in self._sum_rows(con):
+                    self.rows.append((idx, coeffs, lb, ub))
+            else:
+                self.rows.append((*self._linear(con), lb, ub))
+        self.all_different = [
+            np.array([self._flat(name, index) for name, index in group], dtype=np.int64)
+            for group in ir.get('all_different') or []
+        ]
+
+    @property
+    def num_variables(self):
+        return len(self.names)
+
+    def _flat(self, name, index):
+        shape = self.shapes[name]
+        index = [] if index is None else ([index] if _is_index(index) else index)
+        return self.offsets[name] + (int(np.ravel_multi_index(index, shape)) if shape else 0)
+
+    def _block(self, name):
+        shape = self.shapes[name]
+        size = int(np.prod(shape)) if shape else 1
+        return np.arange(self.offsets[name], self.offsets[name] + size).reshape(shape)
+
+    def _linear(self, spec):
+        idx, coeffs = [], []
+        for name, index, coeff in spec.get('terms') or []:
+            idx.append(self._flat(name, index))
+            coeffs.append(float(coeff))
+        idx = [np.asarray(idx, dtype=np.int64)]
+        coeffs = [np.asarray(coeffs, dtype=np.float64)]
+        for name, dense in (spec.get('dense') or {}).items():
+            idx.append(self._block(name).ravel())
+            coeffs.append(np.asarray(dense, dtype=np.float64).ravel())
+        idx, coeffs = np.concatenate(idx), np.concatenate(coeffs)
+        keep = coeffs != 0
+        return idx[keep], coeffs[keep]
+
+    def _sum_rows(self, con):
+        block = self._block(con['sum'])
+        coeffs = np.ones(block.shape) if con.get('coeffs') is None else np.asarray(con['coeffs'], dtype=np.float64)
+        axis = con.get('axis')
+        if axis is None or block.ndim <= 1:
+            yield block.ravel(), coeffs.ravel()
+            return
+        block = np.moveaxis(block, axis, -1).reshape(-1, block.shape[axis])
+        coeffs = np.moveaxis(coeffs, axis, -1).reshape(-1, coeffs.shape[axis])
+        for idx, c in zip(block, coeffs):
+            yield idx, c
+
+
+def _race_linear(compiled, model, config):
+    """Portfolio race of a model_builder model, through a pywraplp solver loaded from its proto."""
+    from ortools.linear_solver import pywraplp
+    from executor import _lp_result
+    import solver_config
+
+    solver = pywraplp.Solver.CreateSolver('SCIP' if compiled.integral.any() else 'GLOP')
+    solver.LoadModelFromProto(model.export_to_proto())
+    if hasattr(pywraplp.Solver.Solve, '__wrapped__'):
+        # In an execution worker the Solve hook races with the job's config, its stop event and progress
+        status = solver.Solve()
+    else:
+        status, solver.portfolio_backend = solver_config.solve_portfolio(solver, config)
+    result = _lp_result(solver, status)
+    result.names = compiled.names
+    return result
+
+
+def _solve_linear(compiled, config=None):
+    import pandas as pd
+    import solver_config
+    from executor import SolveResult
+    from ortools.linear_solver.python import model_builder as mb
+
+    model = mb.Model()
+    variables = model.new_var_series(
+        'v', pd.RangeIndex(compiled.num_variables),
+        lower_bounds=pd.Series(compiled.lower),
+        upper_bounds=pd.Series(compiled.upper),
+        is_integral=pd.Series(compiled.integral),
+    )
+    all_vars = variables.to_numpy()
+    for idx, coeffs, lb, ub in compiled.rows:
+        model.add_linear_constraint(mb.LinearExpr.weighted_sum(all_vars[idx], coeffs), lb=lb, ub=ub)
+    idx, coeffs = compiled.objective
+    objective = mb.LinearExpr.weighted_sum(all_vars[idx], coeffs, constant=compiled.objective_constant)
+    if compiled.maximize:
+        model.maximize(objective)
+    else:
+        model.minimize(objective)
+
+    if config is not None and config.portfolio:
+        return _race_linear(compiled, model, config)
+    backend = 'scip' if compiled.integral.any() else 'glop'
+    solver = mb.Solver(backend)
+    if config is not None:
+        solver_config.configure_model_builder(solver, config, backend)
+    status = solver.solve(model)
+    result = SolveResult('model_builder', status.name, wall_time=solver.wall_time, names=compiled.names)
+    if result.has_solution:
+        result.objective, result.best_bound = solver.objective_value, solver.best_objective_bound
+        result.values = solver.values(variables).to_numpy(dtype=np.float64)
+    return result
+
+
+def _solve_cp(compiled, config=None):
+    from ortools.sat.python import cp_model
+    import solver_config
+
+    model = cp_model.CpModel()
+    lower = np.clip(compiled.lower, -CP_DOMAIN_LIMIT, CP_DOMAIN_LIMIT).astype(np.int64)
+    upper = np.clip(compiled.upper, -CP_DOMAIN_LIMIT, CP_DOMAIN_LIMIT).astype(np.int64)
+    variables = [model.NewIntVar(int(lo), int(hi), name) for lo, hi, name in zip(lower, upper, compiled.names)]
+    as_array = np.empty(len(variables), dtype=object)
+    as_array[:] = variables
+    for idx, coeffs, lb, ub in compiled.rows:
+        model.AddLinearConstraint(
+            cp_model.LinearExpr.WeightedSum(list(as_array[idx]), [int(c) for c in coeffs]),
+            int(lb) if math.isfinite(lb) else cp_model.INT_MIN,
+            int(ub) if math.isfinite(ub) else cp_model.INT_MAX,
+        )
+    for group in compiled.all_different:
+        model.AddAllDifferent(list(as_array[group]))
+    idx, coeffs = compiled.objective
+    if len(idx):
+        objective = cp_model.LinearExpr.WeightedSum(list(as_array[idx]), [int(c) for c in coeffs])
+        objective += int(compiled.objective_constant)
+        if compiled.maximize:
+            model.Maximize(objective)
+        else:
+            model.Minimize(objective)
+
+    solver = cp_model.CpSolver()
+    if config is not None:
+        solver_config.configure_cp(solver, config)
+    status = solver.Solve(model)
+    return solver.StatusName(status), solver, lambda: np.array([solver.Value(v) for v in variables], dtype=np.float64)
+
+
+def solve_ir(ir, time_limit=None, config=None):
+    """
+    Validates, builds and solves an IR model; returns an executor.SolveResult.
+    config is a solver_config.SolverConfig: threads, gap and time limit for
+    every model, and a portfolio race of LP/MIP models. time_limit, if given,
+    replaces config.time_limit.
+    """
+    from executor import SolveResult
+    from solver_config import SolverConfig
+
+    if time_limit:
+        config = replace(config, time_limit=time_limit) if config is not None else SolverConfig(time_limit=time_limit)
+    compiled = ir if isinstance(ir, CompiledIR) else CompiledIR(ir)
+    if compiled.problem_type == 'CP':
+        status, solver, values = _solve_cp(compiled, config)
+        result = SolveResult('cp_sat', status, wall_time=solver.WallTime(), names=compiled.names)
+        if result.has_solution and len(compiled.objective[0]):
+            result.objective, result.best_bound = solver.ObjectiveValue(), solver.BestObjectiveBound()
+        if result.has_solution:
+            result.values = values()
+    else:
+        result = _solve_linear(compiled, config)
+    if not result.has_solution:
+        result.values = np.full(compiled.num_variables, np.nan)
+    return result
+
+
+def format_solution(result, max_lines=1000):
+    """Plain-text report in the same shape as generated code prints."""
+    lines = [f"Status = {result.status}"]
+    if result.objective is not None:
+        lines.append(f"Objective value = {result.objective:g}")
+    if result.has_solution:
+        nonzero = np.flatnonzero(result.values != 0)
+        for i in nonzero[:max_lines]:
+            lines.append(f"{result.names[i]} = {result.values[i]:g}")
+        if len(nonzero) > max_lines:
+            lines.append(f"... 其余 {len(nonzero) - max_lines} 个非零变量未列出")
+    return "\n".join(lines) + "\n"
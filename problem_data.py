@@ -0,0 +1,123 @@
+"""
+Dataset attachments for problems.
+
+CSV, Parquet and NumPy files are converted once to .npy files in a local
+cache directory, keyed by content hash, with the numeric column names in a
+.json file beside each; a file seen before is only hashed and memory-mapped. The LLM only sees a short schema description (name, shape,
+dtype, columns); the execution workers receive the arrays memory-mapped and
+read-only under the same names, so the data never travels through the prompt.
+"""
+import hashlib
+import json
+import os
+import re
+from dataclasses import dataclass, field
+
+import numpy as np
+
+DATA_CACHE_DIR = os.environ.get(
+    'ORTOOLS_DATA_CACHE',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), '.cache', 'datasets'),
+)
+SUPPORTED_EXTENSIONS = ('.csv', '.parquet', '.npy')
+
+
+@dataclass
+class DatasetRef:
+    name: str
+    path: str
+    shape: tuple
+    dtype: str
+    source: str
+    columns: list = field(default_factory=list)
+
+
+def _identifier(text):
+    name = re.sub(r"\W", "_", text).strip("_") or "data"
+    return f"data_{name}" if name[0].isdigit() else name
+
+
+def _file_digest(path):
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()[:20]
+
+
+def load_dataset(path, name=None, cache_dir=DATA_CACHE_DIR):
+    """
+    Registers a data file and returns its DatasetRef. Tabular files keep their
+    numeric columns as a 2-D float64 array (1-D for a single column).
+    """
+    ext = os.path.splitext(path)[1].lower()
+    if ext not in SUPPORTED_EXTENSIONS:
+        raise ValueError(f"不支持的数据文件类型：{ext}（支持 {', '.join(SUPPORTED_EXTENSIONS)}）")
+    name = _identifier(name or os.path.splitext(os.path.basename(path))[0])
+    if ext == '.npy':
+        array = np.load(path, mmap_mode='r')
+        return DatasetRef(name, os.path.abspath(path), tuple(array.shape), str(array.dtype), path)
+
+    os.makedirs(cache_dir, exist_ok=True)
+    digest = _file_digest(path)
+    npy_path = os.path.join(cache_dir, f"{digest}.npy")
+    # Numeric column names of the cached array, so a cache hit does not parse the file
+    columns_path = os.path.join(cache_dir, f"{digest}.json")
+    if os.path.exists(npy_path) and os.path.exists(columns_path):
+        with open(columns_path, encoding='utf-8') as f:
+            columns = json.load(f)
+    else:
+        import pandas as pd
+        frame = pd.read_csv(path) if ext == '.csv' else pd.read_parquet(path)
+        numeric = frame.select_dtypes(include='number')
+        if numeric.empty:
+            raise ValueError(f"{os.path.basename(path)} 中没有数值列")
+        array = numeric.to_numpy(dtype=np.float64)
+        if array.shape[1] == 1:
+            array = array[:, 0]
+        tmp_path = npy_path + f".{os.getpid()}.tmp.npy"
+        np.save(tmp_path, array)
+        os.replace(tmp_path, npy_path)
+        columns = [str(c) for c in numeric.columns]
+        tmp_path = columns_path + f".{os.getpid()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(columns, f, ensure_ascii=False)
+        os.replace(tmp_path, columns_path)
+    array = np.load(npy_path, mmap_mode='r')
+    return DatasetRef(name, npy_path, tuple(array.shape), str(array.dtype), path, columns)
+
+
+def parse_data_args(specs):
+    """Turns CLI values of the form `name=path` or `path` into DatasetRefs."""
+    refs = []
+    for spec in specs or []:
+        name, sep, path = spec.partition('=')
+        refs.append(load_dataset(path, name) if sep else load_dataset(spec))
+    return refs
+
+
+def describe_datasets(refs):
+    """Prompt section listing the injected arrays by name, shape and dtype only."""
+    if not refs:
+        return ""
+    lines = [
+        "",
+        "输入数据（已作为只读 NumPy 数组预加载到执行环境中，代码中直接使用下列变量名；"
+        "不要硬编码这些数据，也不要读取文件。此规则优先于“数据硬编码”的要求）：",
+    ]
+    for ref in refs:
+        line = f"- `{ref.name}`: numpy.ndarray, shape={ref.shape}, dtype={ref.dtype}"
+        if ref.columns:
+            shown = ", ".join(ref.columns[:50]) + (" ..." if len(ref.columns) > 50 else "")
+            line += f"，列依次为：{shown}"
+        lines.append(line)
+    return "\n".join(lines)
+
+
+def with_datasets(problem_description, refs):
+    return problem_description + ("\n" + describe_datasets(refs) if refs else "")
+
+
+def load_namespace(datasets):
+    """Memory-maps (name, path) pairs into a dict for the execution globals."""
+    return {name: np.load(path, mmap_mode='r') for name, path in datasets or []}
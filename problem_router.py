@@ -0,0 +1,135 @@
+"""
+Local problem-type router.
+
+A keyword/structure classifier tags a problem as LP, MIP, CP or ASSIGNMENT
+(assignment, knapsack and similar textbook combinatorial models) without any
+network call. Each class has a short system prompt covering only the API it
+needs, and small, clearly recognised problems are sent to a fast model with
+thinking disabled while everything else keeps the strong model with thinking.
+"""
+import re
+from dataclasses import dataclass
+
+PROBLEM_CLASSES = ('LP', 'MIP', 'CP', 'ASSIGNMENT')
+CLASS_LABELS = {'LP': '线性规划', 'MIP': '混合整数规划', 'CP': '约束规划', 'ASSIGNMENT': '指派/背包'}
+
+# (pattern, weight) per class; a class scores the sum of the weights that match.
+_RULES = {
+    'LP': [
+        (r'线性规划|linear program|连续变量|可以是小数|比例|百分比|吨|公斤|千克|升|立方米', 2),
+        (r'[\d.]*\s*[a-zA-Z]\w*\s*[+\-]\s*[\d.]*\s*[a-zA-Z]\w*\s*(<=|>=|≤|≥|=)', 2),
+        (r'最大化|最小化|maximi[sz]e|minimi[sz]e|利润|成本|产量', 1),
+    ],
+    'MIP': [
+        (r'整数|integer|0-1|0/1|二进制|binary|布尔', 3),
+        (r'选址|开设|是否建|固定成本|fixed cost|启用|至少选|最多选|批量', 2),
+        (r'\d+\s*(台|辆|件|箱|人|名)', 1),
+    ],
+    'CP': [
+        (r'互不相同|各不相同|不相同|不能相同|都不同|all[ -]?different|!=|≠|不等于', 3),
+        (r'数独|sudoku|谜题|puzzle|逻辑推理|皇后|queens|着色|coloring|排班|轮班|shift|排程|调度|scheduling'
+         r'|job ?shop|工序|不重叠|no[ -]?overlap|时间窗', 3),
+        (r'所有解|全部解|可行解|满足.{0,10}条件', 1),
+    ],
+    'ASSIGNMENT': [
+        (r'指派|assignment|分配到|分配给|工人.{0,12}任务|每个任务|每项任务|成本矩阵|cost matrix', 3),
+        (r'背包|knapsack|物品|装箱|bin ?packing|容量', 3),
+    ],
+}
+_COMPILED = {cls: [(re.compile(p, re.IGNORECASE), w) for p, w in rules] for cls, rules in _RULES.items()}
+# Ties go to the class whose prompt covers the most ground
+_TIE_ORDER = ('MIP', 'CP', 'ASSIGNMENT', 'LP')
+
+EASY_CLASSES = ('LP', 'ASSIGNMENT')
+EASY_MAX_CHARS = 300
+EASY_MAX_NUMBERS = 40
+EASY_MIN_MARGIN = 2
+
+_HEADER = "你是 Google OR-Tools 专家。把自然语言的优化问题翻译为可执行的 Python 代码。\n\n"
+_RULES_FOOTER = """
+规则：
+ - 只输出被 ```python 包裹的代码块，代码块外不要有任何解释文字。
+ - 假设所有输入数据均在脚本中硬编码。
+ - 明确打印目标值（如适用）和所有变量取值。
+"""
+
+CLASS_PROMPTS = {
+    'LP': _HEADER + """线性规划（连续变量）：
+- `from ortools.linear_solver import pywraplp`；`solver = pywraplp.Solver.CreateSolver('GLOP')`
+- 变量：`x = solver.NumVar(0, solver.infinity(), 'x')`
+- 约束：`solver.Add(2*x + 3*y <= 10)`；目标：`solver.Maximize(3*x + 4*y)`
+- 求解：`status = solver.Solve()`，检查 `status == pywraplp.Solver.OPTIMAL`
+- 输出：`solver.Objective().Value()`、`x.solution_value()`
+""" + _RULES_FOOTER,
+    'MIP': _HEADER + """混合整数规划：
+- `from ortools.linear_solver import pywraplp`；`solver = pywraplp.Solver.CreateSolver('SCIP')`
+- 变量：整数 `solver.IntVar(0, 10, 'x')`，0-1 `solver.BoolVar('y')`，连续 `solver.NumVar(0, solver.infinity(), 'z')`
+- 约束：`solver.Add(...)`（pywraplp 不支持 `!=`，逻辑关系用 0-1 变量与大 M 表达）；目标：`solver.Minimize(...)`
+- 求解：`status = solver.Solve()`，检查 `status in (pywraplp.Solver.OPTIMAL, pywraplp.Solver.FEASIBLE)`
+- 输出：`solver.Objective().Value()`、`x.solution_value()`
+""" + _RULES_FOOTER,
+    'CP': _HEADER + """约束规划（逻辑、互不相同、排班、调度等离散约束）：
+- `from ortools.sat.python import cp_model`；`model = cp_model.CpModel()`
+- 变量：`x = model.NewIntVar(0, 10, 'x')`、`b = model.NewBoolVar('b')`；区间 `model.NewIntervalVar(start, size, end, 'iv')`
+- 约束：`model.Add(x != y)`、`model.AddAllDifferent(xs)`、`model.AddNoOverlap(intervals)`、`.OnlyEnforceIf(b)`
+- 目标（如有）：`model.Maximize(...)`；所有系数必须为整数
+- 求解：`solver = cp_model.CpSolver(); status = solver.Solve(model)`，检查 `status in (cp_model.OPTIMAL, cp_model.FEASIBLE)`
+- 输出：`solver.ObjectiveValue()`、`solver.Value(x)`（打印所有变量）
+""" + _RULES_FOOTER,
+    'ASSIGNMENT': _HEADER + """指派/背包类 0-1 规划：
+- `from ortools.linear_solver import pywraplp`；`solver = pywraplp.Solver.CreateSolver('SCIP')`
+- 指派：`x[i][j] = solver.BoolVar(f'x_{i}_{j}')`；每个工人至多一个任务 `sum(x[i][j] for j) <= 1`，每个任务恰好一人 `sum(x[i][j] for i) == 1`；最小化 `sum(cost[i][j] * x[i][j])`
+- 背包：`x[i] = solver.BoolVar(f'x_{i}')`；`solver.Add(sum(w[i] * x[i]) <= C)`；最大化 `sum(v[i] * x[i])`
+- 求解：`status = solver.Solve()`；输出 `solver.Objective().Value()` 与每个变量的 `solution_value()`，并说明选中的物品或分配
+""" + _RULES_FOOTER,
+}
+
+
+@dataclass
+class RouteDecision:
+    problem_class: str
+    scores: dict
+    easy: bool
+    model_id: str
+    enable_thinking: bool
+    system_prompt: str
+    escalated: bool = False
+
+    @property
+    def label(self):
+        return CLASS_LABELS[self.problem_class]
+
+
+def classify_problem(problem_description):
+    """Returns (problem_class, scores) from the keyword and structure rules."""
+    scores = {cls: sum(w for pattern, w in rules if pattern.search(problem_description))
+              for cls, rules in _COMPILED.items()}
+    best = max(scores.values())
+    problem_class = next(cls for cls in _TIE_ORDER if scores[cls] == best) if best else 'MIP'
+    return problem_class, scores
+
+
+def is_easy(problem_description, problem_class, scores, has_data=False):
+    """
+    Short, textbook-shaped problems whose class is not in doubt. has_data:
+    datasets are attached (problem_data), so the real instance is larger
+    than the text.
+    """
+    if has_data or problem_class not in EASY_CLASSES or len(problem_description) > EASY_MAX_CHARS:
+        return False
+    if len(re.findall(r'\d+(?:\.\d+)?', problem_description)) > EASY_MAX_NUMBERS:
+        return False
+    runner_up = max(s for cls, s in scores.items() if cls != problem_class)
+    return scores[problem_class] - runner_up >= EASY_MIN_MARGIN
+
+
+def route_problem(problem_description, hard_model_id, fast_model_id, has_data=False):
+    """Chooses prompt, model and thinking mode for a problem."""
+    problem_class, scores = classify_problem(problem_description)
+    easy = is_easy(problem_description, problem_class, scores, has_data)
+    return RouteDecision(
+        problem_class, scores, easy,
+        model_id=fast_model_id if easy else hard_model_id,
+        enable_thinking=not easy,
+        system_prompt=CLASS_PROMPTS[problem_class],
+    )
@@ -0,0 +1,161 @@
+"""
+Anytime progress from solves running in an execution worker.
+
+While a job that asked for progress runs, the solve hooks in executor attach
+the hooks below and report points of the form
+{"backend", "elapsed", "objective", "bound", "gap", "solutions"} to the
+parent process:
+ - CP-SAT: a CpSolverSolutionCallback for every improving solution, plus the
+   solver's best_bound_callback for bound moves;
+ - pywraplp on SCIP: SCIP has no Python callback, but its progress table is
+   printed (and flushed) row by row, so it is read from the worker's stdout
+   while Solve() runs and the dual/primal bound columns are parsed.
+Other backends (GLOP, PDLP, ...) have no intermediate solutions to report.
+watch_stop() interrupts the solve when the parent asks to stop; CP-SAT and
+SCIP then return their best solution found so far as FEASIBLE.
+"""
+import math
+import os
+import re
+import threading
+import time
+from contextlib import contextmanager
+
+# Minimum seconds between reports; improving solutions always go out
+REPORT_INTERVAL = 0.1
+
+# SCIP progress rows: "[heuristic char] <time>s|<node>|...|<dualbound>|<primalbound>|<gap>|<compl.>"
+_SCIP_ROW = re.compile(r"^\s*\S?\s*([\d.]+)s\|")
+
+
+def relative_gap(objective, bound):
+    """|objective - bound| / |objective|, the usual MIP gap; None when undefined."""
+    if objective is None or bound is None or not (math.isfinite(objective) and math.isfinite(bound)):
+        return None
+    if objective == bound:
+        return 0.0
+    return abs(objective - bound) / max(abs(objective), 1e-9)
+
+
+class ProgressTracker:
+    """Keeps the best objective and bound of one solve and throttles reports."""
+
+    def __init__(self, report, backend):
+        self.report = report
+        self.backend = backend
+        self.objective = None
+        self.bound = None
+        self.solutions = 0
+        self._start = time.perf_counter()
+        self._last_sent = 0.0
+        self._lock = threading.Lock()
+
+    def update(self, objective=None, bound=None, elapsed=None, solution=False):
+        with self._lock:
+            if solution:
+                self.solutions += 1
+            if objective is not None:
+                self.objective = objective
+            if bound is not None and math.isfinite(bound):
+                self.bound = bound
+            now = time.perf_counter()
+            if not solution and now - self._last_sent < REPORT_INTERVAL:
+                return
+            self._last_sent = now
+            point = {
+                "backend": self.backend,
+                "elapsed": elapsed if elapsed is not None else now - self._start,
+                "objective": self.objective,
+                "bound": self.bound,
+                "gap": relative_gap(self.objective, self.bound),
+                "solutions": self.solutions,
+            }
+        self.report(point)
+
+
+def cp_solution_callback(tracker):
+    """A CpSolverSolutionCallback that reports every solution CP-SAT finds."""
+    from ortools.sat.python import cp_model
+
+    class _Progress(cp_model.CpSolverSolutionCallback):
+        def on_solution_callback(self):
+            tracker.update(self.ObjectiveValue(), self.BestObjectiveBound(), self.WallTime(), solution=True)
+
+    return _Progress()
+
+
+def parse_scip_row(line):
+    """(elapsed, dual_bound, primal_bound) of a SCIP progress row, or None."""
+    m = _SCIP_ROW.match(line)
+    if not m:
+        return None
+    cells = [c.strip() for c in line.split('|')]
+    if len(cells) < 5:
+        return None
+
+    def number(text):
+        try:
+            return float(text)
+        except ValueError:
+            # "--" before the first solution
+            return None
+
+    return float(m.group(1)), number(cells[-4]), number(cells[-3])
+
+
+@contextmanager
+def scip_log_progress(solver, tracker):
+    """
+    Enables SCIP output for the duration of a Solve() and feeds its progress
+    rows to the tracker. The log goes to file descriptor 1 of the worker, which
+    is pointed at a pipe meanwhile; generated code prints through Python's
+    sys.stdout, which the worker captures separately, so nothing is lost.
+    """
+    read_fd, write_fd = os.pipe()
+    saved = os.dup(1)
+
+    def read():
+        with os.fdopen(read_fd, 'r', errors='replace') as log:
+            for line in log:
+                row = parse_scip_row(line)
+                if row is not None:
+                    elapsed, dual, primal = row
+                    found = primal is not None and primal != tracker.objective
+                    tracker.update(primal, dual, elapsed, solution=found)
+
+    reader = threading.Thread(target=read, name='scip-log', daemon=True)
+    reader.start()
+    os.dup2(write_fd, 1)
+    solver.EnableOutput()
+    try:
+        yield
+    finally:
+        solver.SuppressOutput()
+        os.dup2(saved, 1)
+        os.close(saved)
+        os.close(write_fd)
+        reader.join(1)
+
+
+@contextmanager
+def watch_stop(stop_event, interrupt):
+    """
+    Calls interrupt() once stop_event is set, and again every 50 ms until the
+    block exits: an interrupt that lands before the solver has started its
+    search (e.g. while SCIP presolves) would otherwise be lost.
+    """
+    done = threading.Event()
+
+    def watch():
+        while not done.is_set():
+            if stop_event.wait(0.05):
+                interrupt()
+                done.wait(0.05)
+
+    watcher = threading.Thread(target=watch, name='solve-stop', daemon=True)
+    watcher.start()
+    try:
+        yield
+    finally:
+        done.set()
+        watcher.join(1)
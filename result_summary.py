@@ -0,0 +1,79 @@
+"""
+Deterministic Chinese conclusion of a solve, built from templates.
+
+The conclusion the LLM summary used to produce is mostly a restatement of
+the solver status, the objective and the nonzero variables, all of which the
+executor already reads from the solver objects. local_summary() writes that
+text locally in microseconds; the LLM summary is only requested on demand
+(main.asummarize_result, cached by problem and output hash).
+"""
+import math
+
+from progress import relative_gap
+
+# Nonzero variables listed by name, largest absolute value first
+MAX_LISTED = 10
+NONZERO_TOL = 1e-9
+
+_STATUS_TEXT = {
+    "OPTIMAL": "已找到最优解。",
+    "FEASIBLE": "已找到可行解，但尚未证明最优。",
+    "INFEASIBLE": "问题无可行解：约束条件之间存在矛盾，请检查约束或放宽限制。",
+    "UNBOUNDED": "目标函数无界：可能缺少约束条件或变量上下界。",
+    "MODEL_INVALID": "模型无效：求解器拒绝了该模型，请检查系数与变量定义。",
+    "ABNORMAL": "求解器异常终止，未得到可用的解。",
+    "NOT_SOLVED": "求解器未能在限制内得到解（可能达到时间上限）。",
+}
+
+
+def format_number(value):
+    """Integral values without decimals, others with up to 6 significant digits."""
+    if value is None or not math.isfinite(value):
+        return str(value)
+    if abs(value - round(value)) < 1e-6 * max(1.0, abs(value)):
+        return str(int(round(value)))
+    return f"{value:.6g}"
+
+
+def _variables_sentence(names, values):
+    # Names are looked up for the nonzero values only (run_store serves them lazily)
+    nonzero = [(names[i], v) for i, v in enumerate(values) if abs(v) > NONZERO_TOL]
+    if not nonzero:
+        return f"全部 {len(names)} 个变量取值均为 0。" if names else ""
+    nonzero.sort(key=lambda item: -abs(item[1]))
+    listed = "，".join(f"{n} = {format_number(v)}" for n, v in nonzero[:MAX_LISTED])
+    more = f" 等（共 {len(nonzero)} 个非零变量）" if len(nonzero) > MAX_LISTED else ""
+    zeros = len(names) - len(nonzero)
+    rest = f"其余 {zeros} 个变量为 0。" if zeros else ""
+    return f"主要变量取值：{listed}{more}。{rest}"
+
+
+def local_summary(solve=None, parsed=None, stopped=False):
+    """
+    Conclusion from an executor.SolveResult, or from parse_exec_output's dict
+    for programs whose solver the executor cannot read.
+    """
+    if solve is None:
+        if parsed is None or (parsed["objective"] is None and not parsed["variables"]):
+            return "程序已运行完成，但输出中未识别到目标值或变量取值，请查看原始输出日志。"
+        parts = ["程序已运行完成。"]
+        if parsed["objective"] is not None:
+            parts.append(f"目标值为 {format_number(float(parsed['objective']))}。")
+        parts.append(_variables_sentence([v["变量"] for v in parsed["variables"]],
+                                         [v["值"] for v in parsed["variables"]]))
+        return "".join(parts)
+
+    parts = [_STATUS_TEXT.get(solve.status, f"求解结束，状态为 {solve.status}。")]
+    if stopped and solve.status == "FEASIBLE":
+        parts[0] = "求解已按要求提前停止，以下为停止时找到的最优可行解（尚未证明最优）。"
+    if solve.has_solution:
+        if solve.objective is not None:
+            parts.append(f"目标值为 {format_number(solve.objective)}")
+            gap = relative_gap(solve.objective, solve.best_bound)
+            if solve.status == "FEASIBLE" and gap is not None:
+                parts.append(f"，当前最优界为 {format_number(solve.best_bound)}，相对间隙 {gap:.2%}")
+            parts.append("。")
+        parts.append(_variables_sentence(solve.names, solve.values))
+    if solve.wall_time is not None:
+        parts.append(f"求解耗时 {solve.wall_time:.3f} 秒（{solve.backend}）。")
+    return "".join(parts)
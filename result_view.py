@@ -0,0 +1,161 @@
+"""
+Streamlit views for decision-variable results.
+
+Small models get the original per-variable bar chart. Above
+LARGE_MODEL_THRESHOLD variables every view is aggregated on the server
+(top-k, histogram, prefix groups, index heatmap) and the table is paginated,
+so the amount of data sent to the browser stays bounded.
+"""
+import altair as alt
+import numpy as np
+import pandas as pd
+import streamlit as st
+
+LARGE_MODEL_THRESHOLD = 300
+PAGE_SIZE = 200
+TOP_K = 50
+HISTOGRAM_BINS = 40
+HEATMAP_MAX_CELLS = 80
+NONZERO_TOL = 1e-9
+
+# "x_3_7", "x[3][7]", "x[3,7]", "x(3, 7)" -> prefix "x", indices "3_7" / "3][7" / ...
+_INDEX_PATTERN = r"^(?P<prefix>.*?)[_\[\(]?(?P<index>\d+(?:\D+\d+)*)\W*$"
+
+
+def split_names(names):
+    """Splits variable names into a prefix and a list of index digit strings."""
+    parts = pd.Series(names, dtype=object).astype(str).str.extract(_INDEX_PATTERN)
+    prefix = parts["prefix"].fillna(pd.Series(names, dtype=object).astype(str))
+    prefix = prefix.where(prefix.str.len() > 0, "(无前缀)")
+    indices = parts["index"].fillna("").str.findall(r"\d+")
+    return prefix, indices
+
+
+def _nonzero(df):
+    return df[df["值"].abs() > NONZERO_TOL]
+
+
+def render_table(df_vars, key):
+    if len(df_vars) <= PAGE_SIZE:
+        st.dataframe(df_vars, use_container_width=True, hide_index=True)
+        return
+    nonzero_only = st.checkbox("仅显示非零变量", value=True, key=f"{key}_nz")
+    query = st.text_input("按变量名筛选：", key=f"{key}_q", placeholder="例如 x_3")
+    df = _nonzero(df_vars) if nonzero_only else df_vars
+    if query:
+        df = df[df["变量"].str.contains(query, regex=False)]
+    total = len(df)
+    if total <= PAGE_SIZE:
+        st.dataframe(df, use_container_width=True, hide_index=True)
+        return
+    pages = (total + PAGE_SIZE - 1) // PAGE_SIZE
+    page = st.number_input(f"页码（共 {pages} 页，{total} 行）", 1, pages, 1, key=f"{key}_page")
+    start = (page - 1) * PAGE_SIZE
+    st.dataframe(df.iloc[start:start + PAGE_SIZE], use_container_width=True, hide_index=True)
+
+
+def _bar_chart(df_vars):
+    return alt.Chart(df_vars).mark_bar().encode(
+        x=alt.X('变量', sort=None, title='决策变量'),
+        y=alt.Y('值', title='数值结果'),
+        color=alt.Color('变量', legend=None),
+        tooltip=['变量', '值']
+    ).properties(
+        title='决策变量结果分布'
+    ).interactive()
+
+
+def _top_k_chart(df_vars, k):
+    top = df_vars.loc[df_vars["值"].abs().nlargest(k).index]
+    return alt.Chart(top).mark_bar().encode(
+        x=alt.X('变量', sort='-y', title='决策变量'),
+        y=alt.Y('值', title='数值结果'),
+        tooltip=['变量', '值']
+    ).properties(title=f'取值绝对值最大的 {len(top)} 个变量')
+
+
+def _histogram_chart(values):
+    counts, edges = np.histogram(values[np.isfinite(values)], bins=HISTOGRAM_BINS)
+    hist = pd.DataFrame({"下界": edges[:-1], "上界": edges[1:], "变量个数": counts})
+    return alt.Chart(hist).mark_bar().encode(
+        x=alt.X('下界', bin='binned', title='取值区间'),
+        x2='上界',
+        y=alt.Y('变量个数', title='变量个数'),
+        tooltip=['下界', '上界', '变量个数']
+    ).properties(title='变量取值直方图')
+
+
+def _group_table(df_vars, prefix):
+    values = df_vars["值"]
+    grouped = values.groupby(prefix.values)
+    table = pd.DataFrame({
+        "变量个数": grouped.size(),
+        "非零个数": (values.abs() > NONZERO_TOL).groupby(prefix.values).sum(),
+        "合计": grouped.sum(),
+        "均值": grouped.mean(),
+        "最大值": grouped.max(),
+    })
+    table.index.name = "前缀"
+    return table.reset_index()
+
+
+def _heatmap_chart(df_vars, prefix, indices, name):
+    mask = ((prefix == name) & (indices.str.len() == 2)).to_numpy()
+    idx = np.array(indices[mask].tolist(), dtype=np.int64)
+    grid = pd.DataFrame({"行": idx[:, 0], "列": idx[:, 1], "值": df_vars["值"].to_numpy()[mask]})
+    # Fold large index ranges into at most HEATMAP_MAX_CELLS blocks per axis
+    for axis in ("行", "列"):
+        span = grid[axis].max() - grid[axis].min() + 1
+        if span > HEATMAP_MAX_CELLS:
+            block = int(np.ceil(span / HEATMAP_MAX_CELLS))
+            grid[axis] = grid[axis] // block * block
+    grid = grid.groupby(["行", "列"], as_index=False)["值"].mean()
+    return alt.Chart(grid).mark_rect().encode(
+        x=alt.X('列:O', title='第二个下标'),
+        y=alt.Y('行:O', title='第一个下标'),
+        color=alt.Color('值:Q', title='取值（块内均值）'),
+        tooltip=['行', '列', '值']
+    ).properties(title=f'{name}[i, j] 取值热力图')
+
+
+def render_chart(df_vars, key):
+    if len(df_vars) <= LARGE_MODEL_THRESHOLD:
+        st.altair_chart(_bar_chart(df_vars), use_container_width=True)
+        return
+
+    prefix, indices = split_names(df_vars["变量"])
+    two_d = sorted(prefix[indices.str.len() == 2].unique())
+    views = ["Top-K", "取值直方图", "按前缀分组"] + (["下标热力图"] if two_d else [])
+    st.caption(f"共 {len(df_vars)} 个变量，已切换为聚合视图。")
+    view = st.radio("视图：", views, horizontal=True, key=f"{key}_view")
+    if view == "Top-K":
+        k = st.slider("显示变量数", 10, 200, TOP_K, key=f"{key}_k")
+        st.altair_chart(_top_k_chart(df_vars, k), use_container_width=True)
+    elif view == "取值直方图":
+        st.altair_chart(_histogram_chart(df_vars["值"].to_numpy()), use_container_width=True)
+    elif view == "按前缀分组":
+        table = _group_table(df_vars, prefix)
+        st.altair_chart(alt.Chart(table).mark_bar().encode(
+            x=alt.X('前缀', sort='-y'),
+            y=alt.Y('合计', title='取值合计'),
+            tooltip=list(table.columns)
+        ).properties(title='按变量名前缀汇总'), use_container_width=True)
+        st.dataframe(table, use_container_width=True, hide_index=True)
+    else:
+        name = st.selectbox("变量前缀：", two_d, key=f"{key}_heat")
+        st.altair_chart(_heatmap_chart(df_vars, prefix, indices, name), use_container_width=True)
+
+
+# Widgets inside a fragment rerun only the fragment, so paging or switching
+# views does not rerun the whole page (and the solve) again.
+fragment = getattr(st, 'fragment', None) or getattr(st, 'experimental_fragment')
+
+
+@fragment
+def render_variables(df_vars, key="vars"):
+    """Variable table and chart tabs, aggregated automatically for large models."""
+    tab1, tab2 = st.tabs(["📋 变量数据表", "📈 变量分布图"])
+    with tab1:
+        render_table(df_vars, key)
+    with tab2:
+        render_chart(df_vars, key)
@@ -0,0 +1,268 @@
+"""
+Persistent, indexed history of solves.
+
+Every run of the CLI (single, candidates, IR and batch) and of the web app is
+recorded once it finishes: one metadata row per run in a SQLite database,
+indexed by problem hash, model, time and status, plus the variable vector of
+the solution in its own uncompressed Arrow IPC file. Arrow files are read
+through a memory map, so opening a run with millions of variables touches only
+the pages that are actually used, and the values column is a zero-copy NumPy
+view. load_result() rebuilds an executor.ExecResult from the store, which
+re-serves a past solution without generation or a solve.
+
+    ORTOOLS_HISTORY_DIR   directory of runs.sqlite3 and solutions/ (default .cache/history)
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from collections.abc import Sequence
+from dataclasses import dataclass, field
+
+from executor import ExecResult, SolveResult
+
+HISTORY_DIR = os.environ.get(
+    'ORTOOLS_HISTORY_DIR',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), '.cache', 'history'),
+)
+
+# Metadata columns returned by find(); the large text columns are read by get() only
+_META_COLUMNS = ("id", "created", "source", "problem_hash", "problem", "model_id", "status", "solver_status",
+                 "backend", "objective", "best_bound", "wall_time", "elapsed", "num_variables", "summary")
+_FULL_COLUMNS = _META_COLUMNS + ("code", "ir", "stdout", "error", "timed_out", "stopped", "trace", "extra")
+
+
+class ArrowNames(Sequence):
+    """
+    Read-only sequence of variable names over the Arrow string column of a
+    solution file. A name becomes a Python str only when it is accessed, so
+    a result with millions of variables costs nothing until it is read.
+    """
+    # Names converted per step while iterating
+    _BATCH = 4096
+
+    def __init__(self, column):
+        self.column = column
+
+    def __len__(self):
+        return len(self.column)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return ArrowNames(self.column[index])
+        return self.column[index].as_py()
+
+    def __iter__(self):
+        for start in range(0, len(self.column), self._BATCH):
+            yield from self.column.slice(start, self._BATCH).to_pylist()
+
+
+@dataclass
+class RunRecord:
+    """One stored run. Records from find() leave the large fields (code, stdout, ...) as None."""
+    id: str
+    created: float
+    source: str
+    problem_hash: str
+    problem: str
+    model_id: str
+    status: str
+    solver_status: str = None
+    backend: str = None
+    objective: float = None
+    best_bound: float = None
+    wall_time: float = None
+    elapsed: float = None
+    num_variables: int = 0
+    summary: str = None
+    code: str = None
+    ir: dict = None
+    stdout: str = None
+    error: str = None
+    timed_out: bool = False
+    stopped: bool = False
+    trace: dict = None
+    extra: dict = field(default_factory=dict)
+
+
+class RunStore:
+    """
+    SQLite metadata plus Arrow solution files under root. normalize maps a
+    problem text to the canonical form that is hashed, so that runs of the same
+    problem written differently share a problem_hash.
+    """
+
+    def __init__(self, root=HISTORY_DIR, normalize=str.strip):
+        self.root = root
+        self.solutions_dir = os.path.join(root, 'solutions')
+        self.path = os.path.join(root, 'runs.sqlite3')
+        self.normalize = normalize
+        self._lock = threading.Lock()
+        os.makedirs(self.solutions_dir, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS runs ("
+                " id TEXT PRIMARY KEY, created REAL, source TEXT, problem_hash TEXT, problem TEXT, model_id TEXT,"
+                " status TEXT, solver_status TEXT, backend TEXT, objective REAL, best_bound REAL, wall_time REAL,"
+                " elapsed REAL, num_variables INTEGER, summary TEXT, code TEXT, ir TEXT, stdout TEXT, error TEXT,"
+                " timed_out INTEGER, stopped INTEGER, trace TEXT, extra TEXT)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS runs_problem ON runs (problem_hash, created)")
+            conn.execute("CREATE INDEX IF NOT EXISTS runs_model ON runs (model_id, created)")
+            conn.execute("CREATE INDEX IF NOT EXISTS runs_status ON runs (status, created)")
+            conn.execute("CREATE INDEX IF NOT EXISTS runs_created ON runs (created)")
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=30)
+
+    def problem_hash(self, problem):
+        return hashlib.sha256(self.normalize(problem).encode('utf-8')).hexdigest()
+
+    def solution_path(self, run_id):
+        return os.path.join(self.solutions_dir, f"{run_id}.arrow")
+
+    def record(self, problem, model_id, status, result=None, source='cli', code=None, ir=None, summary=None,
+               trace=None, **extra):
+        """
+        Stores a finished run and returns its id. result is the final
+        executor.ExecResult (None when the run failed before executing); the
+        remaining keyword arguments are kept as JSON in `extra`.
+        """
+        run_id = uuid.uuid4().hex
+        solve = result.solve if result is not None else None
+        num_variables = 0
+        if solve is not None and solve.has_solution and len(solve.values):
+            num_variables = self._write_solution(run_id, solve.names, solve.values)
+        row = {
+            "id": run_id, "created": time.time(), "source": source, "problem_hash": self.problem_hash(problem),
+            "problem": problem, "model_id": model_id, "status": status,
+            "solver_status": solve.status if solve is not None else None,
+            "backend": solve.backend if solve is not None else None,
+            "objective": solve.objective if solve is not None else None,
+            "best_bound": solve.best_bound if solve is not None else None,
+            "wall_time": solve.wall_time if solve is not None else None,
+            "elapsed": result.elapsed if result is not None else None,
+            "num_variables": num_variables, "summary": summary, "code": code,
+            "ir": json.dumps(ir, ensure_ascii=False) if ir is not None else None,
+            "stdout": result.stdout if result is not None else None,
+            "error": result.error if result is not None else None,
+            "timed_out": int(result.timed_out) if result is not None else 0,
+            "stopped": int(result.stopped) if result is not None else 0,
+            "trace": json.dumps(trace, ensure_ascii=False, default=str) if trace is not None else None,
+            "extra": json.dumps(extra, ensure_ascii=False, default=str),
+        }
+        with self._lock, self._connect() as conn:
+            conn.execute(f"INSERT INTO runs ({', '.join(row)}) VALUES ({', '.join('?' * len(row))})",
+                         tuple(row.values()))
+        return run_id
+
+    def _write_solution(self, run_id, names, values):
+        import pyarrow as pa
+        table = pa.table({"name": pa.array([str(n) for n in names], type=pa.large_string()),
+                          "value": pa.array(values, type=pa.float64())})
+        path = self.solution_path(run_id)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        # Uncompressed, single record batch: the value column maps straight into NumPy
+        with pa.OSFile(tmp_path, 'wb') as sink, pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table, max_chunksize=max(1, len(table)))
+        os.replace(tmp_path, path)
+        return len(table)
+
+    def update(self, run_id, **fields):
+        """Sets columns of a stored run, e.g. a summary that arrived later; other keys merge into extra."""
+        columns = {k: v for k, v in fields.items() if k in ("status", "summary")}
+        extra = {k: v for k, v in fields.items() if k not in columns}
+        with self._lock, self._connect() as conn:
+            if extra:
+                row = conn.execute("SELECT extra FROM runs WHERE id = ?", (run_id,)).fetchone()
+                if row is None:
+                    return
+                columns["extra"] = json.dumps({**json.loads(row[0] or "{}"), **extra}, ensure_ascii=False,
+                                              default=str)
+            if columns:
+                assignments = ", ".join(f"{k} = ?" for k in columns)
+                conn.execute(f"UPDATE runs SET {assignments} WHERE id = ?", (*columns.values(), run_id))
+
+    def get(self, run_id):
+        """The full RunRecord of a run, or None."""
+        with self._connect() as conn:
+            row = conn.execute(f"SELECT {', '.join(_FULL_COLUMNS)} FROM runs WHERE id = ?", (run_id,)).fetchone()
+        if row is None:
+            return None
+        record = dict(zip(_FULL_COLUMNS, row))
+        record.update(timed_out=bool(record["timed_out"]), stopped=bool(record["stopped"]),
+                      ir=json.loads(record["ir"]) if record["ir"] else None,
+                      trace=json.loads(record["trace"]) if record["trace"] else None,
+                      extra=json.loads(record["extra"]) if record["extra"] else {})
+        return RunRecord(**record)
+
+    def find(self, problem=None, problem_hash=None, model_id=None, status=None, since=None, until=None, limit=50):
+        """Metadata of matching runs, newest first; every filter is served by an index."""
+        clauses, params = [], []
+        if problem is not None:
+            problem_hash = self.problem_hash(problem)
+        for column, value in (("problem_hash", problem_hash), ("model_id", model_id), ("status", status)):
+            if value is not None:
+                clauses.append(f"{column} = ?")
+                params.append(value)
+        if since is not None:
+            clauses.append("created >= ?")
+            params.append(since)
+        if until is not None:
+            clauses.append("created < ?")
+            params.append(until)
+        where = f" WHERE {' AND '.join(clauses)}" if clauses else ""
+        with self._connect() as conn:
+            rows = conn.execute(f"SELECT {', '.join(_META_COLUMNS)} FROM runs{where} ORDER BY created DESC LIMIT ?",
+                                (*params, limit)).fetchall()
+        return [RunRecord(**dict(zip(_META_COLUMNS, row))) for row in rows]
+
+    def latest(self, problem, model_id=None, status="ok"):
+        """The most recent matching run of a problem, or None."""
+        found = self.find(problem=problem, model_id=model_id, status=status, limit=1)
+        return found[0] if found else None
+
+    def solution_table(self, run_id):
+        """The stored variable vector as a memory-mapped pyarrow Table, or None when the run has none."""
+        path = self.solution_path(run_id)
+        if not os.path.exists(path):
+            return None
+        import pyarrow as pa
+        return pa.ipc.open_file(pa.memory_map(path, 'r')).read_all()
+
+    def load_result(self, run_id):
+        """
+        Re-serves a stored run as an executor.ExecResult (None if unknown). The
+        values array is a read-only view of the memory-mapped solution file and
+        names an ArrowNames view of it.
+        """
+        record = self.get(run_id)
+        if record is None:
+            return None
+        solve = None
+        if record.solver_status is not None:
+            solve = SolveResult(record.backend, record.solver_status, record.objective, record.best_bound,
+                                record.wall_time)
+            table = self.solution_table(run_id)
+            if table is not None:
+                solve.names = ArrowNames(table.column("name"))
+                solve.values = table.column("value").to_numpy()
+        return ExecResult(ok=record.status == "ok", stdout=record.stdout or "", error=record.error,
+                          elapsed=record.elapsed or 0.0, timed_out=record.timed_out, solve=solve,
+                          stopped=record.stopped)
+
+    def delete(self, run_id):
+        with self._lock, self._connect() as conn:
+            conn.execute("DELETE FROM runs WHERE id = ?", (run_id,))
+        if os.path.exists(self.solution_path(run_id)):
+            os.remove(self.solution_path(run_id))
+
+    def stats(self):
+        with self._connect() as conn:
+            count, solutions = conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(num_variables > 0), 0) FROM runs").fetchone()
+        return {"runs": count, "solutions": solutions}
@@ -0,0 +1,559 @@
+"""
+Headless solve service: an asyncio HTTP/1.1 server for non-Streamlit clients.
+
+    POST   /v1/jobs              {"problem": ..., "model", "auto_route", "summarize", "data": {name: path},
+                                  "solver": {"threads", "time_limit", "gap", "portfolio"}}  -> 202 {"id"}
+    GET    /v1/jobs/{id}         status, stage timings and generation stats
+    GET    /v1/jobs/{id}/result  the result once finished (202 while running)
+    GET    /v1/jobs/{id}/events  server-sent events: status, reasoning, content, code, result, summary, done
+                                  (streamed chunks are only replayed while the job runs)
+    DELETE /v1/jobs/{id}         cancels a queued or generating job
+    GET    /healthz, /metrics    liveness and the metrics registry (OpenMetrics)
+
+Accepted jobs wait in a bounded queue (429 when full). generation_workers
+threads stream LLM output through the usual on_reasoning/on_content
+callbacks, which are relayed to the event loop and fanned out to SSE
+subscribers. Extracted code then goes to the execution pool, so one job's
+solve does not hold a generation slot. Every successful result carries a
+template conclusion ("summary", result_summary.local_summary); the LLM
+reading ("llm_summary") costs a second round trip and is only requested
+with "summarize": true. Data paths are resolved inside --data-dir
+(ORTOOLS_SERVICE_DATA_DIR) and may not leave it; without one, jobs cannot
+attach data. Point ORTOOLS_LLM_BASE_URL at bench/stub_server.py to run it
+without the live endpoint.
+
+    python service.py --port 8000 --generation-workers 64 --exec-workers 8 --queue-size 1000 --data-dir /srv/data
+"""
+import argparse
+import asyncio
+import json
+import math
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+
+from executor import ExecutionPool, get_pool
+from main import (DEFAULT_MODEL, MAX_REPAIR_ATTEMPTS, asummarize_result, cache_outcome, extract_code,
+                  get_ortools_code_routed, get_ortools_code_stream, get_ortools_code_strict, is_repairable,
+                  parse_exec_output, preflight_code, repair_failed_run, run_async)
+from metrics import OPENMETRICS_CONTENT_TYPE, REGISTRY, Trace, configure as configure_metrics
+from problem_data import parse_data_args, with_datasets
+from result_summary import local_summary
+from solver_config import SolverConfig
+
+DEFAULT_QUEUE_SIZE = 1000
+DEFAULT_GENERATION_WORKERS = 32
+MAX_RETAINED_JOBS = 10000
+MAX_BODY_BYTES = 1 << 20
+SSE_KEEPALIVE = 15.0
+# The only directory job `data` paths may point into (relative to it); unset, no data is accepted
+DATA_DIR = os.environ.get('ORTOOLS_SERVICE_DATA_DIR')
+
+FINAL_STATES = ('done', 'failed', 'cancelled')
+# Streamed text, only replayed while the job runs
+CHUNK_EVENTS = ('reasoning', 'content', 'summary_chunk')
+_REASONS = {200: 'OK', 202: 'Accepted', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed',
+            413: 'Payload Too Large', 429: 'Too Many Requests', 500: 'Internal Server Error'}
+
+
+class RequestError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+@dataclass
+class Job:
+    id: str
+    problem: str
+    model: str
+    auto_route: bool = False
+    summarize: bool = False
+    data: list = field(default_factory=list)
+    solver_config: SolverConfig = None
+    status: str = 'queued'
+    created: float = field(default_factory=time.time)
+    result: dict = None
+    error: str = None
+    trace: Trace = None
+    # (seq, kind, payload); subscribers replay these, then follow live
+    events: list = field(default_factory=list)
+    next_seq: int = 0
+    subscribers: set = field(default_factory=set)
+    cancel_event: threading.Event = field(default_factory=threading.Event)
+
+    def publish(self, kind, payload):
+        event = (self.next_seq, kind, payload)
+        self.next_seq += 1
+        self.events.append(event)
+        for queue in self.subscribers:
+            queue.put_nowait(event)
+
+    def compact(self):
+        """
+        Drops the streamed chunks of a finished job, which would otherwise be
+        retained with it; late subscribers still get status, code, result,
+        summary and done. Sequence numbers are kept, so Last-Event-ID works.
+        """
+        self.events = [e for e in self.events if e[1] not in CHUNK_EVENTS]
+
+    def set_status(self, status):
+        self.status = status
+        self.publish('status', {"status": status})
+
+    def to_dict(self):
+        trace = self.trace
+        return {
+            "id": self.id, "status": self.status, "model": self.model, "created": self.created,
+            "error": self.error,
+            "stages": dict(trace.stages) if trace else {},
+            "generation": trace.generation.to_dict() if trace and trace.generation else None,
+        }
+
+
+def _is_number(value):
+    return isinstance(value, (int, float)) and not isinstance(value, bool) and math.isfinite(value)
+
+
+def _optional(request, key, check, message):
+    """request[key] when it passes check, None when absent; a 400 otherwise."""
+    value = request.get(key)
+    if value is not None and not check(value):
+        raise RequestError(400, message)
+    return value
+
+
+def _parse_solver(solver):
+    if solver is None:
+        return SolverConfig()
+    if not isinstance(solver, dict):
+        raise RequestError(400, "solver 必须是对象")
+    unknown = set(solver) - {'threads', 'time_limit', 'gap', 'portfolio'}
+    if unknown:
+        raise RequestError(400, f"solver 中有未知字段：{', '.join(sorted(unknown))}")
+    return SolverConfig(
+        num_workers=_optional(solver, 'threads', lambda v: isinstance(v, int) and not isinstance(v, bool) and v > 0,
+                              "solver.threads 必须是正整数"),
+        time_limit=_optional(solver, 'time_limit', lambda v: _is_number(v) and v > 0, "solver.time_limit 必须是正数"),
+        relative_gap=_optional(solver, 'gap', lambda v: _is_number(v) and v >= 0, "solver.gap 必须是非负数"),
+        portfolio=bool(_optional(solver, 'portfolio', lambda v: isinstance(v, bool), "solver.portfolio 必须是布尔值")),
+    )
+
+
+def _data_path(path, data_dir):
+    """path resolved inside data_dir; clients cannot name any other file on the server."""
+    if not data_dir:
+        raise RequestError(400, "服务未配置数据目录（--data-dir / ORTOOLS_SERVICE_DATA_DIR），不接受 data 字段")
+    root = os.path.realpath(data_dir)
+    resolved = os.path.realpath(os.path.join(root, path))
+    if os.path.commonpath([root, resolved]) != root:
+        raise RequestError(400, f"数据路径必须位于数据目录之内：{path}")
+    return resolved
+
+
+def _parse_data(data, data_dir):
+    """
+    The `data` field as "name=path" specs: a {name: path} object or a list of
+    "name=path" strings, with paths relative to data_dir.
+    """
+    if data is None:
+        return []
+    if isinstance(data, dict):
+        if not all(isinstance(k, str) and k and isinstance(v, str) and v for k, v in data.items()):
+            raise RequestError(400, "data 必须是 {名称: 路径} 形式的字符串映射")
+        pairs = list(data.items())
+    elif isinstance(data, list) and all(isinstance(spec, str) and spec for spec in data):
+        pairs = [spec.rpartition('=')[::2] for spec in data]
+    else:
+        raise RequestError(400, "data 必须是 {名称: 路径} 对象或 \"名称=路径\" 字符串数组")
+    specs = []
+    for name, path in pairs:
+        resolved = _data_path(path, data_dir)
+        specs.append(f"{name}={resolved}" if name else resolved)
+    return specs
+
+
+def _parse_job(body, default_model, data_dir=None):
+    """Validates a job request (types and shape of every field); a RequestError(400) on bad input."""
+    try:
+        request = json.loads(body or b'{}')
+    except ValueError:
+        raise RequestError(400, "请求体不是有效的 JSON")
+    if not isinstance(request, dict):
+        raise RequestError(400, "请求体必须是 JSON 对象")
+    problem = request.get('problem')
+    if not isinstance(problem, str) or not problem.strip():
+        raise RequestError(400, "缺少 problem 字段")
+    flag = lambda v: isinstance(v, bool)
+    return Job(
+        id=uuid.uuid4().hex,
+        problem=problem,
+        model=_optional(request, 'model', lambda v: isinstance(v, str) and v.strip(), "model 必须是非空字符串")
+        or default_model,
+        auto_route=bool(_optional(request, 'auto_route', flag, "auto_route 必须是布尔值")),
+        summarize=bool(_optional(request, 'summarize', flag, "summarize 必须是布尔值")),
+        data=_parse_data(request.get('data'), data_dir),
+        solver_config=_parse_solver(request.get('solver')),
+    )
+
+
+class SolveService:
+    """Job table, bounded queue and the generation/execution workers behind the HTTP layer."""
+
+    def __init__(self, generation_workers=DEFAULT_GENERATION_WORKERS, queue_size=DEFAULT_QUEUE_SIZE,
+                 pool=None, default_model=DEFAULT_MODEL, max_jobs=MAX_RETAINED_JOBS, data_dir=DATA_DIR):
+        self.generation_workers = generation_workers
+        # Jobs may only attach data files below this directory; None refuses the `data` field
+        self.data_dir = data_dir
+        self.queue_size = queue_size
+        self.pool = pool or get_pool()
+        self.default_model = default_model
+        self.max_jobs = max_jobs
+        self.jobs = OrderedDict()
+        self._queue = None
+        self._loop = None
+        self._threads = ThreadPoolExecutor(max_workers=generation_workers, thread_name_prefix='service-gen')
+        self._tasks = set()
+
+    async def start(self):
+        self._loop = asyncio.get_running_loop()
+        self._queue = asyncio.Queue(maxsize=self.queue_size)
+        for _ in range(self.generation_workers):
+            self._spawn(self._generation_worker())
+
+    def _spawn(self, coro):
+        task = self._loop.create_task(coro)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return task
+
+    def submit(self, job):
+        try:
+            self._queue.put_nowait(job)
+        except asyncio.QueueFull:
+            raise RequestError(429, "任务队列已满，请稍后重试")
+        self.jobs[job.id] = job
+        job.trace = Trace("service", id=job.id, model=job.model)
+        job.set_status('queued')
+        self._evict()
+        return job
+
+    def _evict(self):
+        while len(self.jobs) > self.max_jobs:
+            oldest = next((k for k, j in self.jobs.items() if j.status in FINAL_STATES), None)
+            if oldest is None:
+                return
+            del self.jobs[oldest]
+
+    def cancel(self, job):
+        if job.status not in FINAL_STATES:
+            job.cancel_event.set()
+            if job.status == 'queued':
+                self._finish(job, 'cancelled')
+
+    def _finish(self, job, status, error=None):
+        if job.status in FINAL_STATES:
+            return
+        job.error = error
+        job.set_status(status)
+        job.trace.finish(status)
+        job.publish('done', {"status": status, "error": error})
+        job.compact()
+
+    def _relay(self, job, kind):
+        """Thread-side callback that hands a streamed chunk to the event loop."""
+        loop = self._loop
+
+        def on_chunk(text):
+            loop.call_soon_threadsafe(job.publish, kind, {"text": text})
+        return on_chunk
+
+    async def _in_thread(self, job, stage, fn, *args):
+        with job.trace.stage(stage):
+            return await self._loop.run_in_executor(self._threads, fn, *args)
+
+    def _generate(self, job, prompt, known_names):
+        on_reasoning, on_content = job.trace.stream(self._relay(job, 'reasoning'), self._relay(job, 'content'))
+        if job.auto_route:
+            output, decision = get_ortools_code_routed(prompt, job.model, on_reasoning, on_content,
+                                                        cancel_event=job.cancel_event, has_data=bool(known_names))
+            job.trace.fields.update(problem_class=decision.problem_class, model=decision.model_id)
+        else:
+            output = get_ortools_code_stream(prompt, job.model, on_reasoning, on_content,
+                                             cancel_event=job.cancel_event)
+        code = extract_code(output)
+        if not code and not job.cancel_event.is_set():
+            output = get_ortools_code_strict(prompt, job.model, cancel_event=job.cancel_event)
+            code = extract_code(output)
+        if not code:
+            return None, 0, output
+        code, _, repairs = preflight_code(code, job.model, known_names)
+        return code, repairs, output
+
+    async def _generation_worker(self):
+        while True:
+            job = await self._queue.get()
+            try:
+                if job.status == 'queued':
+                    await self._generate_job(job)
+            except Exception as e:
+                self._finish(job, 'failed', f"{type(e).__name__}: {e}")
+            finally:
+                self._queue.task_done()
+
+    async def _generate_job(self, job):
+        job.set_status('generating')
+        refs = await self._in_thread(job, 'load_data', parse_data_args, job.data) if job.data else []
+        prompt = with_datasets(job.problem, refs)
+        code, repairs, output = await self._in_thread(job, 'generate', self._generate, job, prompt,
+                                                      [r.name for r in refs])
+        if job.cancel_event.is_set():
+            self._finish(job, 'cancelled')
+        elif not code:
+            self._finish(job, 'failed', "未从响应中找到有效的 Python 代码块")
+        else:
+            job.publish('code', {"code": code, "repairs": repairs})
+            # The solve runs off the generation slot
+            self._spawn(self._execute_job(job, code, refs, repairs, output))
+
+    async def _execute_job(self, job, code, refs, repairs, output):
+        try:
+            job.set_status('executing')
+            result = await self._run(job, code, refs)
+            while is_repairable(result) and repairs < MAX_REPAIR_ATTEMPTS and not job.cancel_event.is_set():
+                repaired = await self._in_thread(job, 'repair', repair_failed_run, code, result, job.model)
+                repairs += 1
+                if not repaired:
+                    break
+                code = repaired
+                job.publish('code', {"code": code, "repairs": repairs})
+                result = await self._run(job, code, refs)
+            if job.cancel_event.is_set():
+                self._finish(job, 'cancelled')
+                return
+            job.trace.record_result(result)
+            await self._loop.run_in_executor(self._threads, cache_outcome, output, result.ok, code)
+            with job.trace.stage('parse'):
+                job.result = self._result_dict(code, result, repairs)
+            job.publish('result', job.result)
+            if result.ok:
+                job.publish('summary', {"summary": job.result["summary"], "source": "local"})
+            if job.summarize and result.ok:
+                await self._summarize(job, result.stdout)
+            self._finish(job, 'done' if result.ok else 'failed', None if result.ok else result.error)
+        except Exception as e:
+            self._finish(job, 'failed', f"{type(e).__name__}: {e}")
+
+    async def _run(self, job, code, refs):
+        with job.trace.stage('execute'):
+            return await asyncio.wrap_future(self.pool.submit(code, datasets=refs, solver_config=job.solver_config))
+
+    @staticmethod
+    def _result_dict(code, result, repairs):
+        record = {"ok": result.ok, "code": code, "repairs": repairs, "stdout": result.stdout, "error": result.error,
+                  "timed_out": result.timed_out, "elapsed": result.elapsed}
+        solve = result.solve
+        parsed = None
+        if solve is not None:
+            record.update(solver_status=solve.status, backend=solve.backend, objective=solve.objective,
+                          best_bound=solve.best_bound, solver_wall_time=solve.wall_time,
+                          variables=solve.to_records() if solve.has_solution else [])
+        else:
+            parsed = parse_exec_output(result.stdout)
+            record.update(objective=parsed["objective"], variables=parsed["variables"])
+        if result.ok:
+            record["summary"] = local_summary(solve, parsed, result.stopped)
+        return record
+
+    async def _summarize(self, job, stdout):
+        job.set_status('summarizing')
+        try:
+            with job.trace.stage('summarize'):
+                summary = await asyncio.wrap_future(run_async(asummarize_result(
+                    job.problem, stdout, job.model, on_content=self._relay(job, 'summary_chunk'))))
+        except Exception as e:
+            summary = None
+            job.publish('summary', {"summary": None, "source": "llm", "error": str(e)})
+        else:
+            job.publish('summary', {"summary": summary, "source": "llm"})
+        job.result["llm_summary"] = summary
+
+
+class HttpServer:
+    """Minimal HTTP/1.1 front end with keep-alive; SSE responses end the connection."""
+
+    def __init__(self, service):
+        self.service = service
+
+    async def handle(self, reader, writer):
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line.strip():
+                    break
+                try:
+                    method, target, _ = request_line.decode('latin-1').split(' ', 2)
+                except ValueError:
+                    await self._send_json(writer, 400, {"error": "请求行格式错误"}, keep_alive=False)
+                    break
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b'\r\n', b'\n', b''):
+                        break
+                    name, _, value = line.decode('latin-1').partition(':')
+                    headers[name.strip().lower()] = value.strip()
+                try:
+                    length = int(headers.get('content-length', 0))
+                except ValueError:
+                    length = -1
+                if length < 0:
+                    await self._send_json(writer, 400, {"error": "Content-Length 无效"}, keep_alive=False)
+                    break
+                if length > MAX_BODY_BYTES:
+                    await self._send_json(writer, 413, {"error": "请求体过大"}, keep_alive=False)
+                    break
+                body = await reader.readexactly(length) if length else b''
+                keep_alive = await self.dispatch(method, target.split('?')[0], headers, body, writer)
+                if not keep_alive or headers.get('connection', '').lower() == 'close':
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        except ValueError:
+            # A request or header line longer than the stream limit
+            try:
+                await self._send_json(writer, 400, {"error": "请求行或请求头过长"}, keep_alive=False)
+            except ConnectionError:
+                pass
+        finally:
+            writer.close()
+
+    async def dispatch(self, method, path, headers, body, writer):
+        service = self.service
+        parts = [p for p in path.split('/') if p]
+        try:
+            if path == '/healthz':
+                return await self._send_json(writer, 200, {
+                    "status": "ok", "queued": service._queue.qsize(), "jobs": len(service.jobs)})
+            if path == '/metrics':
+                return await self._send(writer, 200, REGISTRY.render().encode('utf-8'), OPENMETRICS_CONTENT_TYPE)
+            if parts[:2] != ['v1', 'jobs']:
+                raise RequestError(404, "未知路径")
+            if len(parts) == 2:
+                if method != 'POST':
+                    raise RequestError(405, "仅支持 POST")
+                job = service.submit(_parse_job(body, service.default_model, service.data_dir))
+                return await self._send_json(writer, 202, {"id": job.id, "status": job.status})
+            job = service.jobs.get(parts[2])
+            if job is None:
+                raise RequestError(404, "任务不存在")
+            if len(parts) == 3 and method == 'GET':
+                return await self._send_json(writer, 200, job.to_dict())
+            if len(parts) == 3 and method == 'DELETE':
+                service.cancel(job)
+                return await self._send_json(writer, 200, {"id": job.id, "status": job.status})
+            if parts[3:] == ['result'] and method == 'GET':
+                if job.status not in FINAL_STATES:
+                    return await self._send_json(writer, 202, {"id": job.id, "status": job.status})
+                return await self._send_json(writer, 200, {**job.to_dict(), "result": job.result})
+            if parts[3:] == ['events'] and method == 'GET':
+                await self._stream_events(writer, job, headers.get('last-event-id'))
+                return False
+            raise RequestError(404, "未知路径")
+        except RequestError as e:
+            extra = {"Retry-After": "1"} if e.status == 429 else None
+            return await self._send_json(writer, e.status, {"error": str(e)}, extra_headers=extra)
+        except (ConnectionError, asyncio.IncompleteReadError):
+            raise
+        except Exception as e:
+            # Never drop the connection without an answer
+            return await self._send_json(writer, 500, {"error": f"{type(e).__name__}: {e}"}, keep_alive=False)
+
+    async def _send(self, writer, status, body, content_type, keep_alive=True, extra_headers=None):
+        head = [f"HTTP/1.1 {status} {_REASONS.get(status, '')}", f"Content-Type: {content_type}",
+                f"Content-Length: {len(body)}", f"Connection: {'keep-alive' if keep_alive else 'close'}"]
+        head += [f"{k}: {v}" for k, v in (extra_headers or {}).items()]
+        writer.write(("\r\n".join(head) + "\r\n\r\n").encode('latin-1') + body)
+        await writer.drain()
+        return keep_alive
+
+    async def _send_json(self, writer, status, payload, keep_alive=True, extra_headers=None):
+        body = json.dumps(payload, ensure_ascii=False, default=str).encode('utf-8')
+        return await self._send(writer, status, body, 'application/json; charset=utf-8', keep_alive, extra_headers)
+
+    async def _stream_events(self, writer, job, last_event_id=None):
+        writer.write(b"HTTP/1.1 200 OK\r\nContent-Type: text/event-stream; charset=utf-8\r\n"
+                     b"Cache-Control: no-cache\r\nConnection: close\r\n\r\n")
+        start = int(last_event_id) + 1 if last_event_id and last_event_id.isdigit() else 0
+        queue = asyncio.Queue()
+        # Snapshot and subscribe in the same loop step, so no event is missed or sent twice
+        backlog = [e for e in job.events if e[0] >= start]
+        job.subscribers.add(queue)
+        try:
+            for event in backlog:
+                if not await self._write_event(writer, event):
+                    return
+            while True:
+                try:
+                    event = await asyncio.wait_for(queue.get(), SSE_KEEPALIVE)
+                except asyncio.TimeoutError:
+                    writer.write(b": keep-alive\n\n")
+                    await writer.drain()
+                    continue
+                if not await self._write_event(writer, event):
+                    return
+        finally:
+            job.subscribers.discard(queue)
+
+    @staticmethod
+    async def _write_event(writer, event):
+        seq, kind, payload = event
+        data = json.dumps(payload, ensure_ascii=False, default=str)
+        writer.write(f"id: {seq}\nevent: {kind}\ndata: {data}\n\n".encode('utf-8'))
+        await writer.drain()
+        return kind != 'done'
+
+
+async def serve(host='127.0.0.1', port=8000, **service_options):
+    service = SolveService(**service_options)
+    await service.start()
+    server = await asyncio.start_server(HttpServer(service).handle, host, port)
+    return service, server
+
+
+def main():
+    parser = argparse.ArgumentParser(description="OR-Tools 求解 HTTP 服务（任务队列 + SSE 流式输出）")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--model', default=DEFAULT_MODEL, help="请求未指定模型时使用的模型 ID")
+    parser.add_argument('--generation-workers', type=int, default=DEFAULT_GENERATION_WORKERS,
+                        help="同时进行的 LLM 生成数")
+    parser.add_argument('--exec-workers', type=int, help="执行进程数（默认与 ORTOOLS_EXEC_WORKERS 相同）")
+    parser.add_argument('--queue-size', type=int, default=DEFAULT_QUEUE_SIZE, help="排队任务上限，超出时返回 429")
+    parser.add_argument('--trace-log', metavar='FILE', help="将每个任务的分阶段耗时以 JSON 行写入该文件")
+    parser.add_argument('--data-dir', default=DATA_DIR,
+                        help="任务 data 字段中的路径均相对该目录解析，且不能越出该目录；未设置时不接受 data")
+    args = parser.parse_args()
+    configure_metrics(args.trace_log)
+
+    async def run():
+        pool = ExecutionPool(workers=args.exec_workers) if args.exec_workers else None
+        _, server = await serve(args.host, args.port, generation_workers=args.generation_workers,
+                                queue_size=args.queue_size, pool=pool, default_model=args.model,
+                                data_dir=args.data_dir)
+        print(f"求解服务已启动：http://{args.host}:{server.sockets[0].getsockname()[1]}")
+        async with server:
+            await server.serve_forever()
+
+    try:
+        asyncio.run(run())
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
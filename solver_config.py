@@ -0,0 +1,201 @@
+"""
+Solver performance settings applied to generated models.
+
+Generated code builds its model however the LLM wrote it; the execution
+workers wrap pywraplp.Solver.Solve and CpSolver.solve (see
+executor._install_solve_hooks) and apply the active SolverConfig right before
+the call: CP-SAT search workers, time and gap limits, MPSolver thread count
+and time limit, or a portfolio race of several MPSolver backends.
+"""
+import queue
+import threading
+import time
+from contextlib import nullcontext
+from dataclasses import dataclass
+
+PORTFOLIO_BACKENDS = ('GLOP', 'PDLP', 'SCIP', 'CP-SAT')
+LP_ONLY_BACKENDS = ('GLOP', 'PDLP')
+
+# Result ranking when no backend proves optimality; lower is better.
+_STATUS_RANK = {'OPTIMAL': 0, 'FEASIBLE': 1, 'INFEASIBLE': 2, 'UNBOUNDED': 2}
+# Seconds an interrupted racer gets to return before it counts as a straggler
+RACER_GRACE = 2.0
+
+# Racer threads still running after their portfolio returned (backends that ignore InterruptSolve)
+_stragglers = []
+
+
+def has_stragglers():
+    """True while a losing racer is still running; its process must be recycled before the next job."""
+    _stragglers[:] = [t for t in _stragglers if t.is_alive()]
+    return bool(_stragglers)
+
+
+@dataclass
+class SolverConfig:
+    """
+    num_workers: CP-SAT search workers / MPSolver threads (SCIP, CP-SAT);
+    time_limit: seconds per Solve(); relative_gap: stop once the relative
+    MIP gap is below it; portfolio: race `backends` on pywraplp models.
+    None leaves the solver (or the generated code's own setting) alone.
+    """
+    num_workers: int = None
+    time_limit: float = None
+    relative_gap: float = None
+    portfolio: bool = False
+    backends: tuple = PORTFOLIO_BACKENDS
+
+    @property
+    def is_default(self):
+        return not (self.num_workers or self.time_limit or self.relative_gap is not None or self.portfolio)
+
+
+def configure_cp(solver, config):
+    params = solver.parameters
+    if config.num_workers:
+        params.num_workers = config.num_workers
+    if config.time_limit:
+        # Keep a shorter limit the generated code may have set itself
+        params.max_time_in_seconds = min(params.max_time_in_seconds, config.time_limit)
+    if config.relative_gap is not None:
+        params.relative_gap_limit = config.relative_gap
+
+
+def configure_lp(solver, config):
+    if config.num_workers:
+        # Only multi-threaded backends (SCIP, CP-SAT) accept this; others return False
+        solver.SetNumThreads(config.num_workers)
+    if config.time_limit:
+        solver.SetTimeLimit(int(config.time_limit * 1000))
+
+
+def configure_model_builder(solver, config, backend):
+    """model_builder Solver settings; threads and the gap are SCIP parameters (GLOP has neither)."""
+    if config.time_limit:
+        solver.set_time_limit_in_seconds(config.time_limit)
+    if backend != 'scip':
+        return
+    params = []
+    if config.num_workers:
+        params.append(f'parallel/maxnthreads = {config.num_workers}')
+    if config.relative_gap is not None:
+        params.append(f'limits/gap = {config.relative_gap}')
+    if params:
+        solver.set_solver_specific_parameters('\n'.join(params))
+
+
+def lp_solve_args(args, config):
+    """Solve() arguments with the relative MIP gap added to the MPSolverParameters."""
+    if config.relative_gap is None:
+        return args
+    from ortools.linear_solver import pywraplp
+    params = args[0] if args else pywraplp.MPSolverParameters()
+    params.SetDoubleParam(pywraplp.MPSolverParameters.RELATIVE_MIP_GAP, config.relative_gap)
+    return (params,) + tuple(args[1:])
+
+
+def _status_names():
+    from ortools.linear_solver import pywraplp
+    return {getattr(pywraplp.Solver, s): s for s in
+            ('OPTIMAL', 'FEASIBLE', 'INFEASIBLE', 'UNBOUNDED', 'ABNORMAL', 'MODEL_INVALID', 'NOT_SOLVED')}
+
+
+def solve_portfolio(solver, config, args=(), solve=None, stop_event=None, report=None):
+    """
+    Races the model held by a pywraplp solver on every applicable backend in
+    config.backends. The first backend to prove optimality wins and the others
+    are interrupted; otherwise the best result once all have finished is kept.
+    The winning solution is loaded back into `solver`. Returns (status, backend).
+    `solve` is the unwrapped Solver.Solve when it is called from a Solve hook.
+    Setting stop_event interrupts every racer and keeps the best result found;
+    report receives progress points (see progress) from SCIP and from every
+    racer that finishes with a better solution.
+    """
+    from ortools.linear_solver import linear_solver_pb2, pywraplp
+    import progress
+
+    solve = solve or pywraplp.Solver.Solve
+
+    proto = linear_solver_pb2.MPModelProto()
+    solver.ExportModelToProto(proto)
+    has_integers = any(v.is_integer for v in proto.variable)
+    racers = {}
+    for name in config.backends:
+        if has_integers and name in LP_ONLY_BACKENDS:
+            continue
+        racer = pywraplp.Solver.CreateSolver(name)
+        if racer is None or racer.LoadModelFromProto(proto):
+            continue
+        configure_lp(racer, config)
+        racers[name] = racer
+    if not racers:
+        configure_lp(solver, config)
+        return solve(solver, *lp_solve_args(args, config)), None
+
+    names = _status_names()
+    finished = queue.Queue()
+    tracker = progress.ProgressTracker(report, 'pywraplp') if report is not None else None
+
+    def run(name, racer):
+        try:
+            if tracker is not None and name == 'SCIP':
+                with progress.scip_log_progress(racer, tracker):
+                    status = solve(racer, *lp_solve_args(args, config))
+            else:
+                status = solve(racer, *lp_solve_args(args, config))
+        except Exception:
+            status = pywraplp.Solver.ABNORMAL
+        finished.put((name, status))
+
+    def interrupt_all():
+        for racer in racers.values():
+            racer.InterruptSolve()
+
+    threads = {}
+    for name, racer in racers.items():
+        threads[name] = threading.Thread(target=run, args=(name, racer), name=f'portfolio-{name}', daemon=True)
+        threads[name].start()
+
+    best = None
+    sign = -1 if proto.maximize else 1
+    pending = len(racers)
+    stopped_at = None
+    with progress.watch_stop(stop_event, interrupt_all) if stop_event is not None else nullcontext():
+        while pending:
+            try:
+                name, status = finished.get(timeout=0.05)
+            except queue.Empty:
+                # After a stop, racers that ignore the interrupt are not waited for
+                if stop_event is not None and stop_event.is_set():
+                    stopped_at = stopped_at or time.monotonic()
+                    if best is not None and time.monotonic() - stopped_at > RACER_GRACE:
+                        break
+                continue
+            pending -= 1
+            status_name = names.get(status, 'ABNORMAL')
+            rank = _STATUS_RANK.get(status_name, 3)
+            has_solution = status_name in ('OPTIMAL', 'FEASIBLE')
+            objective = sign * racers[name].Objective().Value() if has_solution else 0.0
+            if best is None or (rank, objective) < best[2]:
+                best = (name, status, (rank, objective))
+                if tracker is not None and has_solution:
+                    objective = racers[name].Objective()
+                    tracker.update(objective.Value(), objective.BestBound(), racers[name].wall_time() / 1000.0,
+                                   solution=True)
+            if status_name == 'OPTIMAL':
+                break
+    for name, racer in racers.items():
+        if name != best[0]:
+            racer.InterruptSolve()
+    # Every racer must be gone before the next job; one that ignores the interrupt is left to the executor
+    deadline = time.monotonic() + RACER_GRACE
+    for thread in threads.values():
+        thread.join(max(0.0, deadline - time.monotonic()))
+        if thread.is_alive():
+            _stragglers.append(thread)
+
+    name, status = best[0], best[1]
+    response = linear_solver_pb2.MPSolutionResponse()
+    racers[name].FillSolutionResponseProto(response)
+    solver.LoadSolutionFromProto(response)
+    return status, name
@@ -0,0 +1,87 @@
+"""
+Streamlit view for streamed LLM output (reasoning and content).
+
+Redrawing the whole buffer on every chunk sends O(n^2) bytes over the
+websocket for a long thinking trace, and the browser falls behind the model.
+StreamRenderer instead coalesces chunks into frames (at most one every
+FRAME_INTERVAL seconds) and each frame carries only the last TAIL_CHARS
+characters, so the cost of a frame does not depend on how long the trace
+is. The full text is sent once, into a collapsed expander, when the stream
+closes.
+"""
+import time
+
+import streamlit as st
+
+# At most 10 frames per second
+FRAME_INTERVAL = 0.1
+TAIL_CHARS = 2000
+
+
+class StreamRenderer:
+    """
+    Feed chunks with write() (or pass the instance as an on_reasoning /
+    on_content callback); call close() when the stream ends.
+    """
+
+    def __init__(self, container=None, title=None, intro="", interval=FRAME_INTERVAL, tail_chars=TAIL_CHARS):
+        container = container if container is not None else st.container()
+        # The title appears with the first frame, so a stream that never starts leaves no trace
+        self.title = title
+        self.title_slot = container.empty()
+        self.placeholder = container.empty()
+        self.full_view = container.empty()
+        self.interval = interval
+        self.tail_chars = tail_chars
+        self._chunks = []
+        self._tail = ""
+        self._length = 0
+        self._dirty = False
+        self._last_frame = 0.0
+        if intro:
+            self.placeholder.text(intro)
+
+    def __call__(self, chunk):
+        self.write(chunk)
+
+    def write(self, chunk):
+        if not chunk:
+            return
+        self._chunks.append(chunk)
+        self._length += len(chunk)
+        self._tail += chunk
+        # Trim lazily so that appending stays amortized O(1)
+        if len(self._tail) > 2 * self.tail_chars:
+            self._tail = self._tail[-self.tail_chars:]
+        self._dirty = True
+        if time.perf_counter() - self._last_frame >= self.interval:
+            self.flush()
+
+    def flush(self):
+        """Draws the pending tail now, e.g. when another stream takes over."""
+        if not self._dirty:
+            return
+        if self.title:
+            self.title_slot.caption(self.title)
+            self.title = None
+        tail = self._tail[-self.tail_chars:]
+        if self._length > len(tail):
+            tail = f"…（已省略前 {self._length - len(tail)} 个字符）\n" + tail
+        self.placeholder.text(tail)
+        self._dirty = False
+        self._last_frame = time.perf_counter()
+
+    def text(self):
+        """Everything streamed so far."""
+        return "".join(self._chunks)
+
+    def show(self, message):
+        """Replaces the view with a fixed message (nothing is being streamed)."""
+        self.placeholder.text(message)
+
+    def close(self):
+        """Final frame, plus the full text in a collapsed expander when the tail window cut it."""
+        self.flush()
+        if self._length > self.tail_chars:
+            with self.full_view.expander(f"展开完整内容（{self._length} 字符）"):
+                st.text(self.text())
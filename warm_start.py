@@ -0,0 +1,212 @@
+"""
+Incremental re-solve for problems that only changed in their numbers.
+
+When a user edits a capacity or a cost and solves again, the model structure
+is the same as last time. numeric_changes() detects a text edit that touches
+numeric literals only; patch_code() carries those changes into the previously
+generated program without an LLM call. The previous solution is handed to the
+execution worker as a hint (CpModel.AddHint / pywraplp Solver.SetHint), so the
+re-solve starts from it.
+"""
+import io
+import math
+import re
+import tokenize
+from dataclasses import dataclass, field
+
+# Numbers in problem text; digits glued to identifiers (x1, y_2) are names, not data
+_TEXT_NUMBER = re.compile(r"(?<![A-Za-z_\d.])\d+(?:\.\d+)?")
+# Bracketed lists of numbers, and the identifier a number or list follows (`capacity = 10`, `weights: [...]`)
+_TEXT_LIST = re.compile(r"[\[(（【][^\[\]()（）【】]*[\])）】]")
+_TEXT_LABEL = re.compile(r"([A-Za-z_][A-Za-z_\d]*)\s*[=:：]?\s*$")
+
+
+@dataclass
+class WarmStart:
+    """What a later re-solve needs from a finished solve."""
+    problem: str
+    code: str
+    names: list = field(default_factory=list)
+    values: list = field(default_factory=list)
+    datasets: tuple = ()
+
+    @property
+    def hint(self):
+        return (self.names, self.values) if self.names else None
+
+
+def _split_numbers(text):
+    return _TEXT_NUMBER.split(text), _TEXT_NUMBER.findall(text)
+
+
+def numeric_changes(old_text, new_text):
+    """
+    [(index, old, new)] for every number that differs when old_text and
+    new_text are identical apart from numeric literals; None otherwise.
+    index is the number's position among all numbers in the text.
+    """
+    old_rest, old_numbers = _split_numbers(old_text)
+    new_rest, new_numbers = _split_numbers(new_text)
+    if old_rest != new_rest:
+        return None
+    return [(i, a, b) for i, (a, b) in enumerate(zip(old_numbers, new_numbers)) if float(a) != float(b)]
+
+
+def _name_key(name):
+    """Identifiers compared case-insensitively and singular: `Weights` matches `weight`."""
+    name = name.lower()
+    return name[:-1] if name.endswith('s') and len(name) > 1 else name
+
+
+def _label(text):
+    match = _TEXT_LABEL.search(text)
+    return _name_key(match.group(1)) if match else None
+
+
+@dataclass
+class _Context:
+    """Where a number sits: the name it is assigned to, and its enclosing list and position."""
+    value: float
+    name: str = None
+    items: tuple = None
+    position: int = None
+    token: object = None
+
+    def matches(self, other):
+        if self.items is not None and self.items == other.items and self.position == other.position:
+            return True
+        same_shape = (self.items is None) == (other.items is None) and self.position == other.position
+        return self.name is not None and self.name == other.name and same_shape
+
+
+def _text_contexts(text):
+    groups = [m.span() for m in _TEXT_LIST.finditer(text)]
+    numbers = list(_TEXT_NUMBER.finditer(text))
+    contexts = []
+    for number in numbers:
+        span = next(((s, e) for s, e in groups if s < number.start() < e), None)
+        if span is None:
+            contexts.append(_Context(float(number.group()), _label(text[:number.start()])))
+            continue
+        members = [n for n in numbers if span[0] < n.start() < span[1]]
+        contexts.append(_Context(float(number.group()), _label(text[:span[0]]),
+                                 tuple(float(n.group()) for n in members), members.index(number)))
+    return contexts
+
+
+def _number_tokens(code):
+    """A _Context per numeric literal; name is the target of the statement's top-level assignment."""
+    contexts = []
+    target, previous = None, None
+    # Literals directly inside each open bracket
+    stack = []
+    for tok in tokenize.generate_tokens(io.StringIO(code).readline):
+        if tok.type == tokenize.NEWLINE:
+            target, previous = None, None
+            continue
+        if tok.type == tokenize.OP:
+            if tok.string == '=' and not stack and previous is not None and previous.type == tokenize.NAME:
+                target = previous.string
+            elif tok.string in '([{':
+                stack.append([])
+            elif tok.string in ')]}' and stack:
+                members = stack.pop()
+                items = tuple(c.value for c in members)
+                for c in members:
+                    c.items = items
+        elif tok.type == tokenize.NUMBER and not tok.string.lower().endswith('j'):
+            try:
+                value = float(tok.string.replace('_', ''))
+            except ValueError:
+                value = None
+            if value is not None:
+                context = _Context(value, _name_key(target) if target else None, token=tok)
+                if stack:
+                    context.position = len(stack[-1])
+                    stack[-1].append(context)
+                contexts.append(context)
+        if tok.type not in (tokenize.NL, tokenize.COMMENT):
+            previous = tok
+    return contexts
+
+
+def _literal(new, old_literal):
+    if '.' in old_literal and '.' not in new:
+        return new + '.0'
+    return new
+
+
+def patch_code(code, old_text, new_text):
+    """
+    The program with the problem's changed numbers substituted, or None when
+    the edit is not numbers-only or a changed number cannot be located
+    unambiguously. A changed value is mapped to a literal when it is unique
+    in both the text and the code, or when exactly one literal of that value
+    shares its context: the same enclosing list (old values, position) or
+    the same name (`weights = [...]` in the text and in the code).
+    """
+    changes = numeric_changes(old_text, new_text)
+    if not changes:
+        return None
+    text_contexts = _text_contexts(old_text)
+    try:
+        code_contexts = _number_tokens(code)
+    except (tokenize.TokenError, IndentationError, SyntaxError):
+        return None
+
+    lines = code.splitlines(keepends=True)
+    starts = [0]
+    for line in lines:
+        starts.append(starts[-1] + len(line))
+    edits = {}
+    for index, old, new in changes:
+        value = float(old)
+        in_text = [c for c in text_contexts if c.value == value]
+        in_code = [c for c in code_contexts if c.value == value]
+        if len(in_text) != 1 or len(in_code) != 1:
+            context = text_contexts[index]
+            in_code = [c for c in in_code if context.matches(c)]
+            if len(in_code) != 1:
+                return None
+        tok = in_code[0].token
+        if tok.start in edits:
+            return None
+        (row, col), (end_row, end_col) = tok.start, tok.end
+        edits[tok.start] = (starts[row - 1] + col, starts[end_row - 1] + end_col, _literal(new, tok.string))
+    for start, end, literal in sorted(edits.values(), reverse=True):
+        code = code[:start] + literal + code[end:]
+    return code
+
+
+def prepare_resolve(previous, problem, datasets=()):
+    """Patched code for re-solving `problem` from a WarmStart, or None to regenerate."""
+    if previous is None or previous.problem == problem or tuple(datasets) != tuple(previous.datasets):
+        return None
+    return patch_code(previous.code, previous.problem, problem)
+
+
+def _hint_lookup(hint):
+    names, values = hint
+    return {n: v for n, v in zip(names, values) if v is not None and math.isfinite(v)}
+
+
+def apply_cp_hint(model, hint):
+    """Hints every CP-SAT variable whose name has a previous value, clamped to its domain."""
+    lookup = _hint_lookup(hint)
+    model.ClearHints()
+    for i, var in enumerate(model.Proto().variables):
+        value = lookup.get(var.name)
+        domain = list(var.domain)
+        if value is None or not domain:
+            continue
+        value = min(max(int(round(value)), domain[0]), domain[-1])
+        model.AddHint(model.GetIntVarFromProtoIndex(i), value)
+
+
+def apply_lp_hint(solver, hint):
+    """Passes previous values to a pywraplp solver (used by SCIP and CP-SAT backends)."""
+    lookup = _hint_lookup(hint)
+    pairs = [(v, lookup[v.name()]) for v in solver.variables() if v.name() in lookup]
+    if pairs:
+        variables, values = zip(*pairs)
+        solver.SetHint(list(variables), list(values))